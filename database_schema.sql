@@ -29,3 +29,33 @@ CREATE TABLE junior_leads (
     plan text
 );
 -- Row count: 5
+
+-- ============================================================
+-- MIGRATION: lead claiming with leases (multi-node workers)
+-- ============================================================
+-- Workers claim a lead with one conditional update
+--   UPDATE junior_leads SET status = 'PROCESSING', claimed_by = ..., lease_expires_at = ...
+--   WHERE id = ... AND status = 'FLAGGED'
+-- renew lease_expires_at while they work on it, and requeue leads
+-- whose lease expired (see pipeline/db.py).
+ALTER TABLE junior_leads ADD COLUMN IF NOT EXISTS processing_started_at timestamptz;
+ALTER TABLE junior_leads ADD COLUMN IF NOT EXISTS processing_completed_at timestamptz;
+ALTER TABLE junior_leads ADD COLUMN IF NOT EXISTS last_error text;
+ALTER TABLE junior_leads ADD COLUMN IF NOT EXISTS claimed_by text;
+ALTER TABLE junior_leads ADD COLUMN IF NOT EXISTS lease_expires_at timestamptz;
+
+CREATE INDEX IF NOT EXISTS junior_leads_status_idx ON junior_leads (status);
+CREATE INDEX IF NOT EXISTS junior_leads_lease_idx ON junior_leads (lease_expires_at)
+    WHERE lease_expires_at IS NOT NULL;
+
+-- ============================================================
+-- MIGRATION: lead queue priority and fair-share ordering
+-- ============================================================
+-- Workers take FLAGGED leads by priority (higher first, plus aging for
+-- time spent waiting), then created_at; flagged_at marks when a lead
+-- entered the queue (see pipeline/lead_queue.py).
+ALTER TABLE junior_leads ADD COLUMN IF NOT EXISTS priority integer NOT NULL DEFAULT 0;
+ALTER TABLE junior_leads ADD COLUMN IF NOT EXISTS flagged_at timestamptz;
+
+CREATE INDEX IF NOT EXISTS junior_leads_queue_idx ON junior_leads (priority DESC, created_at)
+    WHERE status = 'FLAGGED';
@@ -14,6 +14,13 @@ from .db import (
     update_lead_field,
     get_leads_by_status,
     unblock_lead,
+    enqueue_lead,
+    claim_lead,
+    claim_lead_for_run,
+    renew_lease,
+    requeue_expired_leases,
+    LeaseHeartbeat,
+    LeaseLost,
     STATUS_FLAGGED,
     STATUS_PROCESSING,
     STATUS_PLAN_READY,
@@ -23,16 +30,38 @@ from .db import (
     STATUS_BLOCKED,
 )
 from .llm import (
+    get_openai_client,
+    warm_openai_client,
     call_llm,
     call_llm_with_file,
+    call_llm_stream,
+    stream_llm,
     process_prompt_batch,
+    set_cache_enabled,
     estimate_tokens,
+    count_message_tokens,
     estimate_cost,
 )
+from .lead_queue import (
+    LeadQueue,
+    order_leads,
+    queue_wait_seconds,
+    EXPRESS_PRIORITY,
+)
+from .batch import (
+    process_leads_batch,
+    run_batch,
+    LocalBatchBackend,
+)
 from .logger import (
     PipelineLogger,
     setup_run_directory,
 )
+from .context import (
+    RunContext,
+    get_run_context,
+    close_run_context,
+)
 from .steps import (
     run_input_transform,
     run_plan_prompt,
@@ -40,6 +69,9 @@ from .steps import (
     run_stage2,
     prep_html,
     run_stage3,
+    prep_fused,
+    run_fused_html,
+    run_blocks_dag,
     html_to_json_step,
     clean_json,
     upload_pages,
@@ -55,6 +87,13 @@ __all__ = [
     "update_lead_field",
     "get_leads_by_status",
     "unblock_lead",
+    "enqueue_lead",
+    "claim_lead",
+    "claim_lead_for_run",
+    "renew_lease",
+    "requeue_expired_leases",
+    "LeaseHeartbeat",
+    "LeaseLost",
     # Status constants
     "STATUS_FLAGGED",
     "STATUS_PROCESSING",
@@ -64,14 +103,33 @@ __all__ = [
     "STATUS_ARCHIVED",
     "STATUS_BLOCKED",
     # LLM
+    "get_openai_client",
+    "warm_openai_client",
     "call_llm",
     "call_llm_with_file",
+    "call_llm_stream",
+    "stream_llm",
     "process_prompt_batch",
+    "set_cache_enabled",
     "estimate_tokens",
+    "count_message_tokens",
     "estimate_cost",
+    # Lead queue
+    "LeadQueue",
+    "order_leads",
+    "queue_wait_seconds",
+    "EXPRESS_PRIORITY",
+    # Batch mode
+    "process_leads_batch",
+    "run_batch",
+    "LocalBatchBackend",
     # Logging
     "PipelineLogger",
     "setup_run_directory",
+    # Run context
+    "RunContext",
+    "get_run_context",
+    "close_run_context",
     # Pipeline steps
     "run_input_transform",
     "run_plan_prompt",
@@ -79,6 +137,9 @@ __all__ = [
     "run_stage2",
     "prep_html",
     "run_stage3",
+    "prep_fused",
+    "run_fused_html",
+    "run_blocks_dag",
     "html_to_json_step",
     "clean_json",
     "upload_pages",
@@ -0,0 +1,637 @@
+"""
+Batch execution mode for the pipeline.
+Runs every LLM stage for many leads as one OpenAI Batch API job per stage.
+
+Each stage gathers the pending prompts of all leads into a JSONL file,
+submits it, polls until the job finishes and writes the results back into
+each lead's run directory, so the local processors run unchanged.
+
+As in the per-lead runner, steps with a fast model (OPENAI_FAST_STEPS) are
+batched with it, outputs are checked with the step's validator and the
+rejected ones are regenerated right away with OPENAI_MODEL, and completed
+steps are recorded in each run's manifest for --resume and
+--refresh-stale.
+"""
+
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Callable
+import dotenv
+
+from .db import mark_status, mark_failure, claim_lead, LeaseHeartbeat, LeaseLost, WORKER_ID
+from .lead_queue import queue_wait_seconds
+from .db import STATUS_HTML_READY, STATUS_UPLOADED
+from .llm import (
+    build_chat_params,
+    call_llm,
+    generate_file,
+    route_models,
+    estimate_cost,
+    get_openai_client,
+    cache_key,
+    cache_get,
+    cache_put,
+)
+from . import llm
+from .logger import PipelineLogger, setup_run_directory
+from .fake_server import fake_completion, fake_usage
+from .context import get_run_context, close_run_context
+from .manifest import RunManifest
+from .budget import suggest_max_tokens
+from .profile import INPUT_TRANSFORM_SCHEMA
+from .validation import validate_profile, validate_plan_blocks, validate_block_text, validate_block_html
+from .steps import (
+    INPUT_TRANSFORM_SYSTEM_PROMPT,
+    PLAN_SYSTEM_PROMPT,
+    STAGE2_SYSTEM_PROMPT,
+    STAGE3_SYSTEM_PROMPT,
+    FUSED_SYSTEM_PROMPT,
+    step_io,
+    build_input_transform_prompt,
+    save_input_transform,
+    build_plan_prompt,
+    save_plan,
+    generate_blocks,
+    prep_html,
+    prep_fused,
+    html_to_json_step,
+    clean_json,
+    upload_pages,
+)
+
+dotenv.load_dotenv()
+
+# Batch settings
+BATCH_BACKEND = os.getenv("OPENAI_BATCH_BACKEND", "openai")  # openai | local
+BATCH_POLL_INTERVAL = float(os.getenv("OPENAI_BATCH_POLL_INTERVAL", "30"))
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_WORK_DIR = "runs/_batches"
+
+# Batch API requests are billed at half the synchronous price
+BATCH_PRICE_FACTOR = 0.5
+
+# Terminal batch statuses (see OpenAI Batch API)
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# custom_id separator: "<lead_id>|<step>|<name>"
+CUSTOM_ID_SEP = "|"
+
+
+class OpenAIBatchBackend:
+    """Submits JSONL jobs to the OpenAI Batch API."""
+
+    def submit(self, input_path: Path) -> str:
+        """Upload the JSONL input file and create a batch. Returns the batch id."""
+        client = get_openai_client()
+        with open(input_path, "rb") as f:
+            input_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        """Return the batch status and output/error file ids."""
+        batch = get_openai_client().batches.retrieve(batch_id)
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+        }
+
+    def download(self, file_id: str) -> str:
+        """Return the text content of a batch output or error file."""
+        return get_openai_client().files.content(file_id).text
+
+
+class LocalBatchBackend:
+    """
+    Offline stand-in implementing the same file/poll contract.
+
+    Jobs are stored under ``work_dir`` and complete after ``polls_to_complete``
+    status checks. Each request body is answered by ``responder`` (body -> text),
+    which defaults to the fake server's fake_completion, so batch and
+    per-lead offline runs produce the same outputs.
+    """
+
+    def __init__(self, work_dir: str = ".cache/local_batches",
+                 responder: Optional[Callable[[Dict], str]] = None,
+                 polls_to_complete: int = 1):
+        self.work_dir = Path(work_dir)
+        self.responder = responder or fake_completion
+        self.polls_to_complete = polls_to_complete
+
+    def _job_dir(self, batch_id: str) -> Path:
+        return self.work_dir / batch_id
+
+    def submit(self, input_path: Path) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        job_dir = self._job_dir(batch_id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+
+        with open(input_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        with open(job_dir / "input.jsonl", "w", encoding="utf-8") as f:
+            f.write(content)
+
+        self._save_state(batch_id, {"status": "validating", "polls": 0})
+        return batch_id
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        state = self._load_state(batch_id)
+        state["polls"] += 1
+
+        if state["status"] != "completed":
+            if state["polls"] >= self.polls_to_complete:
+                self._process(batch_id)
+                state["status"] = "completed"
+            else:
+                state["status"] = "in_progress"
+
+        self._save_state(batch_id, state)
+        completed = state["status"] == "completed"
+        return {
+            "status": state["status"],
+            "output_file_id": f"{batch_id}/output.jsonl" if completed else None,
+            "error_file_id": f"{batch_id}/errors.jsonl" if completed else None,
+        }
+
+    def download(self, file_id: str) -> str:
+        with open(self.work_dir / file_id, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def _process(self, batch_id: str) -> None:
+        """Answer every request line, writing output and error files."""
+        job_dir = self._job_dir(batch_id)
+        outputs, errors = [], []
+
+        with open(job_dir / "input.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                try:
+                    content = self.responder(request["body"])
+                    outputs.append({
+                        "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {
+                                "object": "chat.completion",
+                                "model": request["body"].get("model"),
+                                "choices": [{
+                                    "index": 0,
+                                    "message": {"role": "assistant", "content": content},
+                                    "finish_reason": "stop",
+                                }],
+                                "usage": fake_usage(request["body"], content),
+                            },
+                        },
+                        "error": None,
+                    })
+                except Exception as e:
+                    errors.append({
+                        "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                        "custom_id": request["custom_id"],
+                        "response": None,
+                        "error": {"code": "local_error", "message": str(e)},
+                    })
+
+        with open(job_dir / "output.jsonl", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(o, ensure_ascii=False) + "\n" for o in outputs)
+        with open(job_dir / "errors.jsonl", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in errors)
+
+    def _load_state(self, batch_id: str) -> Dict[str, Any]:
+        with open(self._job_dir(batch_id) / "state.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self, batch_id: str, state: Dict[str, Any]) -> None:
+        with open(self._job_dir(batch_id) / "state.json", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+
+def get_batch_backend():
+    """Backend selected by OPENAI_BATCH_BACKEND (openai or local)."""
+    if BATCH_BACKEND == "local":
+        return LocalBatchBackend()
+    return OpenAIBatchBackend()
+
+
+def make_custom_id(lead_id: str, step: str, name: str = "") -> str:
+    """Build a batch custom_id that maps a result back to its lead and artifact."""
+    return CUSTOM_ID_SEP.join([lead_id, step, name])
+
+
+def run_batch(
+    requests: List[Dict[str, Any]],
+    label: str,
+    backend=None,
+    poll_interval: Optional[float] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Run chat requests as one batch job and wait for the results.
+
+    Requests whose response is already in the LLM response cache are answered
+    locally and never submitted; fresh responses are added to the cache.
+
+    Args:
+        requests: List of {"custom_id": str, "params": chat params}
+        label: Name used for the batch work directory
+        backend: Batch backend (default: from OPENAI_BATCH_BACKEND)
+        poll_interval: Seconds between status checks
+
+    Returns:
+        Dict mapping custom_id to {"content": str, "usage": dict} or {"error": str}
+    """
+    backend = backend or get_batch_backend()
+    poll_interval = BATCH_POLL_INTERVAL if poll_interval is None else poll_interval
+
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = []
+    for request in requests:
+        key = cache_key(request["params"])
+        cached = cache_get(key) if llm.LLM_CACHE_ENABLED else None
+        if cached is not None:
+            results[request["custom_id"]] = {"content": cached, "cached": True}
+        else:
+            pending.append({**request, "cache_key": key})
+
+    print(f"   📦 Batch {label}: {len(pending)} request(s), {len(results)} from cache")
+
+    if not pending:
+        return results
+
+    # Write JSONL input
+    work_dir = Path(BATCH_WORK_DIR) / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{label}"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    input_path = work_dir / "input.jsonl"
+    with open(input_path, "w", encoding="utf-8") as f:
+        for request in pending:
+            line = {
+                "custom_id": request["custom_id"],
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": request["params"],
+            }
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    batch_id = backend.submit(input_path)
+    print(f"   📤 Submitted batch {batch_id}")
+
+    # Poll until the job reaches a terminal status
+    while True:
+        status = backend.status(batch_id)
+        if status["status"] in TERMINAL_STATUSES:
+            break
+        print(f"   ⏳ Batch {batch_id}: {status['status']}")
+        time.sleep(poll_interval)
+
+    print(f"   📥 Batch {batch_id} finished: {status['status']}")
+
+    # Parse output and error files
+    lines = []
+    for file_id in (status.get("output_file_id"), status.get("error_file_id")):
+        if file_id:
+            content = backend.download(file_id)
+            lines.extend(json.loads(l) for l in content.splitlines() if l.strip())
+
+    with open(work_dir / "results.jsonl", "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(l, ensure_ascii=False) + "\n" for l in lines)
+
+    keys = {request["custom_id"]: request for request in pending}
+    for line in lines:
+        custom_id = line["custom_id"]
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or response.get("body", {}).get("error")
+            results[custom_id] = {"error": str(error)}
+            continue
+        content = response["body"]["choices"][0]["message"]["content"]
+        results[custom_id] = {
+            "content": content,
+            "usage": _batch_usage(response["body"], keys[custom_id]["params"]["model"]),
+        }
+        if llm.LLM_CACHE_ENABLED:
+            cache_put(keys[custom_id]["cache_key"], keys[custom_id]["params"], content)
+
+    # Requests without any result line (e.g. expired batch)
+    for custom_id in keys:
+        if custom_id not in results:
+            results[custom_id] = {"error": f"No result (batch {status['status']})"}
+
+    return results
+
+
+def _batch_usage(body: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """Usage dict (see llm.extract_usage) from a batch result body."""
+    usage = body.get("usage")
+    if not usage:
+        return {}
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    cost = estimate_cost(
+        usage["prompt_tokens"], usage["completion_tokens"], model, cached_tokens
+    )
+    return {
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "cached_tokens": cached_tokens,
+        "total_tokens": usage["total_tokens"],
+        "cost_usd": cost * BATCH_PRICE_FACTOR,
+    }
+
+
+def process_leads_batch(leads: List[Dict], backend=None, fused: bool = False) -> Dict[str, Any]:
+    """
+    Process leads through the pipeline with one batch job per LLM stage.
+
+    Leads are claimed up front (see pipeline.db.claim_lead) and their
+    leases renewed while the batch jobs run; leads another worker claimed
+    first are skipped. A lead whose lease is lost is dropped before the
+    next stage and counted as skipped, and its status is left to the
+    worker that holds it now.
+
+    Args:
+        leads: Lead dictionaries to process
+        backend: Batch backend (default: from OPENAI_BATCH_BACKEND)
+        fused: Generate block HTML in one stage instead of stage 2 + stage 3
+
+    Returns:
+        Summary dict with counts of processed, succeeded, failed, skipped
+    """
+    backend = backend or get_batch_backend()
+    active: Dict[str, Dict[str, Any]] = {}
+    failed: List[str] = []
+    skipped: List[str] = []
+
+    for lead in leads:
+        if claim_lead(lead["id"]) is None:
+            print(f"   🔒 Claimed by another worker: {lead['id']}")
+            skipped.append(lead["id"])
+            continue
+        # Status updates made by the steps are conditional on this claim
+        lead = {**lead, "claimed_by": WORKER_ID}
+        run_dir = setup_run_directory(lead["id"])
+        logger = PipelineLogger(run_dir, lead["id"])
+        logger.log_info(f"Starting batch pipeline for client {lead['id']}")
+        logger.log_info(f"Run directory: {run_dir}")
+        wait = queue_wait_seconds(lead)
+        if wait is not None:
+            logger.log_queue_wait(wait, lead.get("priority") or 0)
+        active[lead["id"]] = {"lead": lead, "run_dir": run_dir, "logger": logger}
+
+    lease = LeaseHeartbeat(active)
+
+    def fail(lead_id: str, exc: Exception) -> None:
+        run = active.pop(lead_id)
+        run["logger"].log_step_error("pipeline", exc)
+        lease.release(lead_id)
+        try:
+            close_run_context(run["run_dir"])
+        except OSError:
+            # Already failing; keep the original error
+            pass
+        if not isinstance(exc, LeaseLost):
+            try:
+                mark_failure(lead_id, exc, block=True, worker_id=WORKER_ID)
+            except LeaseLost as lost_exc:
+                exc = lost_exc
+        if isinstance(exc, LeaseLost):
+            # The lead is another worker's now; leave its status alone
+            print(f"   ⚠️ Stopped processing {lead_id}: {exc}")
+            run["logger"].finalize("lease_lost")
+            skipped.append(lead_id)
+        else:
+            run["logger"].finalize("failed")
+            failed.append(lead_id)
+
+    def drop_lost_leases() -> None:
+        # Stop leads whose lease the heartbeat lost before they start the next stage
+        for lead_id in list(active):
+            try:
+                lease.check(lead_id)
+            except LeaseLost as exc:
+                fail(lead_id, exc)
+
+    def record_step(run: Dict[str, Any], step: str, duration_ms: int) -> None:
+        # Same manifest entries as pipeline.manifest.StepRunner writes
+        context = get_run_context(run["run_dir"])
+        if context.persist:
+            context.flush()
+            inputs, outputs, values = step_io(step, run["lead"], run["run_dir"])
+            RunManifest(run["run_dir"]).record(step, inputs, outputs, values, duration_ms=duration_ms)
+
+    def run_single_prompt_stage(step: str, build: Callable, save: Callable,
+                                validator: Callable, **param_kwargs) -> None:
+        drop_lost_leases()
+        model = route_models(step)[0]
+        requests = []
+        prompts: Dict[str, str] = {}
+        for lead_id, run in list(active.items()):
+            run["logger"].log_step_start(step)
+            try:
+                prompts[lead_id] = build(run["lead"], run["run_dir"])
+            except Exception as exc:
+                fail(lead_id, exc)
+                continue
+            requests.append({
+                "custom_id": make_custom_id(lead_id, step),
+                "params": build_chat_params(
+                    prompts[lead_id], model=model,
+                    max_tokens=suggest_max_tokens(step, step, llm.OPENAI_MAX_TOKENS),
+                    **param_kwargs,
+                ),
+            })
+
+        start_time = time.time()
+        results = run_batch(requests, step, backend)
+        duration_ms = int((time.time() - start_time) * 1000)
+
+        for lead_id, run in list(active.items()):
+            result = results.get(make_custom_id(lead_id, step), {"error": "missing result"})
+            try:
+                if "error" in result:
+                    # Generate it synchronously instead, routed as call_llm does
+                    run["logger"].log_info(f"🔁 Regenerating {step} (batch request failed: {result['error']})")
+                    content = call_llm(prompts[lead_id], logger=run["logger"], step=step,
+                                       prompt_name=step, validator=validator, **param_kwargs)
+                    rejected = None
+                else:
+                    if result.get("usage"):
+                        run["logger"].log_llm_usage(step, step, model, result["usage"])
+                    content = result["content"]
+                    rejected = validator(content)
+                    if model != llm.OPENAI_MODEL:
+                        run["logger"].log_llm_route(step, step, model, rejected,
+                                                    escalated=rejected is not None)
+                if rejected:
+                    # Escalate to OPENAI_MODEL right away, as call_llm's routing does
+                    run["logger"].log_info(f"🔁 Regenerating {step} ({rejected})")
+                    content = call_llm(prompts[lead_id], model=llm.OPENAI_MODEL, logger=run["logger"],
+                                       step=step, prompt_name=step, refresh_cache=True,
+                                       **param_kwargs)
+                save(run["lead"], run["run_dir"], run["logger"], content)
+                run["logger"].log_step_complete(step, duration_ms)
+                record_step(run, step, duration_ms)
+            except Exception as exc:
+                fail(lead_id, exc)
+
+    def run_file_stage(step: str, input_subdir: str, output_subdir: str,
+                       pattern: str, system_prompt: str, validator: Callable) -> None:
+        drop_lost_leases()
+        model = route_models(step)[0]
+        requests = []
+        for lead_id, run in active.items():
+            run["logger"].log_step_start(step)
+            context = get_run_context(run["run_dir"])
+            output_dir = run["run_dir"] / output_subdir
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+            for name in context.names(input_subdir, pattern):
+                # Skip if output exists
+                if (output_dir / name).exists():
+                    continue
+                requests.append({
+                    "custom_id": make_custom_id(lead_id, step, name),
+                    "params": build_chat_params(
+                        context.get_text(f"{input_subdir}/{name}"), system_prompt=system_prompt,
+                        model=model, max_tokens=suggest_max_tokens(step, name, llm.OPENAI_MAX_TOKENS),
+                    ),
+                })
+
+        start_time = time.time()
+        results = run_batch(requests, step, backend)
+        duration_ms = int((time.time() - start_time) * 1000)
+
+        # Errored requests (expired, 5xx, unreadable result lines) by lead
+        errors: Dict[str, Dict[str, str]] = {}
+        for request in requests:
+            custom_id = request["custom_id"]
+            result = results.get(custom_id, {"error": "missing result"})
+            lead_id, _, name = custom_id.split(CUSTOM_ID_SEP)
+            if "error" in result:
+                errors.setdefault(lead_id, {})[name] = str(result["error"])
+                continue
+            output_file = active[lead_id]["run_dir"] / output_subdir / name
+            with open(output_file, "w", encoding="utf-8") as f:
+                f.write(result["content"])
+            get_run_context(active[lead_id]["run_dir"]).put_text(output_file, result["content"],
+                                                                 persist=False)
+            if result.get("usage"):
+                active[lead_id]["logger"].log_llm_usage(step, name, model, result["usage"])
+
+        for lead_id, run in list(active.items()):
+            try:
+                regenerate_rejected(run, step, input_subdir, output_subdir, pattern,
+                                    system_prompt, validator, model, errors.get(lead_id, {}))
+            except Exception as exc:
+                fail(lead_id, exc)
+                continue
+            run["logger"].log_step_complete(step, duration_ms)
+            record_step(run, step, duration_ms)
+
+    def regenerate_rejected(run: Dict[str, Any], step: str, input_subdir: str, output_subdir: str,
+                            pattern: str, system_prompt: str, validator: Callable, model: str,
+                            errored: Dict[str, str]) -> None:
+        # Validate the batch outputs and regenerate the rejected ones with
+        # OPENAI_MODEL (see llm.generate_file), outside the batch. Files
+        # whose batch request errored are generated the same way, routed
+        # like a synchronous call, so one failed request doesn't fail the lead
+        context = get_run_context(run["run_dir"])
+        for name in context.names(input_subdir, pattern):
+            if name in errored:
+                run["logger"].log_info(f"🔁 Regenerating {name} (batch request failed: {errored[name]})")
+                regenerate_model = None
+            else:
+                rejected = validator(context.get_text(f"{output_subdir}/{name}"))
+                if model != llm.OPENAI_MODEL:
+                    run["logger"].log_llm_route(step, name, model, rejected,
+                                                escalated=rejected is not None)
+                if rejected is None:
+                    continue
+                regenerate_model = llm.OPENAI_MODEL
+            result = generate_file(
+                run["run_dir"] / input_subdir / name, run["run_dir"] / output_subdir / name,
+                system_prompt=system_prompt, validator=validator, model=regenerate_model,
+                prompt=context.get_text(f"{input_subdir}/{name}"),
+                logger=run["logger"], step=step,
+            )
+            if result["status"] == "failed":
+                raise RuntimeError(f"{step} failed for {name}: {result['error']}")
+            context.put_text(f"{output_subdir}/{name}", result["response"], persist=False)
+
+    def run_local_step(step: str, step_fn: Callable) -> None:
+        drop_lost_leases()
+        for lead_id, run in list(active.items()):
+            start_time = time.time()
+            try:
+                step_fn(run["lead"], run["run_dir"], run["logger"])
+                record_step(run, step, int((time.time() - start_time) * 1000))
+            except Exception as exc:
+                fail(lead_id, exc)
+
+    with lease:
+        run_single_prompt_stage(
+            "input_transform", build_input_transform_prompt, save_input_transform, validate_profile,
+            system_prompt=INPUT_TRANSFORM_SYSTEM_PROMPT, json_schema=INPUT_TRANSFORM_SCHEMA,
+        )
+        run_single_prompt_stage(
+            "plan_prompt", build_plan_prompt, save_plan, validate_plan_blocks,
+            system_prompt=PLAN_SYSTEM_PROMPT,
+        )
+        run_local_step("generate_blocks", generate_blocks)
+        if fused:
+            run_local_step("prep_fused", prep_fused)
+            run_file_stage(
+                "fused_html", "stage_2_prepared_html", "stage_3_generated_html",
+                "prompt_block_*.txt", FUSED_SYSTEM_PROMPT, validate_block_html,
+            )
+        else:
+            run_file_stage(
+                "stage2_expand", "parsed_parts", "stage_2_generated_parts",
+                "prompt_block_*.txt", STAGE2_SYSTEM_PROMPT, validate_block_text,
+            )
+            run_local_step("prep_html", prep_html)
+            run_file_stage(
+                "stage3_html", "stage_2_prepared_html", "stage_3_generated_html",
+                "*.txt", STAGE3_SYSTEM_PROMPT, validate_block_html,
+            )
+        for lead_id in list(active):
+            try:
+                mark_status(lead_id, STATUS_HTML_READY, worker_id=WORKER_ID)
+            except Exception as exc:
+                fail(lead_id, exc)
+        run_local_step("html_to_json", html_to_json_step)
+        run_local_step("clean_json", clean_json)
+        run_local_step("upload_pages", upload_pages)
+
+        drop_lost_leases()
+        for lead_id, run in list(active.items()):
+            close_run_context(run["run_dir"])
+            try:
+                mark_status(lead_id, STATUS_UPLOADED, worker_id=WORKER_ID)
+            except Exception as exc:
+                fail(lead_id, exc)
+                continue
+            lease.release(lead_id)
+            run["logger"].finalize("completed")
+
+    return {
+        "total": len(leads),
+        "succeeded": len(active),
+        "failed": len(failed),
+        "skipped": len(skipped),
+        "clients": (
+            [{"id": lead_id, "status": "succeeded"} for lead_id in active]
+            + [{"id": lead_id, "status": "failed"} for lead_id in failed]
+            + [{"id": lead_id, "status": "skipped"} for lead_id in skipped]
+        ),
+    }
@@ -0,0 +1,138 @@
+"""
+Adaptive max_tokens budgeting.
+
+Learns typical completion lengths per step and block index from the
+llm_usage events in the newest runs' logs (runs/*/*/logs/pipeline.jsonl)
+and sizes max_tokens per request with headroom. Calls made by this process
+are added as they complete.
+"""
+
+import json
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import dotenv
+
+from processors.block_parser import block_index
+
+dotenv.load_dotenv()
+
+# Budget settings
+RUNS_DIR = "runs"
+BUDGET_PERCENTILE = float(os.getenv("OPENAI_BUDGET_PERCENTILE", "0.95"))
+BUDGET_HEADROOM = float(os.getenv("OPENAI_BUDGET_HEADROOM", "1.3"))
+BUDGET_MIN_SAMPLES = int(os.getenv("OPENAI_BUDGET_MIN_SAMPLES", "5"))
+# Newest past runs read on first use (0 = all), bounding the startup scan
+BUDGET_HISTORY_RUNS = int(os.getenv("OPENAI_BUDGET_HISTORY_RUNS", "50"))
+BUDGET_MIN_TOKENS = 256
+
+# Upper bound for max_tokens, also the limit for retries after truncation
+OPENAI_MAX_TOKENS_CEILING = int(os.getenv("OPENAI_MAX_TOKENS_CEILING", "16384"))
+
+# Cold-start budgets per step, used until enough history exists
+DEFAULT_MAX_TOKENS = {
+    "plan_prompt": 8000,
+}
+
+# Samples kept per key
+MAX_SAMPLES = 500
+
+BudgetKey = Tuple[str, Optional[int]]
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+class TokenBudget:
+    """
+    Completion length history per (step, block index), with a per-step
+    aggregate used when a block has too little history of its own.
+    """
+
+    def __init__(self, runs_dir: str = RUNS_DIR, history_runs: int = BUDGET_HISTORY_RUNS):
+        self._samples: Dict[BudgetKey, List[int]] = {}
+        self._lock = threading.Lock()
+        self._load(Path(runs_dir), history_runs)
+
+    def _load(self, runs_dir: Path, history_runs: int) -> None:
+        """Read completion token counts from the newest ``history_runs`` run logs."""
+        # Run directories are named by timestamp (YYYYMMDD_HHMM); read the
+        # newest ones, oldest first so MAX_SAMPLES keeps the latest samples
+        log_files = sorted(runs_dir.glob("*/*/logs/pipeline.jsonl"),
+                           key=lambda path: path.parent.parent.name)
+        if history_runs > 0:
+            log_files = log_files[-history_runs:]
+        for log_file in log_files:
+            try:
+                with open(log_file, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if '"llm_usage"' not in line:
+                            continue
+                        entry = json.loads(line)
+                        # Truncated outputs only give a lower bound
+                        if entry.get("finish_reason") == "length":
+                            continue
+                        if entry.get("completion_tokens"):
+                            self.observe(entry.get("step"), entry.get("prompt_name"),
+                                         entry["completion_tokens"])
+            except (OSError, json.JSONDecodeError):
+                continue
+
+    def observe(self, step: Optional[str], prompt_name: Optional[str],
+                completion_tokens: int) -> None:
+        """Add one completed call to the history."""
+        if not step:
+            return
+        with self._lock:
+            # A set, so calls without a block index are counted once
+            for key in {(step, block_index(prompt_name)), (step, None)}:
+                samples = self._samples.setdefault(key, [])
+                samples.append(completion_tokens)
+                if len(samples) > MAX_SAMPLES:
+                    del samples[0]
+
+    def suggest(self, step: Optional[str], prompt_name: Optional[str],
+                default: int) -> int:
+        """
+        max_tokens for a request: the history percentile times headroom,
+        or the step's cold-start default when history is too short.
+        """
+        if not step:
+            return default
+
+        with self._lock:
+            samples = self._samples.get((step, block_index(prompt_name)), [])
+            if len(samples) < BUDGET_MIN_SAMPLES:
+                samples = self._samples.get((step, None), [])
+            samples = sorted(samples)
+
+        if len(samples) < BUDGET_MIN_SAMPLES:
+            return DEFAULT_MAX_TOKENS.get(step, default)
+
+        index = min(len(samples) - 1, int(BUDGET_PERCENTILE * len(samples)))
+        budget = math.ceil(samples[index] * BUDGET_HEADROOM)
+        return max(BUDGET_MIN_TOKENS, min(budget, OPENAI_MAX_TOKENS_CEILING))
+
+
+def get_token_budget() -> TokenBudget:
+    """Process-wide budget model, loaded from run logs on first use."""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = TokenBudget()
+        return _budget
+
+
+def suggest_max_tokens(step: Optional[str], prompt_name: Optional[str] = None,
+                       default: int = 4096) -> int:
+    """max_tokens for a request of ``step`` / ``prompt_name``."""
+    return get_token_budget().suggest(step, prompt_name, default)
+
+
+def observe_completion(step: Optional[str], prompt_name: Optional[str],
+                       completion_tokens: Optional[int]) -> None:
+    """Feed a finished call's completion length back into the budget."""
+    if completion_tokens:
+        get_token_budget().observe(step, prompt_name, completion_tokens)
@@ -0,0 +1,214 @@
+"""
+In-memory artifacts of a run.
+
+Steps hand their results to the next step through the run context
+instead of re-reading the files the previous step just wrote: the plan,
+block prompts, expanded blocks, prepared HTML prompts, generated HTML and
+page JSON stay in memory for the rest of the run. Artifacts are keyed by
+their path relative to the run directory.
+
+Writing artifacts to the run directory happens on background writer
+threads, off the steps' critical path, and can be switched off with
+RUN_PERSIST_ARTIFACTS=0. LLM outputs are still written by the LLM layer
+as they are generated. Reads of artifacts not in memory (e.g. on
+resume) fall back to the run directory.
+"""
+
+import fnmatch
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Set, Union
+
+# Write artifacts to the run directory (0 = keep them in memory only;
+# --resume and the step manifest then have nothing to go on)
+RUN_PERSIST_ARTIFACTS = os.getenv("RUN_PERSIST_ARTIFACTS", "1").lower() not in ("0", "false", "no")
+
+# Background threads writing artifacts, shared by all runs in the process
+RUN_WRITER_THREADS = int(os.getenv("RUN_WRITER_THREADS", "2"))
+
+_writer = None
+_writer_lock = threading.Lock()
+
+_contexts: Dict[str, "RunContext"] = {}
+_contexts_lock = threading.Lock()
+
+
+def _get_writer() -> ThreadPoolExecutor:
+    """Process-wide artifact writer pool, created on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=RUN_WRITER_THREADS,
+                                         thread_name_prefix="artifact-writer")
+        return _writer
+
+
+def _write_file(path: Path, text: str) -> None:
+    # Write-then-rename, so readers never see a half-written artifact
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class RunContext:
+    """Artifacts of one run, in memory and (optionally) on disk."""
+
+    def __init__(self, run_dir: Path, persist: bool = RUN_PERSIST_ARTIFACTS):
+        """
+        Args:
+            run_dir: Run directory the artifact paths are relative to
+            persist: Write artifacts to the run directory in the background
+        """
+        self.run_dir = Path(run_dir)
+        self.persist = persist
+        self.artifacts: Dict[str, Any] = {}
+        self._pending: List[Future] = []
+        # Latest unwritten text per artifact, and artifacts with a writer task
+        self._unwritten: Dict[str, str] = {}
+        self._writing: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _key(self, path: Union[str, Path]) -> str:
+        """Artifact key: the path relative to the run directory."""
+        path = Path(path)
+        try:
+            path = path.relative_to(self.run_dir)
+        except ValueError:
+            pass
+        return path.as_posix()
+
+    def _write(self, key: str) -> None:
+        # One writer task per artifact at a time, writing its latest text,
+        # so an older version never overwrites a newer one
+        while True:
+            with self._lock:
+                text = self._unwritten.pop(key, None)
+                if text is None:
+                    self._writing.discard(key)
+                    return
+            try:
+                _write_file(self.run_dir / key, text)
+            except Exception:
+                with self._lock:
+                    self._writing.discard(key)
+                raise
+
+    def _put(self, path: Union[str, Path], value: Any, text: str, persist: bool) -> None:
+        key = self._key(path)
+        with self._lock:
+            self.artifacts[key] = value
+            if self.persist and persist:
+                self._unwritten[key] = text
+                if key not in self._writing:
+                    self._writing.add(key)
+                    self._pending.append(_get_writer().submit(self._write, key))
+
+    def put_text(self, path: Union[str, Path], text: str, persist: bool = True) -> None:
+        """
+        Store a text artifact.
+
+        Args:
+            path: Path relative to the run directory
+            text: Artifact content
+            persist: Write it to the run directory (False for files that
+                are already there, e.g. LLM outputs)
+        """
+        self._put(path, text, text, persist)
+
+    def put_json(self, path: Union[str, Path], data: Any, persist: bool = True) -> None:
+        """Store a JSON artifact (written indented, like the processors do)."""
+        self._put(path, data, json.dumps(data, ensure_ascii=False, indent=2), persist)
+
+    def get_text(self, path: Union[str, Path]) -> str:
+        """
+        Text artifact, from memory or else from the run directory.
+
+        Raises:
+            FileNotFoundError: If the artifact doesn't exist
+        """
+        key = self._key(path)
+        with self._lock:
+            if key in self.artifacts:
+                return self.artifacts[key]
+        with open(self.run_dir / key, "r", encoding="utf-8") as f:
+            text = f.read()
+        with self._lock:
+            return self.artifacts.setdefault(key, text)
+
+    def get_json(self, path: Union[str, Path]) -> Any:
+        """JSON artifact, from memory or else from the run directory."""
+        key = self._key(path)
+        with self._lock:
+            if key in self.artifacts:
+                return self.artifacts[key]
+        with open(self.run_dir / key, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self._lock:
+            return self.artifacts.setdefault(key, data)
+
+    def names(self, directory: str, pattern: str = "*") -> List[str]:
+        """
+        Names of the artifacts in a run subdirectory, in memory or on disk.
+
+        Args:
+            directory: Subdirectory relative to the run directory
+            pattern: Glob pattern for the names
+
+        Returns:
+            Sorted file names
+        """
+        prefix = self._key(directory) + "/"
+        with self._lock:
+            names = {key[len(prefix):] for key in self.artifacts
+                     if key.startswith(prefix) and "/" not in key[len(prefix):]}
+        disk_dir = self.run_dir / directory
+        if disk_dir.is_dir():
+            names.update(p.name for p in disk_dir.iterdir() if p.is_file())
+        return sorted(name for name in names if fnmatch.fnmatch(name, pattern))
+
+    def discard(self, path: Union[str, Path]) -> None:
+        """Drop one artifact from memory and from the run directory."""
+        self.flush()
+        key = self._key(path)
+        with self._lock:
+            self.artifacts.pop(key, None)
+        disk_path = self.run_dir / key
+        if disk_path.is_file():
+            disk_path.unlink()
+
+    def flush(self) -> None:
+        """
+        Wait until every artifact stored so far is written.
+
+        Raises:
+            OSError: The first write error, if any
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        errors = [future.exception() for future in pending]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+
+def get_run_context(run_dir: Path) -> RunContext:
+    """The context of a run directory, created on first use."""
+    key = str(Path(run_dir).resolve())
+    with _contexts_lock:
+        if key not in _contexts:
+            _contexts[key] = RunContext(run_dir)
+        return _contexts[key]
+
+
+def close_run_context(run_dir: Path) -> None:
+    """Write out a run's pending artifacts and drop it from memory."""
+    key = str(Path(run_dir).resolve())
+    with _contexts_lock:
+        context = _contexts.pop(key, None)
+    if context is not None:
+        context.flush()
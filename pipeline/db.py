@@ -1,11 +1,22 @@
 """
 Database operations for the pipeline.
 Handles all Supabase interactions for junior_leads processing.
+
+Workers claim a lead by moving it from FLAGGED to PROCESSING in a single
+conditional update that also stores the worker id and a lease expiry.
+Only one worker's update matches the FLAGGED row, so several hosts can
+poll the same table. While a lead is processed its lease is renewed by a
+heartbeat; leads whose lease expired (crashed worker) are put back to
+FLAGGED by requeue_expired_leases. A worker that loses its lease stops
+before the next step, and its status updates only apply while the lead is
+still claimed by it.
 """
 
 import os
-from typing import List, Dict, Optional, Any
-from datetime import datetime
+import socket
+import threading
+from typing import Iterable, List, Dict, Optional, Any, Set
+from datetime import datetime, timedelta, timezone
 import dotenv
 from supabase import create_client, Client
 
@@ -24,27 +35,59 @@ STATUS_UPLOADED = "UPLOADED"
 STATUS_ARCHIVED = "ARCHIVED"
 STATUS_BLOCKED = "BLOCKED"
 
+# Statuses of a lead a worker is still working on
+IN_PROGRESS_STATUSES = [STATUS_PROCESSING, STATUS_PLAN_READY, STATUS_HTML_READY]
+
+# Lead claiming: this worker's id, how long a claim is valid without a
+# heartbeat, and how often the heartbeat renews it
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "300"))
+LEASE_HEARTBEAT_SECONDS = float(os.getenv("LEASE_HEARTBEAT_SECONDS", str(LEASE_SECONDS / 3)))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class LeaseLost(Exception):
+    """The lead's lease expired or the lead was claimed by another worker."""
+
 
 def get_client() -> Client:
-    """Create Supabase client."""
-    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-        raise ValueError(
-            "Missing SUPABASE_URL or SUPABASE_SERVICE_KEY environment variables"
-        )
-    return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    """
+    Get the process-wide Supabase client.
+    
+    Created once and reused, so a long-running process (--daemon) keeps
+    its HTTP connections instead of reconnecting for every query.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+                    raise ValueError(
+                        "Missing SUPABASE_URL or SUPABASE_SERVICE_KEY environment variables"
+                    )
+                _client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return _client
 
 
 def fetch_flagged_leads() -> List[Dict]:
     """
     Fetch all leads with status='FLAGGED' ready for processing.
-    Returns list of lead dictionaries with id, description, name, email.
+    Returns list of lead dictionaries with id, description, name, email,
+    ordered by priority (highest first), then age (oldest first); see
+    pipeline.lead_queue for the order workers take them in.
     """
     supabase = get_client()
     
     result = (
         supabase.table("junior_leads")
-        .select("id, name, email, description, status, input_transform, plan")
+        .select("id, name, email, description, status, input_transform, plan, "
+                "priority, created_at, flagged_at")
         .eq("status", STATUS_FLAGGED)
+        .order("priority", desc=True)
+        .order("created_at")
         .execute()
     )
     
@@ -66,9 +109,18 @@ def fetch_lead_by_id(lead_id: str) -> Optional[Dict]:
     return result.data if result.data else None
 
 
-def mark_status(lead_id: str, status: str) -> Dict:
+def mark_status(lead_id: str, status: str, worker_id: Optional[str] = None) -> Dict:
     """
     Update lead status and set appropriate timestamps.
+    
+    Args:
+        lead_id: Lead to update
+        status: New status
+        worker_id: If given, only update the lead while this worker holds
+            its claim (as renew_lease does)
+    
+    Raises:
+        LeaseLost: If worker_id is given and the lead is no longer claimed by it
     """
     supabase = get_client()
     
@@ -84,20 +136,34 @@ def mark_status(lead_id: str, status: str) -> Dict:
     if status == STATUS_PROCESSING:
         update_data["last_error"] = None
     
-    result = (
-        supabase.table("junior_leads")
-        .update(update_data)
-        .eq("id", lead_id)
-        .execute()
-    )
+    # Queue wait is measured from here
+    if status == STATUS_FLAGGED:
+        update_data["flagged_at"] = datetime.utcnow().isoformat()
+    
+    # A lead that is done, blocked or requeued is no longer leased
+    if status in [STATUS_FLAGGED, STATUS_UPLOADED, STATUS_ARCHIVED, STATUS_BLOCKED]:
+        update_data["lease_expires_at"] = None
+    
+    query = supabase.table("junior_leads").update(update_data).eq("id", lead_id)
+    if worker_id is not None:
+        query = query.eq("claimed_by", worker_id)
+    result = query.execute()
+    
+    if worker_id is not None and not result.data:
+        raise LeaseLost(f"Lead {lead_id} is no longer claimed by {worker_id}")
     
     return result.data[0] if result.data else {}
 
 
-def mark_failure(lead_id: str, error: Exception, block: bool = False) -> Dict:
+def mark_failure(lead_id: str, error: Exception, block: bool = False,
+                 worker_id: Optional[str] = None) -> Dict:
     """
     Mark a lead as failed with error message.
     If block=True, sets status to BLOCKED for manual intervention.
+    
+    Raises:
+        LeaseLost: If worker_id is given and the lead is no longer claimed
+            by it (see mark_status)
     """
     supabase = get_client()
     
@@ -109,13 +175,15 @@ def mark_failure(lead_id: str, error: Exception, block: bool = False) -> Dict:
     
     if block:
         update_data["status"] = STATUS_BLOCKED
+        update_data["lease_expires_at"] = None
     
-    result = (
-        supabase.table("junior_leads")
-        .update(update_data)
-        .eq("id", lead_id)
-        .execute()
-    )
+    query = supabase.table("junior_leads").update(update_data).eq("id", lead_id)
+    if worker_id is not None:
+        query = query.eq("claimed_by", worker_id)
+    result = query.execute()
+    
+    if worker_id is not None and not result.data:
+        raise LeaseLost(f"Lead {lead_id} is no longer claimed by {worker_id}")
     
     return result.data[0] if result.data else {}
 
@@ -137,6 +205,244 @@ def update_lead_field(lead_id: str, field: str, value: Any) -> Dict:
     return result.data[0] if result.data else {}
 
 
+def enqueue_lead(lead_id: str, priority: int = 0) -> Optional[Dict]:
+    """
+    Flag a lead for processing with the given queue priority.
+    
+    Leads a worker is processing are left alone.
+    
+    Args:
+        lead_id: Lead to flag
+        priority: Queue priority (higher goes first, see pipeline.lead_queue)
+    
+    Returns:
+        The flagged lead, or None if it is in progress
+    """
+    supabase = get_client()
+    
+    result = (
+        supabase.table("junior_leads")
+        .update({
+            "status": STATUS_FLAGGED,
+            "priority": priority,
+            "flagged_at": datetime.utcnow().isoformat(),
+            "lease_expires_at": None,
+        })
+        .eq("id", lead_id)
+        .not_.in_("status", IN_PROGRESS_STATUSES)
+        .execute()
+    )
+    
+    return result.data[0] if result.data else None
+
+
+def _lease_expiry() -> str:
+    """Lease expiry timestamp for a claim or heartbeat made now."""
+    return (datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS)).isoformat()
+
+
+def _claim_values(worker_id: str) -> Dict:
+    """Column updates that claim a lead for ``worker_id``."""
+    return {
+        "status": STATUS_PROCESSING,
+        "claimed_by": worker_id,
+        "lease_expires_at": _lease_expiry(),
+        "processing_started_at": datetime.utcnow().isoformat(),
+        "last_error": None,
+    }
+
+
+def claim_lead(lead_id: str, worker_id: str = WORKER_ID) -> Optional[Dict]:
+    """
+    Atomically claim a flagged lead for this worker.
+    
+    A single UPDATE ... WHERE status = 'FLAGGED' moves the lead to
+    PROCESSING with the worker id and a lease expiry. If another worker
+    claimed it first, the update matches no row.
+    
+    Args:
+        lead_id: Lead to claim
+        worker_id: Id of the claiming worker
+    
+    Returns:
+        The claimed lead, or None if it was not FLAGGED anymore
+    """
+    supabase = get_client()
+    
+    result = (
+        supabase.table("junior_leads")
+        .update(_claim_values(worker_id))
+        .eq("id", lead_id)
+        .eq("status", STATUS_FLAGGED)
+        .execute()
+    )
+    
+    return result.data[0] if result.data else None
+
+
+def claim_lead_for_run(lead_id: str, worker_id: str = WORKER_ID) -> Optional[Dict]:
+    """
+    Claim a lead for a single-client run (--client, --resume, --refresh-stale).
+    
+    Like claim_lead, but the lead may be in any status that is not in
+    progress (e.g. UPLOADED or BLOCKED), or in progress under a lease that
+    expired. A lead another worker holds a live lease on is refused.
+    
+    Args:
+        lead_id: Lead to claim
+        worker_id: Id of the claiming worker
+    
+    Returns:
+        The claimed lead, or None if another worker is processing it
+    """
+    supabase = get_client()
+    
+    result = (
+        supabase.table("junior_leads")
+        .update(_claim_values(worker_id))
+        .eq("id", lead_id)
+        .not_.in_("status", IN_PROGRESS_STATUSES)
+        .execute()
+    )
+    if not result.data:
+        # Taken over from a worker that stopped renewing its lease
+        result = (
+            supabase.table("junior_leads")
+            .update(_claim_values(worker_id))
+            .eq("id", lead_id)
+            .in_("status", IN_PROGRESS_STATUSES)
+            .lt("lease_expires_at", datetime.now(timezone.utc).isoformat())
+            .execute()
+        )
+    
+    return result.data[0] if result.data else None
+
+
+
+def renew_lease(lead_id: str, worker_id: str = WORKER_ID) -> bool:
+    """
+    Extend the lease on a lead this worker is processing.
+    
+    Returns:
+        False if the lead is no longer in progress under this worker
+        (e.g. its lease expired and it was requeued)
+    """
+    supabase = get_client()
+    
+    result = (
+        supabase.table("junior_leads")
+        .update({"lease_expires_at": _lease_expiry()})
+        .eq("id", lead_id)
+        .in_("status", IN_PROGRESS_STATUSES)
+        .eq("claimed_by", worker_id)
+        .execute()
+    )
+    
+    return bool(result.data)
+
+
+def requeue_expired_leases() -> List[Dict]:
+    """
+    Put leads whose lease expired back to FLAGGED.
+    
+    A lease expires when its worker stopped sending heartbeats, e.g.
+    because the worker crashed. Leads in progress without a lease are
+    left alone.
+    
+    Returns:
+        The requeued leads
+    """
+    supabase = get_client()
+    
+    result = (
+        supabase.table("junior_leads")
+        .update({
+            "status": STATUS_FLAGGED,
+            "claimed_by": None,
+            "lease_expires_at": None,
+        })
+        .in_("status", IN_PROGRESS_STATUSES)
+        .lt("lease_expires_at", datetime.now(timezone.utc).isoformat())
+        .execute()
+    )
+    
+    return result.data if result.data else []
+
+
+class LeaseHeartbeat:
+    """
+    Renews the leases on claimed leads in a background thread.
+    
+    Usage:
+        with LeaseHeartbeat([lead_id]):
+            ...process the lead...
+    """
+    
+    def __init__(self, lead_ids: Iterable[str], worker_id: str = WORKER_ID,
+                 interval: float = LEASE_HEARTBEAT_SECONDS):
+        """
+        Args:
+            lead_ids: Leads claimed by this worker
+            worker_id: Id of the worker holding the leases
+            interval: Seconds between renewals
+        """
+        self.lead_ids = set(lead_ids)
+        self.worker_id = worker_id
+        self.interval = interval
+        self.lost: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def release(self, lead_id: str) -> None:
+        """Stop renewing a lead's lease (it is no longer in progress)."""
+        with self._lock:
+            self.lead_ids.discard(lead_id)
+    
+    def check(self, lead_id: str) -> None:
+        """
+        Raises:
+            LeaseLost: If the heartbeat found the lead's lease lost
+        """
+        with self._lock:
+            lost = lead_id in self.lost
+        if lost:
+            raise LeaseLost(f"Lost lease on lead {lead_id}")
+    
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                lead_ids = list(self.lead_ids)
+            for lead_id in lead_ids:
+                try:
+                    renewed = renew_lease(lead_id, self.worker_id)
+                except Exception as exc:
+                    # Try again at the next beat; the lease outlives a few misses
+                    print(f"   ⚠️ Could not renew lease on lead {lead_id}: {exc}")
+                    continue
+                if not renewed:
+                    print(f"   ⚠️ Lost lease on lead {lead_id}; another worker may pick it up")
+                    with self._lock:
+                        self.lead_ids.discard(lead_id)
+                        self.lost.add(lead_id)
+    
+    def start(self) -> "LeaseHeartbeat":
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def __enter__(self) -> "LeaseHeartbeat":
+        return self.start()
+    
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
 def get_leads_by_status(status: str) -> List[Dict]:
     """Get all leads with a specific status."""
     supabase = get_client()
@@ -0,0 +1,227 @@
+"""
+Pool of OpenAI API endpoints.
+
+Spreads requests over several API keys and/or OpenAI-compatible
+deployments. Each endpoint has its own client, rate limiter and circuit
+breaker; a request goes to the endpoint with the most remaining quota
+relative to its recent latency, and endpoints whose circuit is open
+(repeated upstream failures) are skipped until their cool-down ends.
+
+Without OPENAI_ENDPOINTS the pool holds a single "default" endpoint built
+from OPENAI_API_KEY / OPENAI_BASE_URL / OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT.
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import dotenv
+
+from .ratelimit import RateLimiter, get_rate_limiter, MAX_WAIT_SLICE
+from .retry import CircuitBreaker, get_circuit_breaker
+
+dotenv.load_dotenv()
+
+# Default endpoint
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# API base URL, e.g. http://127.0.0.1:8765/v1 for pipeline.fake_server
+# (default: the OpenAI API)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Named endpoints, each configured by OPENAI_<NAME>_API_KEY, _BASE_URL,
+# _RPM_LIMIT and _TPM_LIMIT (e.g. OPENAI_ENDPOINTS=org_a,org_b)
+OPENAI_ENDPOINTS = [
+    name.strip() for name in os.getenv("OPENAI_ENDPOINTS", "").split(",") if name.strip()
+]
+
+# HTTP connection pool settings, per endpoint
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "1").lower() not in ("0", "false", "no")
+
+# Weight of the newest sample in the per-endpoint latency average
+LATENCY_EWMA_ALPHA = 0.2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _http_client_options() -> Dict[str, Any]:
+    """httpx client options: pool limits, keep-alive, timeouts and HTTP/2."""
+    import httpx
+    import importlib.util
+
+    # HTTP/2 needs the optional h2 package
+    http2 = OPENAI_HTTP2 and importlib.util.find_spec("h2") is not None
+
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=OPENAI_POOL_SIZE,
+            max_keepalive_connections=OPENAI_POOL_SIZE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    }
+
+
+class Endpoint:
+    """One API key / deployment with its client, limiter and circuit breaker."""
+
+    def __init__(self, name: str, api_key: Optional[str], base_url: Optional[str] = None,
+                 limiter: Optional[RateLimiter] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        Args:
+            name: Endpoint name, used in logs and the run summary
+            api_key: API key for this endpoint
+            base_url: API base URL (default: the OpenAI API)
+            limiter: Rate limiter for this endpoint's quota
+            breaker: Circuit breaker that ejects the endpoint after failures
+        """
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.limiter = limiter
+        self.breaker = breaker
+        self.latency_ms: Optional[float] = None
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _check_key(self) -> None:
+        if not self.api_key:
+            variable = "OPENAI_API_KEY" if self.name == "default" else f"OPENAI_{self.name.upper()}_API_KEY"
+            raise ValueError(f"Missing {variable} environment variable")
+
+    @property
+    def client(self):
+        """
+        OpenAI client for this endpoint.
+
+        Created once and reused, so all calls share one keep-alive connection
+        pool. Safe to use from multiple threads.
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._check_key()
+                    import httpx
+                    from openai import OpenAI
+                    self._client = OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=httpx.Client(**_http_client_options()),
+                        # Retries are handled by call_llm (rate limiter aware)
+                        max_retries=0,
+                    )
+        return self._client
+
+    @property
+    def async_client(self):
+        """AsyncOpenAI client with the same pool settings (single event loop)."""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._check_key()
+                    import httpx
+                    from openai import AsyncOpenAI
+                    self._async_client = AsyncOpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=httpx.AsyncClient(**_http_client_options()),
+                        max_retries=0,
+                    )
+        return self._async_client
+
+    def ejected_for(self) -> float:
+        """Seconds until the endpoint takes requests again (0 = available)."""
+        return self.breaker.open_for() if self.breaker else 0.0
+
+    def headroom(self) -> float:
+        """Fraction of the endpoint's rate limit currently available."""
+        return self.limiter.headroom() if self.limiter else 1.0
+
+    def record_latency(self, duration_ms: float) -> None:
+        """Add a successful request's duration to the latency average."""
+        with self._lock:
+            if self.latency_ms is None:
+                self.latency_ms = float(duration_ms)
+            else:
+                self.latency_ms += LATENCY_EWMA_ALPHA * (duration_ms - self.latency_ms)
+
+
+class EndpointPool:
+    """Chooses an endpoint for each request."""
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("Endpoint pool needs at least one endpoint")
+        self.endpoints = endpoints
+
+    @property
+    def primary(self) -> Endpoint:
+        """First endpoint, used for non-chat APIs (models, files, batches)."""
+        return self.endpoints[0]
+
+    def choose(self) -> Endpoint:
+        """
+        Pick the available endpoint with the best quota-to-latency ratio,
+        waiting if every endpoint is currently ejected.
+        """
+        while True:
+            waits = {endpoint: endpoint.ejected_for() for endpoint in self.endpoints}
+            available = [endpoint for endpoint, wait in waits.items() if wait <= 0]
+            if available:
+                break
+            time.sleep(min(min(waits.values()), MAX_WAIT_SLICE))
+
+        if len(available) == 1:
+            return available[0]
+
+        # Endpoints without latency history count as the fastest, so they get tried
+        known = [e.latency_ms for e in available if e.latency_ms is not None]
+        fastest = min(known) if known else 1.0
+
+        def score(endpoint: Endpoint):
+            latency = endpoint.latency_ms if endpoint.latency_ms is not None else fastest
+            return endpoint.headroom() / max(latency, 1.0), random.random()
+
+        return max(available, key=score)
+
+
+def load_endpoints() -> List[Endpoint]:
+    """Endpoints configured in the environment."""
+    if not OPENAI_ENDPOINTS:
+        return [Endpoint("default", OPENAI_API_KEY, OPENAI_BASE_URL,
+                         limiter=get_rate_limiter(), breaker=get_circuit_breaker())]
+
+    endpoints = []
+    for name in OPENAI_ENDPOINTS:
+        prefix = f"OPENAI_{name.upper()}_"
+        limiter = RateLimiter(
+            name,
+            rpm=int(os.getenv(prefix + "RPM_LIMIT", "0")),
+            tpm=int(os.getenv(prefix + "TPM_LIMIT", "0")),
+        )
+        endpoints.append(Endpoint(
+            name,
+            os.getenv(prefix + "API_KEY"),
+            os.getenv(prefix + "BASE_URL") or None,
+            # Always limited, so a 429 pauses just this endpoint
+            limiter=limiter,
+            breaker=get_circuit_breaker(name),
+        ))
+    return endpoints
+
+
+def get_endpoint_pool() -> EndpointPool:
+    """Process-wide endpoint pool, built from the environment on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = EndpointPool(load_endpoints())
+        return _pool
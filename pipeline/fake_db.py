@@ -0,0 +1,257 @@
+"""
+Local stand-in for the Supabase junior_leads table.
+
+An in-memory SQLite table behind the subset of the supabase-py query
+builder that pipeline.db uses (select/update with eq, in_, not_.in_, lt,
+order and single). Conditional updates run as one locked statement, like
+PostgREST's UPDATE ... WHERE, so lead claiming and leases can be checked
+without a database:
+
+    python3 -m pipeline.fake_db
+
+runs the claim, heartbeat, requeue and lost-lease checks against it.
+Call use_fake_db() to point pipeline.db at a fresh table instead.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import types
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import db
+
+# junior_leads with the migrations of database_schema.sql applied
+COLUMNS = (
+    "id", "name", "email", "description", "status", "created_at", "input_transform",
+    "plan", "processing_started_at", "processing_completed_at", "last_error",
+    "claimed_by", "lease_expires_at", "priority", "flagged_at",
+)
+JSON_COLUMNS = {"input_transform"}
+
+
+class FakeSupabase:
+    """Client exposing ``table(name)`` over an in-memory junior_leads table."""
+
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        columns = ", ".join(
+            "priority integer NOT NULL DEFAULT 0" if column == "priority" else f"{column} text"
+            for column in COLUMNS
+        )
+        self.conn.execute(f"CREATE TABLE junior_leads ({columns}, PRIMARY KEY (id))")
+
+    def table(self, name: str) -> "FakeQuery":
+        return FakeQuery(self, name)
+
+    def add_lead(self, lead_id: str, status: str = db.STATUS_FLAGGED, **fields) -> None:
+        """Insert a lead row (created_at defaults to now)."""
+        row = {"id": lead_id, "status": status,
+               "created_at": datetime.now(timezone.utc).isoformat(), **fields}
+        with self.lock:
+            self.conn.execute(
+                f"INSERT INTO junior_leads ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                [_encode(value) for value in row.values()],
+            )
+
+
+class FakeQuery:
+    """One select or update, built like a supabase-py query."""
+
+    def __init__(self, client: FakeSupabase, name: str):
+        self.client = client
+        self.name = name
+        self.values: Optional[Dict[str, Any]] = None
+        self.filters: List[Tuple[str, str, Any]] = []
+        self.orders: List[str] = []
+        self.one = False
+        self._negate = False
+
+    def select(self, *columns: str) -> "FakeQuery":
+        return self
+
+    def update(self, values: Dict[str, Any]) -> "FakeQuery":
+        self.values = values
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append((column, "=", value))
+        return self
+
+    def lt(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append((column, "<", value))
+        return self
+
+    @property
+    def not_(self) -> "FakeQuery":
+        self._negate = True
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> "FakeQuery":
+        operator = "NOT IN" if self._negate else "IN"
+        self._negate = False
+        self.filters.append((column, operator, tuple(values)))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "FakeQuery":
+        self.orders.append(f"{column} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def single(self) -> "FakeQuery":
+        self.one = True
+        return self
+
+    def _where(self) -> Tuple[str, List[Any]]:
+        clauses, args = [], []
+        for column, operator, value in self.filters:
+            if isinstance(value, tuple):
+                clauses.append(f"{column} {operator} ({', '.join('?' * len(value))})")
+                args.extend(value)
+            else:
+                clauses.append(f"{column} {operator} ?")
+                args.append(value)
+        return " AND ".join(clauses) or "1", args
+
+    def execute(self) -> types.SimpleNamespace:
+        where, args = self._where()
+        order = f" ORDER BY {', '.join(self.orders)}" if self.orders else ""
+        with self.client.lock:
+            conn = self.client.conn
+            if self.values is not None:
+                # Returns the updated rows, like PostgREST with return=representation
+                ids = [row[0] for row in conn.execute(f"SELECT id FROM {self.name} WHERE {where}", args)]
+                if not ids:
+                    return types.SimpleNamespace(data=[])
+                marks = ", ".join("?" * len(ids))
+                assignments = ", ".join(f"{column} = ?" for column in self.values)
+                conn.execute(f"UPDATE {self.name} SET {assignments} WHERE id IN ({marks})",
+                             [_encode(value) for value in self.values.values()] + ids)
+                where, args = f"id IN ({marks})", ids
+            cursor = conn.execute(f"SELECT * FROM {self.name} WHERE {where}{order}", args)
+            columns = [description[0] for description in cursor.description]
+            rows = [_decode(dict(zip(columns, row))) for row in cursor.fetchall()]
+        if self.one:
+            return types.SimpleNamespace(data=rows[0] if rows else None)
+        return types.SimpleNamespace(data=rows)
+
+
+def _encode(value: Any) -> Any:
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+
+
+def _decode(row: Dict[str, Any]) -> Dict[str, Any]:
+    for column in JSON_COLUMNS:
+        if row.get(column):
+            row[column] = json.loads(row[column])
+    return row
+
+
+def use_fake_db(client: Optional[FakeSupabase] = None) -> FakeSupabase:
+    """Make pipeline.db use ``client`` (default: a new empty table)."""
+    client = client or FakeSupabase()
+    db._client = client
+    return client
+
+
+def check_leases(leads: int = 40) -> bool:
+    """
+    Check lead claiming and leases against a fresh fake table.
+
+    Two workers race to claim the same flagged leads; a heartbeat keeps one
+    lease alive while an expired one is requeued; a worker whose lead was
+    requeued and claimed by another worker gets LeaseLost from its
+    heartbeat and from its status updates, and leaves the lead alone; a
+    single-client run can't claim a lead another worker holds.
+
+    Returns:
+        True if every check passed
+    """
+    client = use_fake_db()
+    for i in range(leads):
+        client.add_lead(f"lead-{i}")
+    results = []
+
+    def check(name: str, ok: bool) -> None:
+        results.append(ok)
+        print(f"   {'✅' if ok else '❌'} {name}")
+
+    # Two workers claim from the same snapshot of the queue
+    claims: Dict[str, List[str]] = {}
+    claims_lock = threading.Lock()
+
+    def claim_all(worker_id: str) -> None:
+        for lead in db.fetch_flagged_leads():
+            if db.claim_lead(lead["id"], worker_id):
+                with claims_lock:
+                    claims.setdefault(lead["id"], []).append(worker_id)
+
+    workers = [threading.Thread(target=claim_all, args=(worker_id,))
+               for worker_id in ("worker-a", "worker-b")]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    check(f"every lead claimed exactly once ({len(claims)}/{leads})",
+          len(claims) == leads and all(len(owners) == 1 for owners in claims.values()))
+
+    # lead-0 keeps a heartbeat; lead-1's worker crashed and its lease ran out
+    owner = claims["lead-0"][0]
+    heartbeat = db.LeaseHeartbeat(["lead-0"], worker_id=owner, interval=0.05).start()
+    past = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+    db.get_client().table("junior_leads").update({"lease_expires_at": past}).eq("id", "lead-0").execute()
+    db.get_client().table("junior_leads").update({"lease_expires_at": past}).eq("id", "lead-1").execute()
+    time.sleep(0.2)
+    requeued = {lead["id"] for lead in db.requeue_expired_leases()}
+    check("heartbeat renews its lease", "lead-0" not in requeued)
+    check("expired lease is requeued", "lead-1" in requeued
+          and db.fetch_lead_by_id("lead-1")["status"] == db.STATUS_FLAGGED)
+    check("renewal by another worker fails", not db.renew_lease("lead-0", "worker-z"))
+    db.mark_status("lead-0", db.STATUS_UPLOADED, worker_id=owner)
+    heartbeat.release("lead-0")
+    heartbeat.stop()
+    check("owner completes its lead", db.fetch_lead_by_id("lead-0")["status"] == db.STATUS_UPLOADED)
+
+    # lead-2 is requeued under its worker and claimed by another one
+    stale_owner = claims["lead-2"][0]
+    heartbeat = db.LeaseHeartbeat(["lead-2"], worker_id=stale_owner, interval=0.05).start()
+    db.get_client().table("junior_leads").update({"lease_expires_at": past}).eq("id", "lead-2").execute()
+    db.requeue_expired_leases()
+    db.claim_lead("lead-2", "worker-c")
+    time.sleep(0.2)
+    heartbeat.stop()
+    try:
+        heartbeat.check("lead-2")
+        check("heartbeat reports the lost lease", False)
+    except db.LeaseLost:
+        check("heartbeat reports the lost lease", True)
+    for status in (db.STATUS_HTML_READY, db.STATUS_UPLOADED):
+        try:
+            db.mark_status("lead-2", status, worker_id=stale_owner)
+            check(f"{status} update by the old owner is refused", False)
+        except db.LeaseLost:
+            check(f"{status} update by the old owner is refused", True)
+    lead = db.fetch_lead_by_id("lead-2")
+    check("new owner keeps the lead", lead["claimed_by"] == "worker-c"
+          and lead["status"] == db.STATUS_PROCESSING)
+
+    # Single-client runs (--client, --resume, --refresh-stale) claim too
+    check("single-client run is refused a held lead",
+          db.claim_lead_for_run("lead-2", "worker-d") is None)
+    claimed = db.claim_lead_for_run("lead-0", "worker-d")
+    check("single-client run claims a finished lead", claimed is not None
+          and claimed["claimed_by"] == "worker-d" and claimed["lease_expires_at"] > past)
+    db.get_client().table("junior_leads").update({"lease_expires_at": past}).eq("id", "lead-2").execute()
+    check("single-client run takes over an expired lease",
+          db.claim_lead_for_run("lead-2", "worker-d") is not None)
+
+    return all(results)
+
+
+if __name__ == "__main__":
+    print("🧪 Lease checks against the fake junior_leads table")
+    ok = check_leases()
+    print("✨ All checks passed" if ok else "❌ Some checks failed")
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,464 @@
+"""
+Local OpenAI-compatible stand-in server.
+
+Serves /v1/chat/completions (plain and streamed) and /v1/models with
+deterministic, well-formed outputs for every pipeline prompt type, plus
+configurable latency (with an optional slow tail), 429s, 5xx errors and
+truncation. Point the pipeline at it to load-test concurrency and retry
+behaviour without network access:
+
+    python3 -m pipeline.fake_server --port 8765 --error-rate-429 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python3 run_pipeline.py ...
+
+    python3 -m pipeline.fake_server --check-hedging
+
+checks that a request whose first token is slow gets hedged.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import endpoints, llm
+from .llm import OPENAI_MODEL, OPENAI_FAST_MODEL, count_message_tokens, estimate_tokens
+
+DEFAULT_PORT = 8765
+
+# Vocabulary for generated text
+WORDS = (
+    "kariéra pohovor projekt zkušenost dovednost tým návrh architektura test "
+    "kód algoritmus data analýza výkon komunikace cíl plán krok praxe řešení "
+    "problém příklad otázka odpověď úkol metrika zpětná vazba portfolio"
+).split()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """HTTP server holding the fault configuration and request statistics."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = ("127.0.0.1", DEFAULT_PORT),
+        latency_ms: float = 300,
+        latency_sigma: float = 0.5,
+        slow_every: int = 0,
+        slow_latency_ms: float = 3000,
+        tokens_per_second: float = 0,
+        error_rate_429: float = 0.0,
+        error_rate_5xx: float = 0.0,
+        truncate_rate: float = 0.0,
+        retry_after_ms: int = 1000,
+        paragraphs: int = 4,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            address: (host, port) to listen on
+            latency_ms: Median time to first token
+            latency_sigma: Log-normal spread of the latency (0 = fixed)
+            slow_every: Every slow_every-th request's first token takes
+                slow_latency_ms instead, a deterministic slow tail (0 = none)
+            slow_latency_ms: Time to first token of the slow requests
+            tokens_per_second: Generation speed after the first token (0 = instant)
+            error_rate_429: Fraction of requests answered with 429
+            error_rate_5xx: Fraction of requests answered with a 5xx error
+            truncate_rate: Fraction of responses cut short with finish_reason=length
+            retry_after_ms: retry-after-ms sent with 429s
+            paragraphs: Paragraphs of text per generated section
+            seed: Seed for latency and fault sampling
+        """
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.slow_every = slow_every
+        self.slow_latency_ms = slow_latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.error_rate_429 = error_rate_429
+        self.error_rate_5xx = error_rate_5xx
+        self.truncate_rate = truncate_rate
+        self.retry_after_ms = retry_after_ms
+        self.paragraphs = paragraphs
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "completed": 0, "rate_limited": 0,
+                      "server_errors": 0, "truncated": 0, "cancelled": 0,
+                      "slow": 0}
+
+    def sample(self) -> Dict[str, Any]:
+        """Draw latency and fault decisions for one request."""
+        with self.lock:
+            self.stats["requests"] += 1
+            roll = self.rng.random()
+            latency = self.latency_ms
+            if self.latency_sigma:
+                latency *= self.rng.lognormvariate(0, self.latency_sigma)
+            if self.slow_every and self.stats["requests"] % self.slow_every == 0:
+                latency = self.slow_latency_ms
+                self.stats["slow"] += 1
+            truncate = self.rng.random() < self.truncate_rate
+
+            if roll < self.error_rate_429:
+                fault = 429
+            elif roll < self.error_rate_429 + self.error_rate_5xx:
+                fault = self.rng.choice([500, 502, 503])
+            else:
+                fault = None
+        return {"latency_s": latency / 1000, "fault": fault, "truncate": truncate}
+
+    def count(self, stat: str) -> None:
+        with self.lock:
+            self.stats[stat] += 1
+
+
+def _text(rng: random.Random, paragraphs: int) -> List[str]:
+    """Paragraphs of pseudo-Czech filler text."""
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(25, 45))).capitalize() + "."
+        for _ in range(paragraphs)
+    ]
+
+
+def fake_completion(body: Dict[str, Any], paragraphs: int = 4) -> str:
+    """
+    Deterministic response for a chat request, shaped like the pipeline
+    expects for the prompt type: JSON profile, 15-block plan, expanded
+    block text, or data-ui HTML.
+    """
+    messages = body.get("messages", [])
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    prompt = messages[-1]["content"] if messages else ""
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+
+    response_format = (body.get("response_format") or {}).get("type")
+    if response_format in ("json_object", "json_schema"):
+        return json.dumps({
+            "obor": rng.choice(["Backend vývoj", "Data analýza", "Frontend vývoj"]),
+            "seniorita": rng.choice(["junior", "medior", "senior"]),
+            "hlavni_cil": "uspět u pohovoru",
+            "technologie": rng.sample(["Python", "SQL", "Docker", "React", "Git"], 3),
+            "platove_ocekavani": None,
+            "kvalita_vstupu": {"skore": round(rng.uniform(0.3, 1.0), 2), "popis": "fake profil"},
+            "inference": {"poznamky": []},
+            "puvodni_text": prompt[-200:],
+        }, ensure_ascii=False)
+
+    if "<blok-n>" in system:
+        return "\n\n".join(
+            f"<blok-{n}>\nKrok {n}: {' '.join(rng.choice(WORDS) for _ in range(4))}\n"
+            f"{_text(rng, 1)[0]}\n<end-blok-{n}>"
+            for n in range(1, 16)
+        )
+
+    if "data-ui" in system:
+        items = "".join(
+            f'<li data-ui="list-item">{" ".join(rng.choice(WORDS) for _ in range(6))}</li>'
+            for _ in range(3)
+        )
+        body_html = "".join(f'<p data-ui="paragraph">{p}</p>' for p in _text(rng, paragraphs))
+        return (
+            f'<section data-ui="block"><h2 data-ui="heading">'
+            f'{" ".join(rng.choice(WORDS) for _ in range(4)).capitalize()}</h2>'
+            f'{body_html}<ul data-ui="bullet-list">{items}</ul></section>'
+        )
+
+    return "\n\n".join(_text(rng, paragraphs))
+
+
+def fake_usage(body: Dict[str, Any], content: str) -> Dict[str, Any]:
+    """Usage block for a fake response to ``body``."""
+    model = body.get("model") or OPENAI_MODEL
+    prompt_tokens = count_message_tokens(body.get("messages", []), model)
+    completion_tokens = estimate_tokens(content, model)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def _truncate(content: str, max_tokens: int, model: Optional[str]) -> Tuple[str, bool]:
+    """Cut content to max_tokens (approximately). Returns (content, truncated)."""
+    if estimate_tokens(content, model) <= max_tokens:
+        return content, False
+    # Shrink by the overshoot ratio until it fits
+    while estimate_tokens(content, model) > max_tokens:
+        ratio = max_tokens / estimate_tokens(content, model)
+        content = content[:max(0, int(len(content) * ratio) - 1)]
+    return content, True
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Request handler for the OpenAI endpoints the pipeline uses."""
+
+    protocol_version = "HTTP/1.1"
+    server: FakeOpenAIServer
+
+    def log_message(self, format: str, *args) -> None:
+        # Keep the console quiet under load
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {
+                "object": "list",
+                "data": [
+                    {"id": model, "object": "model", "owned_by": "fake"}
+                    for model in dict.fromkeys([OPENAI_MODEL, OPENAI_FAST_MODEL])
+                ],
+            })
+        elif self.path.rstrip("/").endswith("/stats"):
+            with self.server.lock:
+                stats = dict(self.server.stats)
+            self._send_json(200, stats)
+        else:
+            self._send_error(404, "not_found", f"Unknown path {self.path}")
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_error(404, "not_found", f"Unknown path {self.path}")
+            return
+
+        plan = self.server.sample()
+        time.sleep(plan["latency_s"])
+
+        if plan["fault"] == 429:
+            self.server.count("rate_limited")
+            self._send_error(429, "rate_limit_exceeded", "Rate limit reached (fake server)", {
+                "retry-after-ms": str(self.server.retry_after_ms),
+                "x-ratelimit-remaining-requests": "0",
+            })
+            return
+        if plan["fault"]:
+            self.server.count("server_errors")
+            self._send_error(plan["fault"], "server_error", "Upstream failure (fake server)")
+            return
+
+        model = body.get("model") or OPENAI_MODEL
+        content = fake_completion(body, self.server.paragraphs)
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        truncated = False
+        if max_tokens:
+            content, truncated = _truncate(content, max_tokens, model)
+        if plan["truncate"] and not truncated:
+            content, truncated = content[:len(content) // 2], True
+        if truncated:
+            self.server.count("truncated")
+
+        usage = fake_usage(body, content)
+        finish_reason = "length" if truncated else "stop"
+        completion_id = f"chatcmpl-fake{uuid.uuid4().hex[:12]}"
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            try:
+                self._stream(completion_id, model, content, finish_reason,
+                             usage if include_usage else None)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client closed the stream early (e.g. a losing hedge)
+                self.close_connection = True
+                self.server.count("cancelled")
+                return
+        else:
+            if self.server.tokens_per_second:
+                time.sleep(usage["completion_tokens"] / self.server.tokens_per_second)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            })
+        self.server.count("completed")
+
+    def _stream(self, completion_id: str, model: str, content: str,
+                finish_reason: str, usage: Optional[Dict[str, Any]]) -> None:
+        """Send the response as server-sent events, paced by tokens_per_second."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(choices: List[Dict], extra: Optional[Dict] = None) -> None:
+            event = {"id": completion_id, "object": "chat.completion.chunk",
+                     "created": int(time.time()), "model": model, "choices": choices}
+            event.update(extra or {})
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+
+        chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        delay = 0.0
+        if self.server.tokens_per_second and pieces:
+            delay = estimate_tokens(content, model) / self.server.tokens_per_second / len(pieces)
+        for piece in pieces:
+            if delay:
+                time.sleep(delay)
+            chunk([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        chunk([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+        if usage:
+            chunk([], {"usage": usage})
+        self._write_chunk("data: [DONE]\n\n")
+        self._write_chunk("")
+
+    def _write_chunk(self, data: str) -> None:
+        """Write one HTTP/1.1 chunk (empty data ends the body)."""
+        encoded = data.encode("utf-8")
+        self.wfile.write(f"{len(encoded):x}\r\n".encode("ascii") + encoded + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: Dict[str, Any],
+                   headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, code: str, message: str,
+                    headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_json(status, {
+            "error": {"message": message, "type": code, "param": None, "code": code}
+        }, headers)
+
+
+def start_fake_server(port: int = 0, **options) -> FakeOpenAIServer:
+    """
+    Start the server on a background thread (port 0 picks a free port).
+    Its base URL is ``http://127.0.0.1:<server.server_port>/v1``.
+    """
+    server = FakeOpenAIServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def check_hedging(calls: int = 30) -> bool:
+    """
+    Check request hedging against a fake server with a slow tail.
+
+    A full generation takes about a second, and every tenth request waits
+    600ms for its first token: much longer than usual, but still well
+    before a typical call finishes. Once the first-token percentile is
+    known, every such request has to be hedged, and its duplicate (never
+    slow itself) has to win before the slow primary sends anything.
+
+    Returns:
+        True if every check passed
+    """
+    server = start_fake_server(latency_ms=40, latency_sigma=0.1, slow_every=10,
+                               slow_latency_ms=600, tokens_per_second=250,
+                               paragraphs=3, seed=7)
+    saved = (endpoints._pool, llm.OPENAI_HEDGE_PERCENTILE, llm._hedge_budget,
+             llm._first_token_latencies)
+    endpoints._pool = endpoints.EndpointPool([endpoints.Endpoint(
+        "fake", "fake", f"http://127.0.0.1:{server.server_port}/v1")])
+    llm.OPENAI_HEDGE_PERCENTILE = 0.8
+    llm._hedge_budget = llm.HedgeBudget(0.5)
+    llm._first_token_latencies = llm.LatencyTracker()
+    results = []
+
+    def check(name: str, ok: bool) -> None:
+        results.append(ok)
+        print(f"   {'✅' if ok else '❌'} {name}")
+
+    try:
+        durations, waits, hedge_wins = [], [], 0
+        for i in range(calls):
+            params = llm.build_chat_params(f"Hedging check {i}", max_tokens=2000)
+            start = time.time()
+            _, usage = llm._hedged_completion(params, "hedge_check")
+            durations.append((time.time() - start) * 1000)
+            if usage.get("hedge_winner") == "hedge":
+                hedge_wins += 1
+                waits.append(usage["hedge_threshold_ms"] + usage["ttft_ms"])
+            elif i >= llm.OPENAI_HEDGE_MIN_SAMPLES:
+                waits.append(usage["ttft_ms"])
+        threshold = llm._first_token_latencies.percentile("hedge_check", 0.8)
+        median = sorted(durations)[len(durations) // 2]
+        with server.lock:
+            stats = dict(server.stats)
+        check(f"threshold follows the first token ({threshold}ms), not the whole "
+              f"call (median {median:.0f}ms)", threshold is not None and threshold < 600 < median)
+        check(f"slow primaries are overtaken by their hedge ({hedge_wins})", hedge_wins > 0)
+        check(f"no hedged-phase request waits out the slow tail "
+              f"(longest first token {max(waits)}ms)", max(waits) < 600)
+        check(f"overtaken primaries are cancelled ({stats['cancelled']})",
+              stats["cancelled"] >= hedge_wins)
+    finally:
+        (endpoints._pool, llm.OPENAI_HEDGE_PERCENTILE, llm._hedge_budget,
+         llm._first_token_latencies) = saved
+        server.shutdown()
+    return all(results)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", "-p", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=300, help="Median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="Log-normal latency spread (0 = fixed)")
+    parser.add_argument("--slow-every", type=int, default=0,
+                        help="Make every Nth request's first token slow (0 = none)")
+    parser.add_argument("--slow-latency-ms", type=float, default=3000,
+                        help="Time to first token of the slow requests")
+    parser.add_argument("--tokens-per-second", type=float, default=0,
+                        help="Generation speed after the first token (0 = instant)")
+    parser.add_argument("--error-rate-429", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--error-rate-5xx", type=float, default=0.0, help="Fraction of 5xx responses")
+    parser.add_argument("--truncate-rate", type=float, default=0.0,
+                        help="Fraction of responses cut short (finish_reason=length)")
+    parser.add_argument("--retry-after-ms", type=int, default=1000, help="retry-after-ms sent with 429s")
+    parser.add_argument("--paragraphs", type=int, default=4, help="Paragraphs per generated section")
+    parser.add_argument("--seed", type=int, help="Seed for latency and fault sampling")
+    parser.add_argument("--check-hedging", action="store_true",
+                        help="Check request hedging against a slow tail and exit")
+
+    args = parser.parse_args()
+
+    if args.check_hedging:
+        print("🧪 Hedging checks against the fake server")
+        ok = check_hedging()
+        print("✨ All checks passed" if ok else "❌ Some checks failed")
+        raise SystemExit(0 if ok else 1)
+
+    server = FakeOpenAIServer(
+        (args.host, args.port),
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        slow_every=args.slow_every,
+        slow_latency_ms=args.slow_latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        error_rate_429=args.error_rate_429,
+        error_rate_5xx=args.error_rate_5xx,
+        truncate_rate=args.truncate_rate,
+        retry_after_ms=args.retry_after_ms,
+        paragraphs=args.paragraphs,
+        seed=args.seed,
+    )
+    print(f"🧪 Fake OpenAI server on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"\n📊 {json.dumps(server.stats)}")
+        server.server_close()
@@ -0,0 +1,156 @@
+"""
+Scheduling of the flagged-lead queue.
+
+Workers take the flagged lead with the highest effective priority: its
+``priority`` column plus one point for every LEAD_AGING_HOURS it has been
+waiting, so old leads eventually overtake a stream of newer, higher
+priority ones. Ties go to the oldest lead (``created_at``).
+
+Leads at EXPRESS_PRIORITY or above form the express lane, used for
+interactive single-client runs (run_pipeline.py --express). They sort
+ahead of the backlog, and EXPRESS_WORKERS worker slots take only express
+leads, so an express lead starts within seconds even while every other
+worker is busy.
+
+Queue wait is measured from ``flagged_at`` (set whenever a lead is
+flagged) or, for leads inserted as FLAGGED, from ``created_at``.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from .db import fetch_flagged_leads, claim_lead
+
+# Priority points a lead gains per this many hours in the queue (0 = no aging)
+LEAD_AGING_HOURS = float(os.getenv("LEAD_AGING_HOURS", "24"))
+
+# Priority of express-lane leads
+EXPRESS_PRIORITY = int(os.getenv("EXPRESS_PRIORITY", "100"))
+
+# Worker slots reserved for express leads when processing with --workers > 1
+EXPRESS_WORKERS = int(os.getenv("EXPRESS_WORKERS", "1"))
+
+# Seconds after which workers refetch the flagged leads instead of taking
+# the next one from the queue's snapshot
+LEAD_QUEUE_REFRESH_SECONDS = float(os.getenv("LEAD_QUEUE_REFRESH_SECONDS", "5"))
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Parse a database timestamp; naive values are taken as UTC."""
+    if not value:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def queue_wait_seconds(lead: Dict, now: Optional[datetime] = None) -> Optional[float]:
+    """
+    How long a lead has been waiting in the queue.
+
+    Returns:
+        Seconds since the lead was flagged, or None if unknown
+    """
+    since = _parse_timestamp(lead.get("flagged_at")) or _parse_timestamp(lead.get("created_at"))
+    if since is None:
+        return None
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (now - since).total_seconds())
+
+
+def is_express(lead: Dict) -> bool:
+    """Whether a lead is in the express lane."""
+    return (lead.get("priority") or 0) >= EXPRESS_PRIORITY
+
+
+def effective_priority(lead: Dict, now: Optional[datetime] = None) -> float:
+    """Priority plus the aging bonus for the time spent waiting."""
+    priority = float(lead.get("priority") or 0)
+    if LEAD_AGING_HOURS <= 0:
+        return priority
+    wait = queue_wait_seconds(lead, now) or 0.0
+    return priority + wait / 3600 / LEAD_AGING_HOURS
+
+
+def order_leads(leads: List[Dict], now: Optional[datetime] = None) -> List[Dict]:
+    """Leads in the order workers take them: effective priority, then age."""
+    now = now or datetime.now(timezone.utc)
+    return sorted(
+        leads,
+        key=lambda lead: (
+            -effective_priority(lead, now),
+            _parse_timestamp(lead.get("created_at")) or now,
+        ),
+    )
+
+
+class LeadQueue:
+    """
+    Hands out flagged leads to concurrent workers in queue order.
+
+    Works from a snapshot of the flagged leads (seeded from the leads
+    passed in, if any), refetched once it is LEAD_QUEUE_REFRESH_SECONDS
+    old or has nothing left to claim. Leads flagged while others are being
+    processed (e.g. express leads) are therefore taken into account within
+    that interval, without a full fetch for every lead. Returned leads are
+    claimed (see pipeline.db.claim_lead).
+    """
+
+    def __init__(self, leads: Optional[List[Dict]] = None,
+                 refresh_seconds: float = LEAD_QUEUE_REFRESH_SECONDS):
+        """
+        Args:
+            leads: Flagged leads already fetched (default: fetch on first use)
+            refresh_seconds: Age at which the snapshot is refetched
+        """
+        self.refresh_seconds = refresh_seconds
+        self._leads: Optional[List[Dict]] = list(leads) if leads is not None else None
+        self._fetched_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, express_only: bool, refetch: bool) -> Optional[Dict]:
+        """Remove and return the first lead of the snapshot in queue order."""
+        with self._lock:
+            stale = time.monotonic() - self._fetched_at >= self.refresh_seconds
+            if self._leads is None or stale or refetch:
+                self._leads = fetch_flagged_leads()
+                self._fetched_at = time.monotonic()
+            for lead in order_leads(self._leads):
+                if express_only and not is_express(lead):
+                    continue
+                # Taken out under the lock, so local workers don't race for it
+                self._leads.remove(lead)
+                return lead
+        return None
+
+    def next_lead(self, express_only: bool = False) -> Optional[Dict]:
+        """
+        Claim the next lead.
+
+        Args:
+            express_only: Only consider express-lane leads
+
+        Returns:
+            The claimed lead with its ``queue_wait_seconds``, or None if
+            there is nothing (claimable) to do
+        """
+        refetched = False
+        while True:
+            lead = self._take(express_only, refetch=False)
+            if lead is None and not refetched:
+                # Look for leads flagged since the snapshot before giving up
+                refetched = True
+                lead = self._take(express_only, refetch=True)
+            if lead is None:
+                return None
+            if claim_lead(lead["id"]) is None:
+                # Claimed by another worker in the meantime
+                continue
+            return {**lead, "queue_wait_seconds": queue_wait_seconds(lead)}
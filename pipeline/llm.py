@@ -5,59 +5,136 @@ Handles all LLM interactions using the OpenAI Chat Completions API.
 
 import os
 import time
-from typing import Optional, Dict, Any
+import hashlib
+import threading
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple, Iterator, Callable
 import json
 import dotenv
 
+from .logger import PipelineLogger
+from .retry import RetryPolicy
+from .endpoints import get_endpoint_pool, OPENAI_POOL_SIZE
+from .budget import suggest_max_tokens, observe_completion, OPENAI_MAX_TOKENS_CEILING
+
 dotenv.load_dotenv()
 
 # OpenAI settings from environment
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
 OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "4096"))
 OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.7"))
 
-# Retry settings
-MAX_RETRIES = 3
-RETRY_DELAY = 2.0
+# Model routing: these steps try the fast model first and escalate to
+# OPENAI_MODEL when the output fails the step's validator
+OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+OPENAI_FAST_STEPS = {
+    step.strip()
+    for step in os.getenv("OPENAI_FAST_STEPS", "input_transform,stage3_html").split(",")
+    if step.strip()
+}
+
+# Stream responses to .partial files as they arrive
+OPENAI_STREAM = os.getenv("OPENAI_STREAM", "0").lower() in ("1", "true", "yes")
+
+# Max prompts in flight at once within a single batch (1 = sequential)
+OPENAI_BATCH_CONCURRENCY = int(os.getenv("OPENAI_BATCH_CONCURRENCY", "4"))
+
+# Max LLM requests in flight across all leads and blocks of the process
+# (0 = unlimited)
+OPENAI_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", str(OPENAI_POOL_SIZE)))
+
+# Extra calls per file when its output fails the batch validator
+BLOCK_MAX_REGENERATIONS = int(os.getenv("BLOCK_MAX_REGENERATIONS", "2"))
+
+# Hedged requests: once a call has waited longer for its first token than
+# this percentile of recent first-token latencies of the same step, a
+# duplicate is fired and the first attempt to stream a token wins
+# (0 disables hedging)
+OPENAI_HEDGE_PERCENTILE = float(os.getenv("OPENAI_HEDGE_PERCENTILE", "0"))
+OPENAI_HEDGE_MIN_SAMPLES = int(os.getenv("OPENAI_HEDGE_MIN_SAMPLES", "10"))
+# Max duplicate requests as a fraction of all requests
+OPENAI_HEDGE_BUDGET = float(os.getenv("OPENAI_HEDGE_BUDGET", "0.1"))
+
+# Response cache settings
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".cache/llm")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Re-measure the cache size from disk at least this often (other processes
+# write to the same cache); in between, writes keep a running total
+LLM_CACHE_SCAN_SECONDS = float(os.getenv("LLM_CACHE_SCAN_SECONDS", "300"))
+
+# In-flight requests keyed by cache key, used to coalesce identical calls
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+_evict_lock = threading.Lock()
+# Running cache size in bytes (None until first measured) and when it was measured
+_cache_bytes: Optional[int] = None
+_cache_scanned_at = 0.0
+
+# Slots for requests in flight (see OPENAI_MAX_IN_FLIGHT)
+_request_slots = threading.BoundedSemaphore(OPENAI_MAX_IN_FLIGHT) if OPENAI_MAX_IN_FLIGHT > 0 else None
+
+# Workers running hedged attempts
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
 
 
 def get_openai_client():
-    """Get OpenAI client instance."""
-    if not OPENAI_API_KEY:
-        raise ValueError("Missing OPENAI_API_KEY environment variable")
+    """
+    Get the process-wide OpenAI client of the primary endpoint.
     
-    from openai import OpenAI
-    return OpenAI(api_key=OPENAI_API_KEY)
+    Created once and reused, so all calls share one keep-alive connection
+    pool. Safe to use from multiple threads. Chat requests pick their
+    endpoint from the pool instead (see pipeline.endpoints).
+    """
+    return get_endpoint_pool().primary.client
 
 
-def call_llm(
+def get_async_openai_client():
+    """
+    Get the process-wide AsyncOpenAI client of the primary endpoint.
+    Must be used from a single event loop.
+    """
+    return get_endpoint_pool().primary.async_client
+
+
+def warm_openai_client() -> bool:
+    """
+    Create the clients and open a connection to every endpoint ahead of
+    the first prompt.
+    
+    Returns:
+        True if all endpoints were reachable
+    """
+    reachable = True
+    for endpoint in get_endpoint_pool().endpoints:
+        try:
+            endpoint.client.models.list()
+        except Exception as e:
+            print(f"   ⚠️ Could not warm OpenAI client ({endpoint.name}): {e}")
+            reachable = False
+    return reachable
+
+
+def build_chat_params(
     prompt: str,
     system_prompt: Optional[str] = None,
     model: Optional[str] = None,
     max_tokens: Optional[int] = None,
     temperature: Optional[float] = None,
     json_mode: bool = False,
-) -> str:
+    json_schema: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     """
-    Call OpenAI Chat Completions API with retry logic.
+    Build Chat Completions request parameters, applying env defaults.
     
-    Args:
-        prompt: The user prompt to send
-        system_prompt: Optional system message
-        model: Model to use (default: from env)
-        max_tokens: Max response tokens (default: from env)
-        temperature: Sampling temperature (default: from env)
-        json_mode: If True, request JSON response format
-        
     Returns:
-        The assistant's response text
-        
-    Raises:
-        RuntimeError: If all retries fail
+        Dict of keyword arguments for ``chat.completions.create``
     """
-    client = get_openai_client()
-    
     model = model or OPENAI_MODEL
     max_tokens = max_tokens or OPENAI_MAX_TOKENS
     temperature = temperature if temperature is not None else OPENAI_TEMPERATURE
@@ -76,175 +153,1206 @@ def call_llm(
         "temperature": temperature,
     }
     
-    if json_mode:
+    if json_schema:
+        params["response_format"] = {"type": "json_schema", "json_schema": json_schema}
+    elif json_mode:
         params["response_format"] = {"type": "json_object"}
     
+    return params
+
+
+def call_llm(
+    prompt: str,
+    system_prompt: Optional[str] = None,
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    json_mode: bool = False,
+    json_schema: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
+    logger: Optional[PipelineLogger] = None,
+    step: Optional[str] = None,
+    prompt_name: Optional[str] = None,
+    validator: Optional[Callable[[str], Optional[str]]] = None,
+) -> str:
+    """
+    Call OpenAI Chat Completions API with retry logic.
+    
+    Responses are served from the on-disk cache when an identical request
+    was answered before, and identical concurrent requests share one call.
+    Steps listed in OPENAI_FAST_STEPS go to OPENAI_FAST_MODEL first and
+    are escalated to OPENAI_MODEL when ``validator`` rejects the output.
+    
+    Args:
+        prompt: The user prompt to send
+        system_prompt: Optional system message
+        model: Model to use (default: from env)
+        max_tokens: Max response tokens (default: learned per step and
+            block from past runs, see pipeline.budget). Truncated responses
+            are retried with double the budget up to OPENAI_MAX_TOKENS_CEILING.
+        temperature: Sampling temperature (default: from env)
+        json_mode: If True, request JSON response format
+        json_schema: Structured Outputs schema the response must follow
+            (``{"name", "strict", "schema"}``); takes precedence over json_mode
+        use_cache: If False, bypass the response cache for this call
+        refresh_cache: Skip the cache lookup but replace the cached entry
+            with the new response (e.g. when the cached one was rejected)
+        logger: Optional run logger for cache and token usage accounting
+        step: Pipeline step name, used to roll up usage in the run summary
+        prompt_name: Name of the prompt (e.g. block file) for usage records
+        validator: Returns a rejection reason for bad output, or None
+        
+    Returns:
+        The assistant's response text
+        
+    Raises:
+        RuntimeError: If all retries fail
+    """
+    if model is None and validator and route_models(step)[1:]:
+        return route_call(
+            lambda routed_model: call_llm(
+                prompt, system_prompt=system_prompt, model=routed_model,
+                max_tokens=max_tokens, temperature=temperature, json_mode=json_mode,
+                json_schema=json_schema, use_cache=use_cache, refresh_cache=refresh_cache,
+                logger=logger, step=step, prompt_name=prompt_name,
+            ),
+            validator, step, prompt_name, logger,
+        )
+    
+    params = build_chat_params(
+        prompt,
+        system_prompt=system_prompt,
+        model=model,
+        max_tokens=max_tokens or suggest_max_tokens(step, prompt_name, OPENAI_MAX_TOKENS),
+        temperature=temperature,
+        json_mode=json_mode,
+        json_schema=json_schema,
+    )
+    
+    def request() -> Tuple[str, bool]:
+        """Returns the response and whether it is complete (not truncated)."""
+        attempt_params = params
+        while True:
+            if OPENAI_HEDGE_PERCENTILE:
+                response, usage = _hedged_completion(attempt_params, step)
+                if logger and usage.get("hedged"):
+                    logger.log_llm_hedge(step, prompt_name, usage["hedge_winner"],
+                                         usage["hedge_threshold_ms"])
+            else:
+                response, usage = _request_completion(attempt_params)
+            if logger:
+                logger.log_llm_usage(step, prompt_name, attempt_params["model"], usage)
+            
+            if usage.get("finish_reason") != "length":
+                observe_completion(step, prompt_name, usage.get("completion_tokens"))
+                return response, True
+            
+            # Truncated - retry with a larger budget
+            budget = attempt_params["max_tokens"]
+            if budget >= OPENAI_MAX_TOKENS_CEILING:
+                return response, False
+            attempt_params = {**attempt_params,
+                              "max_tokens": min(budget * 2, OPENAI_MAX_TOKENS_CEILING)}
+            message = (f"✂️ Truncated {prompt_name or step} at {budget} tokens, "
+                       f"retrying with max_tokens={attempt_params['max_tokens']}")
+            if logger:
+                logger.log_info(message)
+            else:
+                print(f"   {message}")
+    
+    if not (use_cache and LLM_CACHE_ENABLED):
+        return request()[0]
+    
+    key = cache_key(params)
+    if refresh_cache:
+        if logger:
+            logger.log_llm_cache(key, "miss")
+        response, complete = request()
+        if complete:
+            cache_put(key, params, response)
+        else:
+            cache_delete(key)
+        return response
+    
+    cached = cache_get(key)
+    if cached is not None:
+        if logger:
+            logger.log_llm_cache(key, "hit")
+        return cached
+    
+    # Coalesce with an identical request that is already in flight
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+    
+    if not is_leader:
+        if logger:
+            logger.log_llm_cache(key, "coalesced")
+        return future.result()
+    
+    try:
+        # Another leader may have finished between the lookup and the claim
+        response = cache_get(key)
+        if response is None:
+            if logger:
+                logger.log_llm_cache(key, "miss")
+            response, complete = request()
+            if complete:
+                cache_put(key, params, response)
+        elif logger:
+            logger.log_llm_cache(key, "hit")
+        future.set_result(response)
+        return response
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+@contextmanager
+def request_slot():
+    """Hold one of the process-wide in-flight request slots."""
+    if _request_slots is None:
+        yield
+        return
+    with _request_slots:
+        yield
+
+
+def route_models(step: Optional[str]) -> List[str]:
+    """Models to try for ``step``, in order."""
+    if step in OPENAI_FAST_STEPS and OPENAI_FAST_MODEL != OPENAI_MODEL:
+        return [OPENAI_FAST_MODEL, OPENAI_MODEL]
+    return [OPENAI_MODEL]
+
+
+def route_call(
+    attempt: Callable[[str], str],
+    validator: Callable[[str], Optional[str]],
+    step: Optional[str],
+    prompt_name: Optional[str] = None,
+    logger: Optional[PipelineLogger] = None,
+) -> str:
+    """
+    Run ``attempt(model)`` over the step's models until the validator
+    accepts the output. The last model's output is returned as is.
+    """
+    models = route_models(step)
+    for routed_model in models[:-1]:
+        response = attempt(routed_model)
+        rejected = validator(response)
+        if logger:
+            logger.log_llm_route(step, prompt_name, routed_model, rejected,
+                                 escalated=rejected is not None)
+        if rejected is None:
+            return response
+    return attempt(models[-1])
+
+
+def _request_completion(params: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Send one Chat Completions request with retries.
+    
+    Each attempt goes to the endpoint the pool picks, so retries can fail
+    over to another key or deployment. When the endpoint has RPM/TPM limits,
+    the attempt first reserves budget from its shared rate limiter, and the
+    response headers are fed back to it. A failed attempt returns its
+    reservation, since the API bills (and counts) no tokens for it.
+    
+    Returns:
+        Tuple of (response text, usage dict from extract_usage plus the
+        locally counted prompt tokens, request duration and endpoint)
+    """
+    pool = get_endpoint_pool()
+    
+    prompt_tokens = count_message_tokens(params["messages"], params["model"])
+    
+    # Reserve prompt tokens plus the full completion budget, as the API does
+    reserved_tokens = prompt_tokens + params["max_tokens"]
+    
     # Retry loop
-    last_error = None
-    for attempt in range(MAX_RETRIES):
+    policy = RetryPolicy()
+    for attempt in policy.attempts():
+        endpoint = pool.choose()
+        limiter = endpoint.limiter
+        if limiter:
+            limiter.acquire(reserved_tokens)
+        
+        response = None
         try:
-            response = client.chat.completions.create(**params)
-            return response.choices[0].message.content
+            with request_slot():
+                start_time = time.time()
+                raw = endpoint.client.chat.completions.with_raw_response.create(**params)
+                response = raw.parse()
+            duration_ms = int((time.time() - start_time) * 1000)
+            
+            if limiter:
+                limiter.update_from_headers(raw.headers)
+                if response.usage:
+                    limiter.refund(reserved_tokens - response.usage.total_tokens)
+            
+            usage = extract_usage(response, params["model"])
+            usage["prompt_tokens_counted"] = prompt_tokens
+            usage["duration_ms"] = duration_ms
+            usage["max_tokens"] = params["max_tokens"]
+            usage["finish_reason"] = response.choices[0].finish_reason
+            usage["endpoint"] = endpoint.name
+            
+            endpoint.record_latency(duration_ms)
+            policy.succeeded(endpoint)
+            return response.choices[0].message.content, usage
             
         except Exception as e:
-            last_error = e
-            error_str = str(e).lower()
+            if limiter and response is None:
+                limiter.refund(reserved_tokens)
+            policy.failed(e, attempt, endpoint)
+
+
+def stream_llm(
+    prompt: str,
+    system_prompt: Optional[str] = None,
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    json_mode: bool = False,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
+    logger: Optional[PipelineLogger] = None,
+    step: Optional[str] = None,
+    prompt_name: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    Stream a Chat Completions response, yielding text deltas as they arrive.
+    
+    Arguments are the same as for call_llm. A cached response is yielded as
+    a single chunk; a fully consumed, untruncated stream is added to the
+    cache. Time-to-first-token and tokens per second are logged per call.
+    
+    Text already yielded can't be taken back, so a truncated stream is not
+    retried here; the generator's return value is the usage dict, whose
+    finish_reason lets callers retry (see call_llm_with_file).
+    
+    Yields:
+        Response text fragments in order
+    """
+    params = build_chat_params(
+        prompt,
+        system_prompt=system_prompt,
+        model=model,
+        max_tokens=max_tokens or suggest_max_tokens(step, prompt_name, OPENAI_MAX_TOKENS),
+        temperature=temperature,
+        json_mode=json_mode,
+    )
+    
+    caching = use_cache and LLM_CACHE_ENABLED
+    key = cache_key(params)
+    if caching and not refresh_cache:
+        cached = cache_get(key)
+        if cached is not None:
+            if logger:
+                logger.log_llm_cache(key, "hit")
+            yield cached
+            return {"finish_reason": "stop", "max_tokens": params["max_tokens"]}
+    if caching and logger:
+        logger.log_llm_cache(key, "miss")
+    
+    stream = _stream_completion(params)
+    parts = []
+    try:
+        while True:
+            try:
+                delta = next(stream)
+            except StopIteration as stop:
+                usage = stop.value
+                break
+            parts.append(delta)
+            yield delta
+    finally:
+        stream.close()
+    
+    _first_token_latencies.record(step, usage["ttft_ms"])
+    truncated = usage["finish_reason"] == "length"
+    if not truncated:
+        observe_completion(step, prompt_name, usage.get("completion_tokens"))
+    
+    if logger:
+        logger.log_llm_usage(step, prompt_name, params["model"], usage)
+        logger.log_llm_stream(step, prompt_name, usage["ttft_ms"], usage["duration_ms"],
+                              usage.get("completion_tokens", 0), usage["tokens_per_second"])
+    
+    if caching and not truncated:
+        cache_put(key, params, "".join(parts))
+    elif caching and refresh_cache:
+        cache_delete(key)
+    
+    return usage
+
+
+def _stream_completion(params: Dict[str, Any], race: Optional["HedgeRace"] = None,
+                       label: str = "primary"):
+    """
+    Send one streaming request with retries.
+    
+    Yields text deltas and returns (as the generator's return value) the
+    usage dict extended with time-to-first-token and tokens per second.
+    Retries only happen before the first token; once text has been yielded
+    a failure is raised to the caller. Closing the generator early closes
+    the HTTP response, which cancels the generation upstream.
+    
+    A failed or cancelled attempt refunds the rate-limiter tokens it
+    reserved beyond what it received. When ``race`` is given, the open
+    stream is registered under ``label`` so a winning hedge can close it,
+    and losing the race raises HedgeCancelled instead of retrying.
+    """
+    pool = get_endpoint_pool()
+    
+    prompt_tokens = count_message_tokens(params["messages"], params["model"])
+    reserved_tokens = prompt_tokens + params["max_tokens"]
+    
+    policy = RetryPolicy()
+    for attempt in policy.attempts():
+        if race and race.lost(label):
+            raise HedgeCancelled()
+        endpoint = pool.choose()
+        limiter = endpoint.limiter
+        if limiter:
+            limiter.acquire(reserved_tokens)
+        
+        received = False
+        completion_chars = 0
+        usage = None
+        try:
+            with request_slot():
+                start_time = time.time()
+                first_token_at = None
+                usage_chunk = None
+                finish_reason = None
+                
+                raw = endpoint.client.chat.completions.with_raw_response.create(
+                    **params,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                if limiter:
+                    limiter.update_from_headers(raw.headers)
+                
+                stream = raw.parse()
+                if race:
+                    race.attach(label, stream)
+                try:
+                    for chunk in stream:
+                        if chunk.usage:
+                            usage_chunk = chunk
+                        if not chunk.choices:
+                            continue
+                        finish_reason = chunk.choices[0].finish_reason or finish_reason
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if first_token_at is None:
+                                first_token_at = time.time()
+                            received = True
+                            completion_chars += len(delta)
+                            yield delta
+                finally:
+                    stream.close()
+            
+            end_time = time.time()
+            usage = extract_usage(usage_chunk, params["model"]) if usage_chunk else {}
+            if limiter and usage:
+                limiter.refund(reserved_tokens - usage["total_tokens"])
             
-            # Rate limit - wait longer
-            if "rate_limit" in error_str or "429" in str(e):
-                wait_time = RETRY_DELAY * (attempt + 1) * 2
-                print(f"   ⚠️ Rate limited, waiting {wait_time}s...")
-                time.sleep(wait_time)
+            completion_tokens = usage.get("completion_tokens", completion_chars // 4)
+            generation_seconds = end_time - (first_token_at or end_time)
+            usage["prompt_tokens_counted"] = prompt_tokens
+            usage["duration_ms"] = int((end_time - start_time) * 1000)
+            usage["max_tokens"] = params["max_tokens"]
+            usage["finish_reason"] = finish_reason
+            usage["endpoint"] = endpoint.name
+            usage["ttft_ms"] = int(((first_token_at or end_time) - start_time) * 1000)
+            usage["tokens_per_second"] = (
+                completion_tokens / generation_seconds if generation_seconds > 0 else None
+            )
+            endpoint.record_latency(usage["ttft_ms"])
+            policy.succeeded(endpoint)
+            return usage
+            
+        except GeneratorExit:
+            # Closed by the consumer (or a won hedge) after some output
+            if limiter:
+                limiter.refund(reserved_tokens - prompt_tokens - completion_chars // 4)
+            raise
+        except Exception as e:
+            if limiter and usage is None:
+                # Keep only what was generated before the failure
+                used = prompt_tokens + completion_chars // 4 if received else 0
+                limiter.refund(reserved_tokens - used)
+            if race and race.lost(label):
+                raise HedgeCancelled() from e
+            if received:
+                raise
+            policy.failed(e, attempt, endpoint)
+
+
+def call_llm_stream(
+    prompt: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+    **kwargs
+) -> str:
+    """
+    Stream a response, passing each fragment to ``on_delta``.
+    
+    Args:
+        prompt: The user prompt to send
+        on_delta: Optional callback invoked with every text fragment
+        **kwargs: Additional arguments for stream_llm
+        
+    Returns:
+        The full response text
+    """
+    return _consume_stream(prompt, on_delta, **kwargs)[0]
+
+
+def _consume_stream(
+    prompt: str,
+    on_delta: Optional[Callable[[str], None]],
+    **kwargs
+) -> Tuple[str, Dict[str, Any]]:
+    """Run stream_llm to completion. Returns (text, usage)."""
+    stream = stream_llm(prompt, **kwargs)
+    parts = []
+    while True:
+        try:
+            delta = next(stream)
+        except StopIteration as stop:
+            return "".join(parts), stop.value
+        parts.append(delta)
+        if on_delta:
+            on_delta(delta)
+
+
+class LatencyTracker:
+    """
+    Recent time-to-first-token latencies per step, used to derive hedging
+    thresholds (a hedge race is decided by the first token, not by the
+    whole generation).
+    """
+    
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, step: Optional[str], ttft_ms: int) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(step or "default", deque(maxlen=self.window))
+            samples.append(ttft_ms)
+    
+    def percentile(self, step: Optional[str], q: float) -> Optional[float]:
+        """Latency (ms) at quantile q, or None until enough samples exist."""
+        with self._lock:
+            samples = sorted(self._samples.get(step or "default", ()))
+        if len(samples) < OPENAI_HEDGE_MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+
+class HedgeBudget:
+    """Caps duplicate requests to a fraction of all requests."""
+    
+    def __init__(self, fraction: float):
+        self.fraction = fraction
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+    
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+    
+    def try_spend(self) -> bool:
+        """Reserve one hedge if the budget allows it."""
+        with self._lock:
+            if self.hedges + 1 > self.fraction * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+
+class HedgeCancelled(Exception):
+    """Raised inside the losing attempt of a hedged request."""
+
+
+class HedgeRace:
+    """
+    The attempts of one hedged request. The first attempt to receive a
+    token wins; the open streams of the others are closed at that moment,
+    which cancels their generation upstream instead of at their next chunk.
+    """
+    
+    def __init__(self):
+        self.winner: Optional[str] = None
+        self.won_at: Optional[float] = None
+        self._streams: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+    
+    def lost(self, label: str) -> bool:
+        return self.winner is not None and self.winner != label
+    
+    def attach(self, label: str, stream) -> None:
+        """Register an attempt's open stream; close it at once if it already lost."""
+        with self._lock:
+            lost = self.lost(label)
+            if not lost:
+                self._streams[label] = stream
+        if lost:
+            stream.close()
+            raise HedgeCancelled()
+    
+    def claim(self, label: str) -> bool:
+        """Declare ``label`` the winner unless another attempt was first."""
+        with self._lock:
+            if self.winner is None:
+                self.winner = label
+                self.won_at = time.time()
+                losers = [stream for other, stream in self._streams.items() if other != label]
             else:
-                # Other errors - standard retry
-                if attempt < MAX_RETRIES - 1:
-                    print(f"   ⚠️ API error (attempt {attempt + 1}): {e}")
-                    time.sleep(RETRY_DELAY * (attempt + 1))
+                losers = []
+        for stream in losers:
+            try:
+                stream.close()
+            except Exception:
+                pass
+        return self.winner == label
+
+
+_first_token_latencies = LatencyTracker()
+_hedge_budget = HedgeBudget(OPENAI_HEDGE_BUDGET)
+
+
+def _cancellable_completion(params: Dict[str, Any], race: Optional[HedgeRace] = None,
+                            label: str = "primary") -> Tuple[str, Dict[str, Any]]:
+    """
+    Streamed request that claims ``race`` with its first token and stops,
+    closing its connection, if another attempt claimed it first.
+    """
+    stream = _stream_completion(params, race, label)
+    parts = []
+    try:
+        while True:
+            try:
+                delta = next(stream)
+            except StopIteration as stop:
+                if race:
+                    race.claim(label)
+                return "".join(parts), stop.value
+            if race and not parts and not race.claim(label):
+                raise HedgeCancelled()
+            parts.append(delta)
+    finally:
+        stream.close()
+
+
+def _hedged_completion(params: Dict[str, Any],
+                       step: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Request with a hedge: if no token arrived within the step's
+    time-to-first-token percentile and the hedge budget allows, a duplicate
+    is sent. Whichever attempt receives the first token wins, and the other
+    one's stream is closed right away.
     
-    raise RuntimeError(f"OpenAI API failed after {MAX_RETRIES} retries: {last_error}")
+    Each request adds one sample to the step's first-token latencies: how
+    long it waited for its first token. For a hedged request that is the
+    time until the winning token, which stays above the threshold the
+    hedge fired at, so hedging doesn't shift the percentile.
+    
+    Returns:
+        Tuple of (response text, usage dict with hedge details)
+    """
+    global _hedge_executor
+    
+    _hedge_budget.record_request()
+    threshold_ms = _first_token_latencies.percentile(step, OPENAI_HEDGE_PERCENTILE)
+    
+    if threshold_ms is None:
+        response, usage = _cancellable_completion(params)
+        _first_token_latencies.record(step, usage["ttft_ms"])
+        return response, usage
+    
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=OPENAI_POOL_SIZE, thread_name_prefix="llm-hedge"
+            )
+    
+    race = HedgeRace()
+    started = time.time()
+    primary = _hedge_executor.submit(_cancellable_completion, params, race, "primary")
+    
+    done, _ = wait([primary], timeout=threshold_ms / 1000)
+    if done or race.winner or not _hedge_budget.try_spend():
+        response, usage = primary.result()
+        _first_token_latencies.record(step, usage["ttft_ms"])
+        return response, usage
+    
+    print(f"   🔀 Hedging request after {threshold_ms}ms")
+    hedge = _hedge_executor.submit(_cancellable_completion, params, race, "hedge")
+    
+    pending = {primary, hedge}
+    last_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                if not isinstance(error, HedgeCancelled):
+                    last_error = error
+                continue
+            response, usage = future.result()
+            _first_token_latencies.record(step, int((race.won_at - started) * 1000))
+            usage["hedged"] = True
+            usage["hedge_winner"] = "hedge" if future is hedge else "primary"
+            usage["hedge_threshold_ms"] = threshold_ms
+            return response, usage
+    
+    raise last_error
+
+
+def set_cache_enabled(enabled: bool) -> None:
+    """Globally enable or bypass the response cache (e.g. from a CLI flag)."""
+    global LLM_CACHE_ENABLED
+    LLM_CACHE_ENABLED = enabled
+
+
+def cache_key(params: Dict[str, Any]) -> str:
+    """
+    Content hash of everything that affects the response.
+    
+    Covers model, messages (system + user), sampling parameters and
+    response format, serialized canonically. max_tokens is left out: it
+    only matters when a response is truncated, and truncated responses
+    are never cached, so learned budgets don't invalidate the cache.
+    """
+    keyed = {k: v for k, v in params.items() if k != "max_tokens"}
+    canonical = json.dumps(keyed, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str) -> Path:
+    """Cache file path, sharded by the first two hex digits."""
+    return Path(LLM_CACHE_DIR) / key[:2] / f"{key}.json"
+
+
+def cache_get(key: str) -> Optional[str]:
+    """
+    Look up a cached response.
+    
+    Expired entries are deleted. A hit refreshes the file's mtime,
+    which is what LRU eviction orders by.
+    
+    Returns:
+        The cached response text, or None on miss
+    """
+    path = _cache_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    
+    if time.time() - entry.get("created_at", 0) > LLM_CACHE_TTL_SECONDS:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        return None
+    
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    
+    return entry.get("response")
+
+
+def cache_put(key: str, params: Dict[str, Any], response: str) -> None:
+    """Store a response in the cache and evict old entries if over budget."""
+    path = _cache_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        replaced_bytes = path.stat().st_size
+    except OSError:
+        replaced_bytes = 0
+    
+    entry = {
+        "key": key,
+        "model": params.get("model"),
+        "created_at": time.time(),
+        "response": response,
+    }
+    
+    # Write atomically so concurrent readers never see a partial entry
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    
+    _account_cache(path.stat().st_size - replaced_bytes)
+
+
+def cache_delete(key: str) -> None:
+    """Remove a cached response, e.g. one that failed validation."""
+    path = _cache_path(key)
+    try:
+        size = path.stat().st_size
+        path.unlink()
+    except OSError:
+        return
+    _account_cache(-size)
+
+
+def _account_cache(delta_bytes: int) -> None:
+    """
+    Add a write to the running cache size and evict once it is over
+    LLM_CACHE_MAX_BYTES, so the cache directory is only scanned when
+    evicting or every LLM_CACHE_SCAN_SECONDS.
+    """
+    global _cache_bytes
+    with _evict_lock:
+        if _cache_bytes is None or time.time() - _cache_scanned_at > LLM_CACHE_SCAN_SECONDS:
+            _evict_cache()
+            return
+        _cache_bytes += delta_bytes
+        if _cache_bytes > LLM_CACHE_MAX_BYTES:
+            _evict_cache()
+
+
+def _evict_cache() -> None:
+    """
+    Measure the cache and, when it is over LLM_CACHE_MAX_BYTES, delete least
+    recently used entries down to 90% of it, so the next eviction is some
+    writes away. Caller holds _evict_lock.
+    """
+    global _cache_bytes, _cache_scanned_at
+    target_bytes = int(LLM_CACHE_MAX_BYTES * 0.9)
+    entries = []
+    total_bytes = 0
+    for path in Path(LLM_CACHE_DIR).glob("*/*.json"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total_bytes += stat.st_size
+    
+    if total_bytes > LLM_CACHE_MAX_BYTES:
+        for _, size, path in sorted(entries):
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total_bytes -= size
+            if total_bytes <= target_bytes:
+                break
+    
+    _cache_bytes = total_bytes
+    _cache_scanned_at = time.time()
 
 
 def call_llm_with_file(
     prompt_file: str,
     output_file: str,
     system_prompt: Optional[str] = None,
+    stream: Optional[bool] = None,
+    on_delta: Optional[Callable[[str], None]] = None,
+    validator: Optional[Callable[[str], Optional[str]]] = None,
+    prompt: Optional[str] = None,
     **kwargs
 ) -> str:
     """
     Read prompt from file, call LLM, save response to file.
     
+    In streaming mode the response is written to ``<output_file>.partial``
+    as tokens arrive and renamed to ``output_file`` once complete, so a
+    killed process keeps the partial text without it being mistaken for
+    a finished output.
+    
     Args:
         prompt_file: Path to prompt file
         output_file: Path to save response
         system_prompt: Optional system message
+        stream: Stream the response (default: OPENAI_STREAM)
+        on_delta: Optional callback for each streamed text fragment
+        validator: Returns a rejection reason for bad output, or None;
+            a rejected fast-model output is overwritten by OPENAI_MODEL's
+        prompt: Prompt text already in memory (default: read prompt_file)
         **kwargs: Additional arguments for call_llm
         
     Returns:
         The response text
     """
+    if kwargs.get("model") is None and validator and route_models(kwargs.get("step"))[1:]:
+        kwargs.pop("model", None)
+        return route_call(
+            lambda routed_model: call_llm_with_file(
+                prompt_file, output_file, system_prompt=system_prompt, stream=stream,
+                on_delta=on_delta, prompt=prompt, model=routed_model, **kwargs
+            ),
+            validator, kwargs.get("step"),
+            kwargs.get("prompt_name") or os.path.basename(prompt_file), kwargs.get("logger"),
+        )
+    
+    stream = OPENAI_STREAM if stream is None else stream
+    
     # Read prompt
-    with open(prompt_file, 'r', encoding='utf-8') as f:
-        prompt = f.read()
+    if prompt is None:
+        with open(prompt_file, 'r', encoding='utf-8') as f:
+            prompt = f.read()
+    
+    kwargs.setdefault("prompt_name", os.path.basename(prompt_file))
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    
+    if stream:
+        partial_file = f"{output_file}.partial"
+        while True:
+            with open(partial_file, 'w', encoding='utf-8') as f:
+                def write_delta(delta: str) -> None:
+                    f.write(delta)
+                    f.flush()
+                    if on_delta:
+                        on_delta(delta)
+                
+                response, usage = _consume_stream(
+                    prompt, write_delta, system_prompt=system_prompt, **kwargs
+                )
+            
+            # Truncated - rewrite the file with a larger budget
+            budget = usage.get("max_tokens") or OPENAI_MAX_TOKENS
+            if usage.get("finish_reason") != "length" or budget >= OPENAI_MAX_TOKENS_CEILING:
+                break
+            kwargs["max_tokens"] = min(budget * 2, OPENAI_MAX_TOKENS_CEILING)
+            print(f"   ✂️ Response truncated at {budget} tokens, "
+                  f"retrying with {kwargs['max_tokens']}")
+        
+        os.replace(partial_file, output_file)
+        return response
     
     # Call LLM
     response = call_llm(prompt, system_prompt=system_prompt, **kwargs)
     
     # Save response
-    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write(response)
     
     return response
 
 
+def generate_file(
+    input_file: Path,
+    output_file: Path,
+    system_prompt: Optional[str] = None,
+    validator: Optional[Callable[[str], Optional[str]]] = None,
+    max_regenerations: Optional[int] = None,
+    label: str = "",
+    prompt: Optional[str] = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """
+    Generate one prompt file's output, validating and regenerating it.
+    
+    An existing output is kept when it passes ``validator``. A rejected
+    output is regenerated with OPENAI_MODEL up to ``max_regenerations``
+    times, bypassing the cache lookup and replacing the cached entry so
+    later runs don't get the rejected response back.
+    
+    Args:
+        input_file: Prompt file
+        output_file: File to save the response to
+        system_prompt: Optional system message
+        validator: Returns a rejection reason for a bad output, or None
+        max_regenerations: Extra calls for a rejected output
+            (default: BLOCK_MAX_REGENERATIONS)
+        label: Progress prefix for console output (e.g. "[3/15]")
+        prompt: Prompt text already in memory (default: read input_file)
+        **kwargs: Additional arguments for call_llm
+        
+    Returns:
+        Result dict with name, status (success, skipped or failed) and
+        response_length / regenerations or error; successful and
+        validated existing outputs include the ``response`` text
+    """
+    if max_regenerations is None:
+        max_regenerations = BLOCK_MAX_REGENERATIONS
+    logger = kwargs.get("logger")
+    prefix = f"{label} " if label else ""
+    response = None
+    
+    # Skip if output exists (and passes validation)
+    if output_file.exists():
+        with open(output_file, 'r', encoding='utf-8') as f:
+            response = f.read()
+        if not (validator and validator(response)):
+            print(f"   ⏭️ {prefix}Skipping: {input_file.name} (exists)")
+            return {"name": input_file.name, "status": "skipped", "response": response}
+    else:
+        print(f"   🔄 {prefix}Processing: {input_file.name}")
+    
+    try:
+        if response is None:
+            response = call_llm_with_file(
+                str(input_file),
+                str(output_file),
+                system_prompt=system_prompt,
+                validator=validator,
+                prompt=prompt,
+                **kwargs
+            )
+        
+        regenerations = 0
+        rejected = validator(response) if validator else None
+        while rejected:
+            if regenerations >= max_regenerations:
+                raise RuntimeError(f"invalid output after {regenerations} "
+                                   f"regenerations: {rejected}")
+            regenerations += 1
+            message = (f"🔁 Regenerating {input_file.name} ({rejected}), "
+                       f"attempt {regenerations}/{max_regenerations}")
+            if logger:
+                logger.log_info(message)
+            else:
+                print(f"   {message}")
+            response = call_llm_with_file(
+                str(input_file),
+                str(output_file),
+                system_prompt=system_prompt,
+                prompt=prompt,
+                **{**kwargs, "model": kwargs.get("model") or OPENAI_MODEL,
+                   "refresh_cache": True},
+            )
+            rejected = validator(response)
+        
+        print(f"   ✅ {prefix}Completed: {input_file.name} ({len(response)} chars)")
+        return {
+            "name": input_file.name,
+            "status": "success",
+            "response_length": len(response),
+            "regenerations": regenerations,
+            "response": response,
+        }
+        
+    except Exception as e:
+        print(f"   ❌ {prefix}Failed: {input_file.name} - {e}")
+        return {
+            "name": input_file.name,
+            "status": "failed",
+            "error": str(e)
+        }
+
+
 def process_prompt_batch(
     input_dir: str,
     output_dir: str,
     system_prompt: Optional[str] = None,
     pattern: str = "*.txt",
+    max_workers: Optional[int] = None,
+    validator: Optional[Callable[[str], Optional[str]]] = None,
+    max_regenerations: Optional[int] = None,
+    prompts: Optional[Dict[str, str]] = None,
     **kwargs
 ) -> Dict[str, Any]:
     """
     Process all prompt files in a directory.
     
+    Prompts are sent concurrently, at most ``max_workers`` in flight at once.
+    Files whose output already exists are skipped, and the per-file results
+    keep the sorted input order regardless of completion order.
+    
+    With a ``validator``, each output (including an existing one) is
+    checked, and only the files it rejects are regenerated with
+    OPENAI_MODEL up to ``max_regenerations`` times (see generate_file).
+    
     Args:
         input_dir: Directory with prompt files
         output_dir: Directory to save responses
         system_prompt: Optional system message for all prompts
         pattern: Glob pattern for input files
+        max_workers: Max concurrent requests (default: OPENAI_BATCH_CONCURRENCY,
+            1 processes the files sequentially)
+        validator: Returns a rejection reason for a bad output, or None
+        max_regenerations: Extra calls per rejected file
+            (default: BLOCK_MAX_REGENERATIONS)
+        prompts: Prompt texts by file name, used instead of reading the
+            matching files from input_dir (see pipeline.context)
         **kwargs: Additional arguments for call_llm
         
     Returns:
         Summary dict with counts and results
     """
-    from pathlib import Path
-    
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     
-    files = sorted(input_path.glob(pattern))
+    if prompts is not None:
+        files = [input_path / name for name in sorted(prompts)]
+    else:
+        files = sorted(input_path.glob(pattern))
     
     if not files:
-        return {"total": 0, "success": 0, "failed": 0, "skipped": 0}
+        return {"total": 0, "success": 0, "failed": 0, "skipped": 0, "regenerated": 0}
+    
+    max_workers = max_workers or OPENAI_BATCH_CONCURRENCY
+    total = len(files)
+    
+    def process_file(i: int, input_file: Path) -> Dict[str, Any]:
+        return generate_file(
+            input_file, output_path / input_file.name,
+            system_prompt=system_prompt,
+            validator=validator,
+            max_regenerations=max_regenerations,
+            label=f"[{i}/{total}]",
+            prompt=prompts.get(input_file.name) if prompts is not None else None,
+            **kwargs
+        )
+    
+    if max_workers <= 1:
+        file_results = [process_file(i, f) for i, f in enumerate(files, 1)]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(process_file, i, f)
+                for i, f in enumerate(files, 1)
+            ]
+            file_results = [future.result() for future in futures]
     
     results = {
-        "total": len(files),
-        "success": 0,
-        "failed": 0,
-        "skipped": 0,
-        "files": []
+        "total": total,
+        "success": sum(1 for r in file_results if r["status"] == "success"),
+        "failed": sum(1 for r in file_results if r["status"] == "failed"),
+        "skipped": sum(1 for r in file_results if r["status"] == "skipped"),
+        "regenerated": sum(1 for r in file_results if r.get("regenerations")),
+        "files": file_results,
     }
     
-    for i, input_file in enumerate(files, 1):
-        output_file = output_path / input_file.name
-        
-        # Skip if output exists
-        if output_file.exists():
-            print(f"   ⏭️ [{i}/{len(files)}] Skipping: {input_file.name} (exists)")
-            results["skipped"] += 1
-            results["files"].append({"name": input_file.name, "status": "skipped"})
-            continue
-        
-        print(f"   🔄 [{i}/{len(files)}] Processing: {input_file.name}")
-        
-        try:
-            response = call_llm_with_file(
-                str(input_file),
-                str(output_file),
-                system_prompt=system_prompt,
-                **kwargs
-            )
-            
-            results["success"] += 1
-            results["files"].append({
-                "name": input_file.name,
-                "status": "success",
-                "response_length": len(response)
-            })
-            print(f"   ✅ [{i}/{len(files)}] Completed: {input_file.name} ({len(response)} chars)")
-            
-        except Exception as e:
-            results["failed"] += 1
-            results["files"].append({
-                "name": input_file.name,
-                "status": "failed",
-                "error": str(e)
-            })
-            print(f"   ❌ [{i}/{len(files)}] Failed: {input_file.name} - {e}")
-    
     return results
 
 
-def estimate_tokens(text: str) -> int:
+# USD per 1M tokens: (input, cached input, output). Longest matching prefix wins.
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "gpt-4": (30.00, 30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+}
+
+# Chat format overhead (see OpenAI cookbook token counting)
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+# Loaded tokenizers by encoding name (None = couldn't be loaded)
+_encodings: Dict[str, Any] = {}
+_encodings_lock = threading.Lock()
+
+
+def _get_encoding(model: str):
+    """
+    Tokenizer for a model. Each encoding is loaded (or fails to load) once
+    per process, so a missing download is only tried and reported once.
+    None if tiktoken is not installed or its encoding files can't be loaded.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    
+    try:
+        name = tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        name = "o200k_base"
+    
+    with _encodings_lock:
+        if name not in _encodings:
+            try:
+                _encodings[name] = tiktoken.get_encoding(name)
+            except Exception as e:
+                print(f"   ⚠️ Tokenizer unavailable, using approximate token counts: {e}")
+                _encodings[name] = None
+        return _encodings[name]
+
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Count tokens of a text with the model's tokenizer.
+    Falls back to a 4 chars per token approximation without tiktoken.
+    """
+    encoding = _get_encoding(model or OPENAI_MODEL)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+    """Count prompt tokens of a chat request, including message framing."""
+    total = TOKENS_PER_REPLY
+    for message in messages:
+        total += TOKENS_PER_MESSAGE + estimate_tokens(message["content"], model)
+    return total
+
+
+def extract_usage(response, model: str) -> Dict[str, Any]:
     """
-    Rough estimate of token count (4 chars per token approximation).
-    For accurate counts, use tiktoken library.
+    Billed usage of a chat completion.
+    
+    Returns:
+        Dict with prompt, completion, cached and total tokens plus cost_usd
     """
-    return len(text) // 4
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cached_tokens": cached_tokens,
+        "total_tokens": usage.total_tokens,
+        "cost_usd": estimate_cost(
+            usage.prompt_tokens, usage.completion_tokens, model, cached_tokens
+        ),
+    }
 
 
-def estimate_cost(input_tokens: int, output_tokens: int, model: str = None) -> float:
+def estimate_cost(input_tokens: int, output_tokens: int, model: str = None,
+                  cached_tokens: int = 0) -> float:
     """
     Estimate API cost based on token counts.
     
-    Pricing (as of 2024, GPT-4o):
-    - Input: $5 / 1M tokens
-    - Output: $15 / 1M tokens
+    Uses MODEL_PRICING; cached prompt tokens (part of input_tokens) are
+    billed at the discounted cached-input rate.
     """
     model = model or OPENAI_MODEL
     
-    # GPT-4o pricing
-    if "gpt-4o" in model:
-        input_cost = (input_tokens / 1_000_000) * 5
-        output_cost = (output_tokens / 1_000_000) * 15
-    # GPT-4 pricing
-    elif "gpt-4" in model:
-        input_cost = (input_tokens / 1_000_000) * 30
-        output_cost = (output_tokens / 1_000_000) * 60
-    # GPT-3.5 pricing
-    else:
-        input_cost = (input_tokens / 1_000_000) * 0.5
-        output_cost = (output_tokens / 1_000_000) * 1.5
+    prefix = max(
+        (p for p in MODEL_PRICING if model.startswith(p)),
+        key=len,
+        default="gpt-4o",
+    )
+    input_price, cached_price, output_price = MODEL_PRICING[prefix]
+    
+    input_cost = ((input_tokens - cached_tokens) / 1_000_000) * input_price
+    cached_cost = (cached_tokens / 1_000_000) * cached_price
+    output_cost = (output_tokens / 1_000_000) * output_price
     
-    return input_cost + output_cost
+    return input_cost + cached_cost + output_cost
@@ -5,11 +5,32 @@ Provides structured JSONL logging and console output.
 
 import json
 import os
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any
 
 
+# Usage counters rolled up per step and per lead
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "cached_tokens", "total_tokens", "cost_usd")
+
+
+def _empty_usage() -> Dict[str, Any]:
+    """Zeroed usage totals."""
+    usage = {"calls": 0}
+    usage.update({field: 0 for field in USAGE_FIELDS})
+    usage["cached_share"] = 0.0
+    return usage
+
+
+def _cached_share(usage: Dict[str, Any]) -> float:
+    """Fraction of prompt tokens served from the provider's prompt-prefix cache."""
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    if not prompt_tokens:
+        return 0.0
+    return round((usage.get("cached_tokens") or 0) / prompt_tokens, 3)
+
+
 class PipelineLogger:
     """
     Structured logger for pipeline runs.
@@ -32,6 +53,9 @@ class PipelineLogger:
         # Main log file
         self.log_file = self.logs_dir / "pipeline.jsonl"
         
+        # Guards the log file and summary against concurrent block workers
+        self._lock = threading.Lock()
+        
         # Run summary
         self.summary = {
             "client_id": client_id,
@@ -41,6 +65,10 @@ class PipelineLogger:
             "status": "running",
             "steps": [],
             "errors": [],
+            "llm_cache": {"hits": 0, "misses": 0, "coalesced": 0},
+            "usage": {"total": _empty_usage(), "steps": {}, "endpoints": {}},
+            "hedging": {"hedged": 0, "hedge_won": 0},
+            "routing": {},
         }
     
     def _write_log(self, entry: Dict[str, Any]) -> None:
@@ -48,8 +76,9 @@ class PipelineLogger:
         entry["timestamp"] = datetime.utcnow().isoformat()
         entry["client_id"] = self.client_id
         
-        with open(self.log_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        with self._lock:
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
     
     def log_step_start(self, step_name: str, details: Optional[Dict] = None) -> None:
         """Log the start of a pipeline step."""
@@ -80,6 +109,23 @@ class PipelineLogger:
         
         print(f"✅ [{self.client_id}] Completed: {step_name} ({duration_ms}ms)")
     
+    def log_step_skipped(self, step_name: str, reason: str) -> None:
+        """Log a step skipped on resume because its outputs are still valid."""
+        entry = {
+            "event": "step_skipped",
+            "step": step_name,
+            "reason": reason,
+        }
+        self._write_log(entry)
+        
+        self.summary["steps"].append({
+            "name": step_name,
+            "status": "skipped",
+            "duration_ms": 0,
+        })
+        
+        print(f"⏭️ [{self.client_id}] Skipping: {step_name} ({reason})")
+    
     def log_step_error(self, step_name: str, error: Exception, 
                        retry_count: int = 0) -> None:
         """Log an error during a step."""
@@ -118,6 +164,147 @@ class PipelineLogger:
         status = "✅" if success else "❌"
         print(f"   {status} Prompt: {prompt_name}")
     
+    def log_llm_cache(self, cache_key: str, outcome: str) -> None:
+        """
+        Log a response cache lookup.
+        
+        Args:
+            cache_key: Content hash of the request
+            outcome: One of "hit", "miss" or "coalesced"
+        """
+        entry = {
+            "event": "llm_cache",
+            "cache_key": cache_key,
+            "outcome": outcome,
+        }
+        self._write_log(entry)
+        
+        counter = {"hit": "hits", "miss": "misses", "coalesced": "coalesced"}[outcome]
+        with self._lock:
+            self.summary["llm_cache"][counter] += 1
+    
+    def log_llm_usage(self, step: Optional[str], prompt_name: Optional[str],
+                      model: str, usage: Dict[str, Any]) -> None:
+        """
+        Log billed token usage of one LLM call and add it to the step,
+        endpoint and lead totals in the run summary.
+        
+        Args:
+            step: Pipeline step the call belongs to
+            prompt_name: Prompt identifier (e.g. block file name)
+            model: Model that served the request
+            usage: Usage dict from llm.extract_usage
+        """
+        entry = {
+            "event": "llm_usage",
+            "step": step,
+            "prompt_name": prompt_name,
+            "model": model,
+            **usage,
+            "cached_share": _cached_share(usage),
+        }
+        self._write_log(entry)
+        
+        with self._lock:
+            totals = self.summary["usage"]
+            step_totals = totals["steps"].setdefault(step or "unknown", _empty_usage())
+            buckets = [totals["total"], step_totals]
+            if usage.get("endpoint"):
+                buckets.append(totals["endpoints"].setdefault(usage["endpoint"], _empty_usage()))
+            for bucket in buckets:
+                bucket["calls"] += 1
+                for field in USAGE_FIELDS:
+                    bucket[field] += usage.get(field, 0) or 0
+                bucket["cached_share"] = _cached_share(bucket)
+    
+    def log_llm_stream(self, step: Optional[str], prompt_name: Optional[str],
+                       ttft_ms: int, duration_ms: int, completion_tokens: int,
+                       tokens_per_second: Optional[float]) -> None:
+        """Log latency metrics of a streamed LLM call."""
+        entry = {
+            "event": "llm_stream",
+            "step": step,
+            "prompt_name": prompt_name,
+            "ttft_ms": ttft_ms,
+            "duration_ms": duration_ms,
+            "completion_tokens": completion_tokens,
+            "tokens_per_second": round(tokens_per_second, 1) if tokens_per_second else None,
+        }
+        self._write_log(entry)
+    
+    def log_llm_hedge(self, step: Optional[str], prompt_name: Optional[str],
+                      winner: str, threshold_ms: float) -> None:
+        """
+        Log a hedged LLM request.
+        
+        Args:
+            step: Pipeline step of the call
+            prompt_name: Prompt identifier
+            winner: "primary" or "hedge", whichever answered first
+            threshold_ms: Latency after which the duplicate was sent
+        """
+        entry = {
+            "event": "llm_hedge",
+            "step": step,
+            "prompt_name": prompt_name,
+            "winner": winner,
+            "threshold_ms": threshold_ms,
+        }
+        self._write_log(entry)
+        
+        with self._lock:
+            self.summary["hedging"]["hedged"] += 1
+            if winner == "hedge":
+                self.summary["hedging"]["hedge_won"] += 1
+    
+    def log_llm_route(self, step: Optional[str], prompt_name: Optional[str],
+                      model: str, rejected: Optional[str], escalated: bool) -> None:
+        """
+        Log the fast model's attempt in a routed call.
+        
+        Args:
+            step: Pipeline step of the call
+            prompt_name: Prompt identifier
+            model: Fast model that produced the output
+            rejected: Validator's reason for rejecting the output, or None
+            escalated: Whether the call moved on to the stronger model
+        """
+        entry = {
+            "event": "llm_route",
+            "step": step,
+            "prompt_name": prompt_name,
+            "model": model,
+            "rejected": rejected,
+            "escalated": escalated,
+        }
+        self._write_log(entry)
+        
+        if escalated:
+            print(f"🔀 [{self.client_id}] {prompt_name or step}: {model} output rejected "
+                  f"({rejected}), escalating")
+        
+        with self._lock:
+            routing = self.summary["routing"].setdefault(
+                step or "unknown", {"routed": 0, "escalated": 0, "escalation_rate": 0.0}
+            )
+            routing["routed"] += 1
+            if escalated:
+                routing["escalated"] += 1
+            routing["escalation_rate"] = round(routing["escalated"] / routing["routed"], 3)
+    
+    def log_queue_wait(self, wait_seconds: float, priority: int = 0) -> None:
+        """Log how long the lead waited in the queue before it was claimed."""
+        entry = {
+            "event": "queue_wait",
+            "wait_seconds": round(wait_seconds, 1),
+            "priority": priority,
+        }
+        self._write_log(entry)
+        
+        self.summary["queue"] = {"wait_seconds": round(wait_seconds, 1), "priority": priority}
+        
+        print(f"⏳ [{self.client_id}] Waited {wait_seconds:.1f}s in queue (priority {priority})")
+    
     def log_info(self, message: str, details: Optional[Dict] = None) -> None:
         """Log an informational message."""
         entry = {
@@ -133,7 +320,7 @@ class PipelineLogger:
         Finalize the run and save summary.
         
         Args:
-            status: Final status (completed, failed, blocked)
+            status: Final status (completed, failed, blocked, lease_lost)
         """
         self.summary["completed_at"] = datetime.utcnow().isoformat()
         self.summary["status"] = status
@@ -152,7 +339,25 @@ class PipelineLogger:
         print(f"   Status: {status}")
         print(f"   Duration: {self.summary['total_duration_seconds']:.1f}s")
         print(f"   Steps completed: {len([s for s in self.summary['steps'] if s['status'] == 'completed'])}")
+        skipped = len([s for s in self.summary['steps'] if s['status'] == 'skipped'])
+        if skipped:
+            print(f"   Steps skipped (unchanged): {skipped}")
         print(f"   Errors: {len(self.summary['errors'])}")
+        cache = self.summary["llm_cache"]
+        usage = self.summary["usage"]["total"]
+        print(f"   Tokens: {usage['prompt_tokens']} prompt "
+              f"({usage['cached_tokens']} cached, {usage['cached_share']:.0%}), "
+              f"{usage['completion_tokens']} completion, ${usage['cost_usd']:.4f}")
+        print(f"   LLM cache: {cache['hits']} hits, {cache['misses']} misses, "
+              f"{cache['coalesced']} coalesced")
+        endpoints = self.summary["usage"]["endpoints"]
+        if len(endpoints) > 1:
+            for name, endpoint_usage in endpoints.items():
+                print(f"   Endpoint {name}: {endpoint_usage['calls']} calls, "
+                      f"{endpoint_usage['total_tokens']} tokens")
+        for step, routing in self.summary["routing"].items():
+            print(f"   Routing {step}: {routing['escalated']} of {routing['routed']} "
+                  f"escalated ({routing['escalation_rate']:.0%})")
 
 
 def setup_run_directory(client_id: str, base_dir: str = "runs") -> Path:
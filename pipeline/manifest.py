@@ -0,0 +1,327 @@
+"""
+Per-run manifest of completed steps.
+
+Each run directory keeps a ``manifest.json`` recording, for every
+completed step, content hashes of the files (and values, such as the lead
+description or the models used) it read and of the files it wrote, and
+the template and model versions its outputs were produced with. On
+resume a step is skipped while its inputs hash the same and every file
+it wrote is still present; from the first step that isn't, every step
+runs again. Outputs of a step whose inputs changed are deleted first, so
+LLM steps regenerate them instead of keeping the existing files; for
+multi-stage steps only the outputs depending on a changed input go.
+
+Steps write their files through the run context (pipeline.context); a
+step is recorded once its files are on disk, and nothing is recorded when
+the run context doesn't persist artifacts.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .logger import PipelineLogger
+from .context import get_run_context
+from .db import LeaseHeartbeat
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _hash_path(path: Path) -> Optional[str]:
+    """
+    Content hash of a file, or of every file in a directory (names and
+    contents, in order). In-progress ``.partial`` files are ignored.
+
+    Returns:
+        Hex digest, or None if the path doesn't exist
+    """
+    if path.is_file():
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    if path.is_dir():
+        digest = hashlib.sha256()
+        for file in sorted(p for p in path.rglob("*") if p.is_file() and p.suffix != ".partial"):
+            digest.update(str(file.relative_to(path)).encode("utf-8") + b"\0")
+            with open(file, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+    return None
+
+
+def _list_files(path: Path) -> List[str]:
+    """Finished files under a directory (relative names), or [] for a file."""
+    if not path.is_dir():
+        return []
+    return sorted(
+        str(p.relative_to(path)) for p in path.rglob("*") if p.is_file() and p.suffix != ".partial"
+    )
+
+
+class RunManifest:
+    """Step completion records of one run directory."""
+
+    def __init__(self, run_dir: Path):
+        """
+        Args:
+            run_dir: Run directory holding the manifest
+        """
+        self.run_dir = Path(run_dir)
+        self.path = self.run_dir / MANIFEST_FILE
+        self._lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    return data
+            except (OSError, json.JSONDecodeError):
+                pass
+        return {"version": MANIFEST_VERSION, "steps": {}}
+
+    def _save(self) -> None:
+        # Write-then-rename, so a crash never leaves a half-written manifest
+        tmp_path = self.path.with_name(MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _key(self, path: Path) -> str:
+        """Manifest key: relative to the run directory when inside it."""
+        try:
+            return str(path.relative_to(self.run_dir))
+        except ValueError:
+            return str(path)
+
+    def _in_run_dir(self, path: Path) -> bool:
+        try:
+            path.relative_to(self.run_dir)
+            return True
+        except ValueError:
+            return False
+
+    def versions(self, inputs: List[Path], values: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """
+        Versions a step's outputs are produced with: short content hashes
+        of its inputs outside the run directory (prompt templates) and its
+        models.
+        """
+        tags = {self._key(path): (_hash_path(path) or "missing")[:12]
+                for path in inputs if not self._in_run_dir(path)}
+        for name, value in (values or {}).items():
+            if (name == "model" or name.startswith("model:")) and value:
+                tags[name] = value
+        return tags
+
+    def fingerprint(self, paths: List[Path],
+                    values: Optional[Dict[str, str]] = None) -> Dict[str, Optional[str]]:
+        """Content hashes of the given paths and values."""
+        hashes = {self._key(path): _hash_path(path) for path in paths}
+        for name, value in (values or {}).items():
+            hashes[f"value:{name}"] = hashlib.sha256(str(value).encode("utf-8")).hexdigest()
+        return hashes
+
+    def changed_inputs(self, step: str, inputs: List[Path],
+                       values: Optional[Dict[str, str]] = None) -> List[str]:
+        """
+        Inputs (manifest keys) of a recorded step that hash differently now.
+
+        Values the entry has no hash for (recorded before they were
+        tracked, e.g. the model) are not compared.
+        """
+        entry = self.data["steps"].get(step)
+        if entry is None:
+            return []
+        return [
+            name for name, digest in self.fingerprint(inputs, values).items()
+            if entry["inputs"].get(name) != digest
+            and not (name.startswith("value:") and name not in entry["inputs"])
+        ]
+
+    def stale_reason(self, step: str, inputs: List[Path], outputs: List[Path],
+                     values: Optional[Dict[str, str]] = None) -> Optional[str]:
+        """
+        Why ``step`` has to run again (see changed_inputs).
+        
+        Returns:
+            None if the step completed with the same inputs and every file
+            it wrote is present, otherwise a short reason
+        """
+        entry = self.data["steps"].get(step)
+        if entry is None:
+            return "not completed"
+        changed = self.changed_inputs(step, inputs, values)
+        if changed:
+            return f"input changed: {changed[0]}"
+
+        for path in outputs:
+            name = self._key(path)
+            if not path.exists():
+                return f"output missing: {name}"
+            for file in entry["output_files"].get(name, []):
+                if not (path / file).is_file():
+                    return f"output missing: {name}/{file}"
+        return None
+
+    def record(self, step: str, inputs: List[Path], outputs: List[Path],
+               values: Optional[Dict[str, str]] = None, duration_ms: int = 0) -> None:
+        """
+        Record a completed step.
+
+        Input hashes are taken after the step ran, so steps that rewrite
+        their input in place (clean_json) stay valid on resume.
+        """
+        entry = {
+            "inputs": self.fingerprint(inputs, values),
+            "outputs": self.fingerprint(outputs),
+            "output_files": {self._key(path): _list_files(path) for path in outputs},
+            "versions": self.versions(inputs, values),
+            "completed_at": datetime.utcnow().isoformat(),
+            "duration_ms": duration_ms,
+        }
+        with self._lock:
+            self.data["steps"][step] = entry
+            self._save()
+
+    def produced_files(self, step: str, outputs: List[Path]) -> List[Path]:
+        """
+        Files a recorded step wrote: for each output directory the files
+        listed for it when the step was recorded, other outputs as they are.
+        """
+        entry = self.data["steps"].get(step)
+        if entry is None:
+            return []
+        files = []
+        for path in outputs:
+            if path.is_dir():
+                files.extend(path / name for name in entry["output_files"].get(self._key(path), []))
+            else:
+                files.append(path)
+        return files
+
+    def stale_steps(self, lead: Dict,
+                    step_io: Callable[[str, Dict, Path], Tuple[List[Path], List[Path], Dict[str, str]]]
+                    ) -> List[Tuple[str, str]]:
+        """
+        Completed steps that would run again on resume, e.g. because a
+        prompt template or model changed since they ran.
+        
+        Returns:
+            List of (step, reason), in the order the steps ran
+        """
+        stale = []
+        for step in list(self.data["steps"]):
+            reason = self.stale_reason(step, *step_io(step, lead, self.run_dir))
+            if reason is not None:
+                stale.append((step, reason))
+        return stale
+
+    def forget(self, step: str) -> None:
+        """Drop a step's record, e.g. before it runs again."""
+        with self._lock:
+            if self.data["steps"].pop(step, None) is not None:
+                self._save()
+
+
+class StepRunner:
+    """
+    Runs a lead's steps in order, skipping those the manifest shows as
+    current until the first step that has to run again.
+    """
+
+    def __init__(self, lead: Dict, run_dir: Path, logger: PipelineLogger,
+                 step_io: Callable[[str, Dict, Path], Tuple[List[Path], List[Path], Dict[str, str]]],
+                 resume: bool = True, lease: Optional[LeaseHeartbeat] = None,
+                 output_inputs: Optional[Callable[[str], Dict[str, List[str]]]] = None):
+        """
+        Args:
+            lead: Lead being processed
+            run_dir: Run directory of the lead
+            logger: Run logger
+            step_io: Returns a step's (input paths, output paths, other input
+                values), see pipeline.steps.step_io
+            resume: Skip steps the manifest shows as current; if False
+                every step runs (and is recorded)
+            lease: Heartbeat of the lead's claim; once the lease is lost
+                the next step raises LeaseLost instead of running
+            output_inputs: Returns the inputs each of a step's outputs
+                depends on, see pipeline.steps.step_output_inputs; outputs
+                that don't depend on a changed input are kept. Without it
+                every output of a step whose inputs changed is discarded
+        """
+        self.lead = lead
+        self.run_dir = run_dir
+        self.logger = logger
+        self.step_io = step_io
+        self.lease = lease
+        self.output_inputs = output_inputs
+        self.manifest = RunManifest(run_dir)
+        self.context = get_run_context(run_dir)
+        # Without artifacts on disk there is nothing to resume from
+        self.resume = resume and self.context.persist
+        self.rerun = not self.resume
+
+    def _affected(self, step: str, output: Path, inputs: List[Path],
+                  values: Dict[str, str]) -> bool:
+        """Whether ``output`` depends on an input of ``step`` that changed."""
+        depends = self.output_inputs(step) if self.output_inputs else {}
+        changed = set(self.manifest.changed_inputs(step, inputs, values))
+        known = set().union(*depends.values()) if depends else set()
+        if not changed or not changed <= known:
+            # Nothing to go on for an input no output is mapped to
+            return True
+        return bool(changed & set(depends.get(self.manifest._key(output), known)))
+
+    def run(self, step: str, fn: Callable[[Dict, Path, PipelineLogger], Any]) -> Any:
+        """
+        Run ``fn(lead, run_dir, logger)`` unless it can be skipped.
+
+        Args:
+            step: Step name in the manifest
+            fn: Step function
+
+        Returns:
+            The step's result, or None if it was skipped
+        
+        Raises:
+            LeaseLost: If the lead's lease was lost (another worker may own it)
+        """
+        if self.lease is not None:
+            self.lease.check(self.lead["id"])
+        inputs, outputs, values = self.step_io(step, self.lead, self.run_dir)
+        if self.resume:
+            reason = self.manifest.stale_reason(step, inputs, outputs, values)
+            if reason is None and not self.rerun:
+                self.logger.log_step_skipped(step, "unchanged")
+                return None
+            if reason is not None and reason.startswith("input changed"):
+                # Produced from other inputs (e.g. an older template or
+                # model): regenerate rather than reuse them. Only the files
+                # this step wrote go; others in the same directories stay
+                produced = [path for path in outputs if path not in inputs
+                            and self._affected(step, path, inputs, values)]
+                for path in self.manifest.produced_files(step, produced):
+                    self.context.discard(path)
+            if not self.rerun:
+                # Everything from here on runs again
+                self.rerun = True
+                if reason != "not completed":
+                    self.logger.log_info(f"Re-running from {step}: {reason}")
+
+        self.manifest.forget(step)
+        start_time = time.time()
+        result = fn(self.lead, self.run_dir, self.logger)
+        if self.context.persist:
+            # Hash the step's files once they are written
+            self.context.flush()
+            self.manifest.record(step, inputs, outputs, values,
+                                 duration_ms=int((time.time() - start_time) * 1000))
+        return result
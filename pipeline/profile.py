@@ -0,0 +1,117 @@
+"""
+Client profile produced by the input transform step.
+
+The step requests schema-constrained output (Structured Outputs), so the
+model can only answer with a JSON object of the shape below. The parsed
+profile is kept on the lead (``lead["input_transform"]``) and read from
+there by the plan and block steps.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, TypedDict
+
+
+class InputQuality(TypedDict):
+    skore: float
+    popis: str
+
+
+class Inference(TypedDict):
+    poznamky: List[str]
+
+
+class ClientProfile(TypedDict):
+    obor: str
+    seniorita: str
+    hlavni_cil: str
+    technologie: List[str]
+    platove_ocekavani: Optional[str]
+    kvalita_vstupu: InputQuality
+    inference: Inference
+    puvodni_text: str
+
+
+def _object(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Strict-mode object schema: every property required, nothing extra."""
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+# response_format["json_schema"] for the input transform request
+INPUT_TRANSFORM_SCHEMA = {
+    "name": "client_profile",
+    "strict": True,
+    "schema": _object({
+        "obor": {"type": "string"},
+        "seniorita": {"type": "string"},
+        "hlavni_cil": {"type": "string"},
+        "technologie": {"type": "array", "items": {"type": "string"}},
+        "platove_ocekavani": {"type": ["string", "null"]},
+        "kvalita_vstupu": _object({
+            "skore": {"type": "number"},
+            "popis": {"type": "string"},
+        }),
+        "inference": _object({
+            "poznamky": {"type": "array", "items": {"type": "string"}},
+        }),
+        "puvodni_text": {"type": "string"},
+    }),
+}
+
+# Fields the later steps depend on
+REQUIRED_FIELDS = ("obor", "seniorita", "hlavni_cil")
+
+# Stands in for a required field the client description doesn't give
+UNKNOWN_VALUE = "nezadáno"
+
+
+def check_profile(data: Any) -> ClientProfile:
+    """
+    Check the fields the plan and block steps use.
+
+    Sparse descriptions are normal input, so a missing or empty required
+    field becomes UNKNOWN_VALUE, as the prompt asks the model to write.
+
+    Args:
+        data: Parsed input transform output
+
+    Returns:
+        The profile, with surrounding whitespace stripped from its fields
+
+    Raises:
+        ValueError: If the profile or a field has the wrong type
+    """
+    if not isinstance(data, dict):
+        raise ValueError("profile is not a JSON object")
+
+    profile = dict(data)
+    for field in REQUIRED_FIELDS:
+        value = profile.get(field)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"profile field '{field}' is not a string")
+        profile[field] = (value or "").strip() or UNKNOWN_VALUE
+
+    technologie = profile.get("technologie", [])
+    if not isinstance(technologie, list) or not all(isinstance(t, str) for t in technologie):
+        raise ValueError("profile field 'technologie' is not a list of strings")
+    profile["technologie"] = [t.strip() for t in technologie if t.strip()]
+
+    return profile
+
+
+def parse_profile(text: str) -> ClientProfile:
+    """
+    Parse and check an input transform response.
+
+    Raises:
+        ValueError: If the response is not valid JSON or not a valid profile
+    """
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}") from e
+    return check_profile(data)
@@ -0,0 +1,271 @@
+"""
+Cross-process token-bucket rate limiter for the OpenAI API.
+
+Budgets requests and tokens per minute before each request is sent and
+adjusts to the x-ratelimit-* / retry-after response headers. Bucket state
+lives in a local SQLite database so every pipeline worker on the host
+draws from the same budget.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Mapping
+import dotenv
+
+dotenv.load_dotenv()
+
+# Account limits (0 disables the corresponding bucket)
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "0"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+
+# Fraction of the account limit workers may use together
+RATE_LIMIT_HEADROOM = float(os.getenv("RATE_LIMIT_HEADROOM", "0.9"))
+
+# Shared state database
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", ".cache/ratelimit.sqlite")
+
+# Longest single sleep while waiting, so header updates are picked up quickly
+MAX_WAIT_SLICE = 5.0
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Token buckets for requests and tokens per minute, shared via SQLite.
+
+    Both buckets refill continuously at limit/60 per second up to their
+    capacity. ``acquire`` blocks until both have room for the request.
+    """
+
+    def __init__(self, name: str = "default", rpm: int = OPENAI_RPM_LIMIT,
+                 tpm: int = OPENAI_TPM_LIMIT, db_path: str = RATE_LIMIT_DB):
+        """
+        Args:
+            name: Bucket name (one row per API key / endpoint)
+            rpm: Requests per minute limit (0 = unlimited)
+            tpm: Tokens per minute limit (0 = unlimited)
+            db_path: SQLite file shared by all processes on the host
+        """
+        self.name = name
+        self.rpm_capacity = rpm * RATE_LIMIT_HEADROOM
+        self.tpm_capacity = tpm * RATE_LIMIT_HEADROOM
+        self.db_path = db_path
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT PRIMARY KEY,
+                    requests REAL NOT NULL,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    blocked_until REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, requests, tokens, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (name, self.rpm_capacity, self.tpm_capacity, time.time()),
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _refill(self, row, now: float):
+        """Return bucket levels after refilling for the elapsed time."""
+        requests, tokens, updated_at, blocked_until = row
+        elapsed = max(0.0, now - updated_at)
+        if self.rpm_capacity:
+            requests = min(self.rpm_capacity, requests + elapsed * self.rpm_capacity / 60)
+        if self.tpm_capacity:
+            tokens = min(self.tpm_capacity, tokens + elapsed * self.tpm_capacity / 60)
+        return requests, tokens, blocked_until
+
+    def _transaction(self, fn):
+        """Run fn(requests, tokens, blocked_until, now) under an exclusive lock."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at, blocked_until FROM buckets WHERE name = ?",
+                (self.name,),
+            ).fetchone()
+            now = time.time()
+            requests, tokens, blocked_until = self._refill(row, now)
+            requests, tokens, blocked_until, result = fn(requests, tokens, blocked_until, now)
+            conn.execute(
+                "UPDATE buckets SET requests = ?, tokens = ?, updated_at = ?, blocked_until = ? "
+                "WHERE name = ?",
+                (requests, tokens, now, blocked_until, self.name),
+            )
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Block until one request and ``tokens`` tokens are available, then take them.
+
+        Args:
+            tokens: Estimated tokens for the request (prompt + max completion)
+
+        Returns:
+            Seconds spent waiting
+        """
+        if self.tpm_capacity:
+            # A single request larger than the bucket would never fit
+            tokens = min(tokens, self.tpm_capacity)
+
+        def take(req, tok, blocked_until, now):
+            if now < blocked_until:
+                return req, tok, blocked_until, blocked_until - now
+            wait = 0.0
+            if self.rpm_capacity and req < 1:
+                wait = max(wait, (1 - req) * 60 / self.rpm_capacity)
+            if self.tpm_capacity and tok < tokens:
+                wait = max(wait, (tokens - tok) * 60 / self.tpm_capacity)
+            if wait > 0:
+                return req, tok, blocked_until, wait
+            if self.rpm_capacity:
+                req -= 1
+            if self.tpm_capacity:
+                tok -= tokens
+            return req, tok, blocked_until, 0.0
+
+        waited = 0.0
+        while True:
+            wait = self._transaction(take)
+            if wait <= 0:
+                return waited
+            wait = min(wait, MAX_WAIT_SLICE)
+            time.sleep(wait)
+            waited += wait
+
+    def headroom(self) -> float:
+        """Fraction of the buckets currently available (0 while blocked)."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at, blocked_until FROM buckets WHERE name = ?",
+                (self.name,),
+            ).fetchone()
+        finally:
+            conn.close()
+        now = time.time()
+        requests, tokens, blocked_until = self._refill(row, now)
+        if now < blocked_until:
+            return 0.0
+        levels = []
+        if self.rpm_capacity:
+            levels.append(max(0.0, requests / self.rpm_capacity))
+        if self.tpm_capacity:
+            levels.append(max(0.0, tokens / self.tpm_capacity))
+        return min(levels, default=1.0)
+
+    def refund(self, tokens: int) -> None:
+        """Return unused reserved tokens (e.g. when usage was below max_tokens)."""
+        if not self.tpm_capacity or tokens <= 0:
+            return
+
+        def give(req, tok, blocked_until, now):
+            return req, min(self.tpm_capacity, tok + tokens), blocked_until, None
+
+        self._transaction(give)
+
+    def block_for(self, seconds: float) -> None:
+        """Pause all workers sharing this bucket for ``seconds``."""
+        def block(req, tok, blocked_until, now):
+            return req, tok, max(blocked_until, now + seconds), None
+
+        self._transaction(block)
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """
+        Align the buckets with the server's view of the remaining quota.
+
+        Reads x-ratelimit-remaining-requests / -tokens (the server is
+        authoritative when it reports less than we think is left) and
+        retry-after (pauses everyone sharing the bucket).
+        """
+        if not headers:
+            return
+
+        remaining_requests = _parse_number(headers.get("x-ratelimit-remaining-requests"))
+        remaining_tokens = _parse_number(headers.get("x-ratelimit-remaining-tokens"))
+        retry_after = parse_retry_after(headers)
+
+        def update(req, tok, blocked_until, now):
+            if remaining_requests is not None and self.rpm_capacity:
+                req = min(req, remaining_requests)
+            if remaining_tokens is not None and self.tpm_capacity:
+                tok = min(tok, remaining_tokens)
+            if retry_after:
+                blocked_until = max(blocked_until, now + retry_after)
+            return req, tok, blocked_until, None
+
+        self._transaction(update)
+
+
+def _parse_number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse OpenAI reset durations such as "1s", "6m0s" or "20ms" into seconds.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Seconds to wait according to retry-after-ms / retry-after headers.
+    """
+    if not headers:
+        return None
+    retry_after_ms = _parse_number(headers.get("retry-after-ms"))
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    return parse_duration(headers.get("retry-after"))
+
+
+def get_rate_limiter(name: str = "default") -> Optional[RateLimiter]:
+    """
+    Process-wide limiter for ``name``, or None when no limits are configured.
+    """
+    if not OPENAI_RPM_LIMIT and not OPENAI_TPM_LIMIT:
+        return None
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = RateLimiter(name)
+        return _limiters[name]
@@ -0,0 +1,272 @@
+"""
+Retry policy for OpenAI API calls.
+
+Classifies errors, backs off exponentially with full jitter, honours
+Retry-After and trips a circuit breaker when the upstream keeps failing.
+The breaker state lives in the rate limiter's SQLite database, so while it
+is open every pipeline worker on the host avoids that endpoint, or waits
+out the cool-down when there is no other, instead of burning its retries
+and blocking its lead.
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+import dotenv
+import httpx
+import openai
+
+from .ratelimit import RATE_LIMIT_DB, MAX_WAIT_SLICE, parse_retry_after
+
+dotenv.load_dotenv()
+
+# Attempts per request and backoff bounds (seconds)
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "60"))
+
+# Consecutive upstream failures that open the circuit (0 disables), and its cool-down
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("OPENAI_CIRCUIT_THRESHOLD", "8"))
+CIRCUIT_COOLDOWN = float(os.getenv("OPENAI_CIRCUIT_COOLDOWN", "60"))
+
+# Error classes
+FATAL = "fatal"              # auth, invalid request, exhausted quota - never retried
+RATE_LIMITED = "rate_limited"  # 429 - wait (Retry-After) and retry
+UPSTREAM = "upstream"        # 5xx, timeouts, dropped connections - counts towards the breaker
+OTHER = "other"              # anything else - retried with backoff
+
+# Statuses worth retrying besides 429 and 5xx
+RETRYABLE_STATUSES = {408, 409}
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def classify_error(error: Exception) -> str:
+    """Sort an exception from an API call into one of the error classes."""
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        # Out of credit rather than over the rate - waiting won't help
+        if getattr(error, "code", None) == "insufficient_quota":
+            return FATAL
+        return RATE_LIMITED
+    if status is not None:
+        if status >= 500 or status in RETRYABLE_STATUSES:
+            return UPSTREAM
+        return FATAL
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return UPSTREAM
+    return OTHER
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given attempt (0-based)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive upstream failures across processes via SQLite.
+
+    After ``threshold`` failures in a row the circuit opens: ``wait`` blocks
+    every caller until the cool-down has passed. Requests then resume; the
+    first success closes the circuit, while a failure before that reopens
+    it immediately.
+    """
+
+    def __init__(self, name: str = "default", threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 cooldown: float = CIRCUIT_COOLDOWN, db_path: str = RATE_LIMIT_DB):
+        """
+        Args:
+            name: Circuit name (one row per API key / endpoint)
+            threshold: Consecutive upstream failures that open the circuit
+            cooldown: Seconds the circuit stays open
+            db_path: SQLite file shared by all processes on the host
+        """
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.db_path = db_path
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS circuits (
+                    name TEXT PRIMARY KEY,
+                    failures INTEGER NOT NULL DEFAULT 0,
+                    open_until REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute("INSERT OR IGNORE INTO circuits (name) VALUES (?)", (name,))
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def open_for(self) -> float:
+        """Seconds until the circuit closes (0 when closed)."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT open_until FROM circuits WHERE name = ?", (self.name,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return max(0.0, row[0] - time.time())
+
+    def wait(self) -> float:
+        """
+        Block while the circuit is open.
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            remaining = self.open_for()
+            if remaining <= 0:
+                return waited
+            wait = min(remaining, MAX_WAIT_SLICE)
+            time.sleep(wait)
+            waited += wait
+
+    def record_success(self) -> None:
+        """Close the circuit."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE circuits SET failures = 0 WHERE name = ? AND failures > 0",
+                (self.name,),
+            )
+        finally:
+            conn.close()
+
+    def record_failure(self) -> bool:
+        """
+        Count an upstream failure, opening the circuit at the threshold.
+
+        Returns:
+            True if this failure opened the circuit
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            failures, open_until = conn.execute(
+                "SELECT failures, open_until FROM circuits WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            failures += 1
+            opened = failures >= self.threshold and open_until <= now
+            if opened:
+                open_until = now + self.cooldown
+            conn.execute(
+                "UPDATE circuits SET failures = ?, open_until = ? WHERE name = ?",
+                (failures, open_until, self.name),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        if opened:
+            print(f"   🔌 Circuit {self.name} open after {failures} upstream failures, "
+                  f"cooling down for {self.cooldown:.0f}s")
+        return opened
+
+
+def get_circuit_breaker(name: str = "default") -> Optional[CircuitBreaker]:
+    """Process-wide circuit breaker for ``name``, or None when disabled."""
+    if CIRCUIT_FAILURE_THRESHOLD <= 0:
+        return None
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+class RetryPolicy:
+    """
+    Retry loop helper for one request.
+
+    Each attempt reports to the endpoint it used (anything with ``limiter``
+    and ``breaker`` attributes, see pipeline.endpoints), so rate-limit pauses
+    and upstream failures are charged to that endpoint only.
+
+    Usage::
+
+        policy = RetryPolicy()
+        for attempt in policy.attempts():
+            endpoint = pool.choose()
+            try:
+                ...
+                policy.succeeded(endpoint)
+                return result
+            except Exception as e:
+                policy.failed(e, attempt, endpoint)
+    """
+
+    def __init__(self, max_retries: int = OPENAI_MAX_RETRIES):
+        """
+        Args:
+            max_retries: Attempts before giving up
+        """
+        self.max_retries = max_retries
+
+    def attempts(self) -> range:
+        """Attempt numbers (0-based)."""
+        return range(self.max_retries)
+
+    def succeeded(self, endpoint) -> None:
+        """Report a successful attempt."""
+        if endpoint.breaker:
+            endpoint.breaker.record_success()
+
+    def failed(self, error: Exception, attempt: int, endpoint) -> None:
+        """
+        Handle a failed attempt: back off before the next one, or raise.
+
+        Raises:
+            The original error if it is not retryable
+            RuntimeError: After the last attempt
+        """
+        kind = classify_error(error)
+        if kind == FATAL:
+            raise error
+
+        if kind == UPSTREAM and endpoint.breaker:
+            endpoint.breaker.record_failure()
+
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        retry_after = parse_retry_after(headers)
+        last_attempt = attempt >= self.max_retries - 1
+        limiter = endpoint.limiter
+
+        if kind == RATE_LIMITED:
+            wait_time = retry_after or backoff_delay(attempt + 1)
+            print(f"   ⚠️ Rate limited, waiting {wait_time:.1f}s...")
+            if limiter:
+                # Pause everyone sharing the bucket; our next acquire waits too
+                limiter.update_from_headers(headers)
+                limiter.block_for(wait_time)
+            elif not last_attempt:
+                time.sleep(wait_time)
+        elif not last_attempt:
+            wait_time = retry_after or backoff_delay(attempt)
+            print(f"   ⚠️ API error (attempt {attempt + 1}): {error}, "
+                  f"retrying in {wait_time:.1f}s")
+            time.sleep(wait_time)
+
+        if last_attempt:
+            raise RuntimeError(
+                f"OpenAI API failed after {self.max_retries} retries: {error}"
+            ) from error
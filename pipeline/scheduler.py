@@ -0,0 +1,183 @@
+"""
+Block-level DAG scheduler.
+
+Runs the per-block part of the pipeline without stage barriers: each
+block moves to its next step as soon as that step's inputs are ready, so
+block 1's HTML doesn't wait for block 15's expansion and the local steps
+(wrap, JSON, clean, upload) run while LLM calls are in flight. A lead then
+takes about as long as its slowest block chain rather than the sum of the
+slowest block of every stage.
+
+Steps are nodes that declare their input and output files; a node depends
+on the earlier nodes that produce its inputs.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .logger import PipelineLogger
+from .llm import OPENAI_BATCH_CONCURRENCY
+
+from processors.block_parser import block_index
+
+# Workers for local (non-LLM) nodes
+DAG_CPU_WORKERS = int(os.getenv("DAG_CPU_WORKERS", "2"))
+
+
+class Node:
+    """One per-block step with declared input and output files."""
+
+    def __init__(self, name: str, run: Callable[[List[Path], List[Path]], Any],
+                 inputs: List[str], outputs: List[str], llm: bool = False):
+        """
+        Args:
+            name: Step name, used for logging and the run summary
+            run: Called with the block's input and output paths; raises on failure
+            inputs: Input paths relative to the run directory, where
+                "{block}" is the block's prompt file name and "{index}" its number
+            outputs: Output paths, with the same placeholders
+            llm: Run on the LLM worker pool instead of the local one
+        """
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.llm = llm
+
+    def resolve(self, paths: List[str], run_dir: Path, block: str) -> List[Path]:
+        """Paths for one block."""
+        return [run_dir / path.format(block=block, index=block_index(block)) for path in paths]
+
+
+class BlockScheduler:
+    """Runs a chain of nodes for every block, each block independently."""
+
+    def __init__(self, nodes: List[Node], llm_workers: Optional[int] = None,
+                 cpu_workers: int = DAG_CPU_WORKERS):
+        """
+        Args:
+            nodes: Nodes in pipeline order
+            llm_workers: Max LLM nodes in flight (default: OPENAI_BATCH_CONCURRENCY)
+            cpu_workers: Max local nodes in flight
+        """
+        self.nodes = nodes
+        self.llm_workers = llm_workers or OPENAI_BATCH_CONCURRENCY
+        self.cpu_workers = cpu_workers
+        self.dependencies = self._dependencies()
+
+    def _dependencies(self) -> List[Set[int]]:
+        """For each node, the earlier nodes producing its inputs (latest producer wins)."""
+        dependencies = []
+        for j, node in enumerate(self.nodes):
+            producers = set()
+            for path in node.inputs:
+                for i in range(j - 1, -1, -1):
+                    if path in self.nodes[i].outputs:
+                        producers.add(i)
+                        break
+            dependencies.append(producers)
+        return dependencies
+
+    def run(self, blocks: List[str], run_dir: Path, logger: PipelineLogger,
+            on_node_complete: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """
+        Run every node for every block.
+
+        Ready tasks closest to the end of the chain go first, so early
+        blocks finish early. A failed node stops its block's chain; the
+        other blocks carry on.
+
+        Args:
+            blocks: Block prompt file names, in priority order
+            run_dir: Run directory the node paths are relative to
+            logger: Run logger; each node is logged as a step spanning all blocks
+            on_node_complete: Called with a node's name once it has succeeded
+                for every block
+
+        Returns:
+            Summary dict with block counts, failures and duration
+        """
+        start_time = time.time()
+        pending: Set[Tuple[int, int]] = {
+            (b, j) for b in range(len(blocks)) for j in range(len(self.nodes))
+        }
+        done: Set[Tuple[int, int]] = set()
+        failed: Dict[str, str] = {}
+        remaining = [len(blocks)] * len(self.nodes)
+        succeeded = [0] * len(self.nodes)
+        started: Dict[int, float] = {}
+        inflight: Dict[Any, Tuple[int, int]] = {}
+        busy = {True: 0, False: 0}
+        capacity = {True: self.llm_workers, False: self.cpu_workers}
+
+        def finish_node(j: int, success: bool) -> None:
+            remaining[j] -= 1
+            if success:
+                succeeded[j] += 1
+            if remaining[j] == 0 and j in started:
+                node = self.nodes[j]
+                logger.log_step_complete(node.name, int((time.time() - started[j]) * 1000))
+                if succeeded[j] == len(blocks) and on_node_complete:
+                    on_node_complete(node.name)
+
+        llm_pool = ThreadPoolExecutor(max_workers=self.llm_workers, thread_name_prefix="dag-llm")
+        cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="dag-cpu")
+        try:
+            while pending or inflight:
+                ready = sorted(
+                    (task for task in pending
+                     if all((task[0], d) in done for d in self.dependencies[task[1]])),
+                    key=lambda task: (-task[1], task[0]),
+                )
+                for b, j in ready:
+                    node = self.nodes[j]
+                    if busy[node.llm] >= capacity[node.llm]:
+                        continue
+                    if j not in started:
+                        started[j] = time.time()
+                        logger.log_step_start(node.name, {"blocks": len(blocks)})
+                    pool = llm_pool if node.llm else cpu_pool
+                    future = pool.submit(
+                        node.run,
+                        node.resolve(node.inputs, run_dir, blocks[b]),
+                        node.resolve(node.outputs, run_dir, blocks[b]),
+                    )
+                    pending.discard((b, j))
+                    inflight[future] = (b, j)
+                    busy[node.llm] += 1
+
+                if not inflight:
+                    # Nothing runnable: the rest depends on failed nodes
+                    break
+
+                finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    b, j = inflight.pop(future)
+                    node = self.nodes[j]
+                    busy[node.llm] -= 1
+                    try:
+                        future.result()
+                    except Exception as exc:
+                        failed[blocks[b]] = f"{node.name}: {exc}"
+                        logger.log_info(f"❌ {blocks[b]} failed at {node.name}: {exc}")
+                        finish_node(j, False)
+                        # Drop the rest of this block's chain
+                        for rest in [task for task in pending if task[0] == b]:
+                            pending.discard(rest)
+                            finish_node(rest[1], False)
+                        continue
+                    done.add((b, j))
+                    finish_node(j, True)
+        finally:
+            llm_pool.shutdown(wait=True)
+            cpu_pool.shutdown(wait=True)
+
+        return {
+            "blocks": len(blocks),
+            "succeeded": len(blocks) - len(failed),
+            "failed": failed,
+            "duration_ms": int((time.time() - start_time) * 1000),
+        }
@@ -3,34 +3,150 @@ Pipeline Steps
 
 Each function implements one step of the career-plan generation pipeline.
 Uses OpenAI API for all LLM interactions.
+
+Steps pass their results to the following steps through the run context
+(pipeline.context), which keeps them in memory and writes them to the run
+directory in the background.
 """
 
-import json
 import time
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 
 from .db import update_lead_field, mark_status
 from .db import STATUS_PLAN_READY, STATUS_HTML_READY
 from .logger import PipelineLogger
-from .llm import call_llm, process_prompt_batch
+from .llm import call_llm, process_prompt_batch, generate_file, route_models
+from .context import RunContext, get_run_context
+from .scheduler import BlockScheduler, Node
+from .profile import ClientProfile, INPUT_TRANSFORM_SCHEMA, check_profile, parse_profile
+from .validation import validate_profile, validate_block_text, validate_block_html, validate_plan_blocks
 
 # Import processors
-from processors.block_parser import parse_plan_blocks, fill_expand_template, load_expand_template
-from processors.html_wrapper import wrap_directory
-from processors.html_to_json import transform_html_directory
-from processors.json_cleaner import clean_json_directory
-from processors.uploader import upload_from_directory
+from processors.block_parser import parse_plan_blocks, fill_expand_template, load_expand_template, block_index
+from processors.html_wrapper import load_template, wrap_with_html_template, fuse_with_html_template
+from processors.html_to_json import transform_html_to_json, json_file_name
+from processors.json_cleaner import clean_markdown_artifacts
+from processors.uploader import upload_named_pages, upload_single_page, extract_page_index
 
 
-def run_input_transform(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
+# System prompts, shared by the synchronous steps and the batch mode
+INPUT_TRANSFORM_SYSTEM_PROMPT = "You are a career counselor assistant. Analyze the input and return structured JSON only."
+PLAN_SYSTEM_PROMPT = "You are an expert career counselor. Generate a comprehensive 15-step career plan with <blok-n> tags as specified."
+STAGE2_SYSTEM_PROMPT = "You are an expert career counselor. Expand the given career plan section with detailed, actionable content in Czech."
+STAGE3_SYSTEM_PROMPT = "You are a UI/HTML expert. Transform the input into semantic HTML with data-ui attributes. Output only valid HTML, no markdown, no explanations."
+FUSED_SYSTEM_PROMPT = "You are an expert career counselor and UI/HTML expert. Write the requested career plan section with detailed, actionable content in Czech and output it as semantic HTML with data-ui attributes. Output only valid HTML, no markdown, no explanations."
+
+
+# LLM steps run by each manifest step, for its "model" input value (one
+# "model:<llm step>" value each for steps with several)
+STEP_LLM_STEPS = {
+    "input_transform": ["input_transform"],
+    "plan_prompt": ["plan_prompt"],
+    "stage2_expand": ["stage2_expand"],
+    "stage3_html": ["stage3_html"],
+    "fused_html": ["fused_html"],
+    "blocks_dag": ["stage2_expand", "stage3_html"],
+    "fused_blocks_dag": ["fused_html"],
+}
+
+
+def step_models(step: str) -> str:
     """
-    Step 1: Input transform prompt.
-    Converts raw client description into structured JSON.
+    Models a step's LLM calls are routed to, e.g.
+    "stage3_html=gpt-4o-mini/gpt-4o" ("" for local steps).
     """
-    logger.log_step_start("input_transform", {"description_length": len(lead.get("description", ""))})
-    start_time = time.time()
+    return "; ".join(f"{llm_step}={'/'.join(route_models(llm_step))}"
+                     for llm_step in STEP_LLM_STEPS.get(step, []))
+
+
+# Inputs (manifest keys) each output of a multi-stage step is produced
+# from; when only some of a step's inputs changed, the outputs that don't
+# depend on them are kept (e.g. the DAG's expansions when only
+# html_transform.txt or the stage 3 model changed)
+STEP_OUTPUT_INPUTS = {
+    "blocks_dag": {
+        "stage_2_generated_parts": ["parsed_parts", "value:model:stage2_expand"],
+        "stage_2_prepared_html": ["parsed_parts", "value:model:stage2_expand",
+                                  "prompts/html_transform.txt"],
+        "stage_3_generated_html": ["parsed_parts", "value:model:stage2_expand",
+                                   "prompts/html_transform.txt", "value:model:stage3_html"],
+        "transformed": ["parsed_parts", "value:model:stage2_expand",
+                        "prompts/html_transform.txt", "value:model:stage3_html"],
+    },
+    "fused_blocks_dag": {
+        "stage_2_prepared_html": ["parsed_parts", "prompts/html_transform.txt"],
+        "stage_3_generated_html": ["parsed_parts", "prompts/html_transform.txt", "value:model"],
+        "transformed": ["parsed_parts", "prompts/html_transform.txt", "value:model"],
+    },
+}
+
+
+def step_output_inputs(step: str) -> Dict[str, List[str]]:
+    """
+    Inputs each output of a step depends on, keyed by output name ({} for
+    steps whose outputs all depend on every input).
+    """
+    return STEP_OUTPUT_INPUTS.get(step, {})
+
+
+def step_io(step: str, lead: Dict, run_dir: Path) -> Tuple[List[Path], List[Path], Dict[str, str]]:
+    """
+    What a step reads and writes, for the run manifest (pipeline.manifest).
+    
+    Prompt templates are inputs of the steps that fill them in, and LLM
+    steps have the models they are routed to as a "model" value (one
+    "model:<llm step>" value per LLM step for the DAG, so its stages go
+    stale separately), so a changed template or model makes the steps it
+    affects stale.
+    
+    Returns:
+        Tuple of (input paths, output paths, other input values)
+    """
+    prompts = Path("prompts")
+    io = {
+        "input_transform": ([prompts / "input_transform.txt"],
+                            [run_dir / "input_transform" / "output.json"]),
+        "plan_prompt": ([run_dir / "input_transform" / "output.json", prompts / "init_plan.txt"],
+                        [run_dir / "plan" / "plan.txt"]),
+        "generate_blocks": ([run_dir / "plan" / "plan.txt", run_dir / "input_transform" / "output.json",
+                             prompts / "expand.txt"],
+                            [run_dir / "parsed_parts"]),
+        "stage2_expand": ([run_dir / "parsed_parts"], [run_dir / "stage_2_generated_parts"]),
+        "prep_html": ([run_dir / "stage_2_generated_parts", prompts / "html_transform.txt"],
+                      [run_dir / "stage_2_prepared_html"]),
+        "stage3_html": ([run_dir / "stage_2_prepared_html"], [run_dir / "stage_3_generated_html"]),
+        "prep_fused": ([run_dir / "parsed_parts", prompts / "html_transform.txt"],
+                       [run_dir / "stage_2_prepared_html"]),
+        "fused_html": ([run_dir / "stage_2_prepared_html"], [run_dir / "stage_3_generated_html"]),
+        "blocks_dag": ([run_dir / "parsed_parts", prompts / "html_transform.txt"],
+                       [run_dir / "stage_2_generated_parts", run_dir / "stage_2_prepared_html",
+                        run_dir / "stage_3_generated_html", run_dir / "transformed"]),
+        "fused_blocks_dag": ([run_dir / "parsed_parts", prompts / "html_transform.txt"],
+                             [run_dir / "stage_2_prepared_html", run_dir / "stage_3_generated_html",
+                              run_dir / "transformed"]),
+        "html_to_json": ([run_dir / "stage_3_generated_html"], [run_dir / "transformed"]),
+        "clean_json": ([run_dir / "transformed"], [run_dir / "transformed"]),
+        "upload_pages": ([run_dir / "transformed"], []),
+    }
+    inputs, outputs = io[step]
+    values = {"description": lead.get("description", "")} if step == "input_transform" else {}
+    llm_steps = STEP_LLM_STEPS.get(step, [])
+    if len(llm_steps) == 1:
+        values["model"] = step_models(step)
+    else:
+        for llm_step in llm_steps:
+            values[f"model:{llm_step}"] = "/".join(route_models(llm_step))
+    return inputs, outputs, values
+
+
+def build_input_transform_prompt(lead: Dict, run_dir: Path) -> str:
+    """
+    Fill the input transform template and save it to the run directory.
     
+    Returns:
+        The filled prompt text
+    """
     # Load template
     template_path = Path("prompts/input_transform.txt")
     with open(template_path, "r", encoding="utf-8") as f:
@@ -40,34 +156,65 @@ def run_input_transform(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Di
     prompt = template.replace("[VSTUP]", lead.get("description", ""))
     
     # Save prompt to run directory
+    get_run_context(run_dir).put_text("input_transform/prompt.txt", prompt)
+    
+    return prompt
+
+
+def save_input_transform(lead: Dict, run_dir: Path, logger: PipelineLogger,
+                         response: str) -> ClientProfile:
+    """
+    Save the input transform response, store the parsed profile in the
+    database and keep it on the lead for the following steps.
+    
+    Returns:
+        The parsed client profile
+        
+    Raises:
+        RuntimeError: If the response is not a valid client profile
+    """
+    # Save response
+    get_run_context(run_dir).put_text("input_transform/output.json", response)
+    
+    # Fail the step rather than planning from an empty profile
+    try:
+        profile = parse_profile(response)
+    except ValueError as e:
+        raise RuntimeError(f"Input transform returned an invalid profile: {e}") from e
+    
+    update_lead_field(lead["id"], "input_transform", profile)
+    lead["input_transform"] = profile
+    logger.log_info("Input transform result stored in database")
+    
+    return profile
+
+
+def run_input_transform(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
+    """
+    Step 1: Input transform prompt.
+    Converts raw client description into structured JSON.
+    """
+    logger.log_step_start("input_transform", {"description_length": len(lead.get("description", ""))})
+    start_time = time.time()
+    
+    prompt = build_input_transform_prompt(lead, run_dir)
     prompt_path = run_dir / "input_transform" / "prompt.txt"
-    prompt_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(prompt_path, "w", encoding="utf-8") as f:
-        f.write(prompt)
     
     # Call OpenAI API
     logger.log_info("Calling OpenAI API for input transform...")
     
     response = call_llm(
         prompt=prompt,
-        system_prompt="You are a career counselor assistant. Analyze the input and return structured JSON only.",
-        json_mode=True
+        system_prompt=INPUT_TRANSFORM_SYSTEM_PROMPT,
+        json_schema=INPUT_TRANSFORM_SCHEMA,
+        logger=logger,
+        step="input_transform",
+        prompt_name="input_transform",
+        validator=validate_profile,
     )
     
-    # Save response
+    result_json = save_input_transform(lead, run_dir, logger, response)
     output_path = run_dir / "input_transform" / "output.json"
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(response)
-    
-    # Parse and store in database
-    try:
-        result_json = json.loads(response)
-        update_lead_field(lead["id"], "input_transform", result_json)
-        logger.log_info("Input transform result stored in database")
-    except json.JSONDecodeError:
-        logger.log_info("Response is not valid JSON, storing as text")
-        result_json = {"raw": response}
-        update_lead_field(lead["id"], "input_transform", result_json)
     
     duration_ms = int((time.time() - start_time) * 1000)
     logger.log_step_complete("input_transform", duration_ms, str(output_path))
@@ -80,28 +227,20 @@ def run_input_transform(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Di
     }
 
 
-def run_plan_prompt(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
+def build_plan_prompt(lead: Dict, run_dir: Path) -> str:
     """
-    Step 2: Plan synthesis prompt.
-    Generates the 15-block master plan.
-    """
-    logger.log_step_start("plan_prompt")
-    start_time = time.time()
+    Fill the plan template with the input transform context and save it.
     
+    Returns:
+        The filled prompt text
+    """
     # Load template
     template_path = Path("prompts/init_plan.txt")
     with open(template_path, "r", encoding="utf-8") as f:
         template = f.read()
     
-    # Get input transform data (reload from file to ensure fresh data)
-    input_transform_path = run_dir / "input_transform" / "output.json"
-    input_data = {}
-    if input_transform_path.exists():
-        with open(input_transform_path, "r", encoding="utf-8") as f:
-            try:
-                input_data = json.load(f)
-            except json.JSONDecodeError:
-                pass
+    # Get the client profile from the input transform step
+    input_data = load_input_data(lead, run_dir)
     
     # Build context from input_transform
     context_parts = []
@@ -124,31 +263,56 @@ def run_plan_prompt(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
         prompt = prompt + f"\n\n### KONTEXT KLIENTA:\n{context}"
     
     # Save prompt
-    prompt_path = run_dir / "plan" / "prompt.txt"
-    prompt_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(prompt_path, "w", encoding="utf-8") as f:
-        f.write(prompt)
+    get_run_context(run_dir).put_text("plan/prompt.txt", prompt)
     
-    # Call OpenAI API
-    logger.log_info("Calling OpenAI API for plan generation...")
-    
-    response = call_llm(
-        prompt=prompt,
-        system_prompt="You are an expert career counselor. Generate a comprehensive 15-step career plan with <blok-n> tags as specified.",
-        max_tokens=8000,
-    )
+    return prompt
+
+
+def save_plan(lead: Dict, run_dir: Path, logger: PipelineLogger, response: str) -> Path:
+    """
+    Save the plan response, store it in the database and mark PLAN_READY.
     
+    Returns:
+        Path to the saved plan file
+    """
     # Save response
     output_path = run_dir / "plan" / "plan.txt"
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(response)
+    get_run_context(run_dir).put_text(output_path, response)
     
     # Store in database
     update_lead_field(lead["id"], "plan", response)
     logger.log_info("Plan text stored in database")
     
     # Update status
-    mark_status(lead["id"], STATUS_PLAN_READY)
+    mark_status(lead["id"], STATUS_PLAN_READY, worker_id=lead.get("claimed_by"))
+    
+    return output_path
+
+
+def run_plan_prompt(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
+    """
+    Step 2: Plan synthesis prompt.
+    Generates the 15-block master plan.
+    """
+    logger.log_step_start("plan_prompt")
+    start_time = time.time()
+    
+    prompt = build_plan_prompt(lead, run_dir)
+    prompt_path = run_dir / "plan" / "prompt.txt"
+    
+    # Call OpenAI API
+    logger.log_info("Calling OpenAI API for plan generation...")
+    
+    response = call_llm(
+        prompt=prompt,
+        system_prompt=PLAN_SYSTEM_PROMPT,
+        logger=logger,
+        step="plan_prompt",
+        prompt_name="plan",
+        validator=validate_plan_blocks,
+    )
+    
+    output_path = save_plan(lead, run_dir, logger, response)
     
     duration_ms = int((time.time() - start_time) * 1000)
     logger.log_step_complete("plan_prompt", duration_ms, str(output_path))
@@ -157,10 +321,34 @@ def run_plan_prompt(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
         "prompt_path": str(prompt_path),
         "output_path": str(output_path),
         "response_length": len(response),
-        "input_data": input_data,
+        "input_data": load_input_data(lead, run_dir),
     }
 
 
+def load_input_data(lead: Dict, run_dir: Path) -> Dict:
+    """
+    Client profile from the input transform step.
+    
+    Uses the profile kept on the lead (set by save_input_transform, or
+    loaded from the database on resume), falling back to the step output
+    in the run context.
+    
+    Returns:
+        The client profile, or {} if neither holds a valid one
+    """
+    try:
+        return check_profile(lead.get("input_transform"))
+    except ValueError:
+        pass
+    
+    try:
+        profile = parse_profile(get_run_context(run_dir).get_text("input_transform/output.json"))
+    except (FileNotFoundError, ValueError):
+        return {}
+    lead["input_transform"] = profile
+    return profile
+
+
 def generate_blocks(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     """
     Step 3: Parse plan into individual block prompts.
@@ -168,13 +356,11 @@ def generate_blocks(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     logger.log_step_start("generate_blocks")
     start_time = time.time()
     
-    plan_path = run_dir / "plan" / "plan.txt"
+    context = get_run_context(run_dir)
     output_dir = run_dir / "parsed_parts"
-    output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Read plan
-    with open(plan_path, "r", encoding="utf-8") as f:
-        plan_text = f.read()
+    # Plan from the previous step
+    plan_text = context.get_text("plan/plan.txt")
     
     # Parse blocks
     blocks = parse_plan_blocks(plan_text)
@@ -183,14 +369,7 @@ def generate_blocks(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
         raise RuntimeError("No blocks found in plan")
     
     # Get client data from input_transform
-    input_transform_path = run_dir / "input_transform" / "output.json"
-    input_data = {}
-    if input_transform_path.exists():
-        with open(input_transform_path, "r", encoding="utf-8") as f:
-            try:
-                input_data = json.load(f)
-            except json.JSONDecodeError:
-                pass
+    input_data = load_input_data(lead, run_dir)
     
     # Extract client parameters
     obor = input_data.get("obor", "nezadáno")
@@ -211,8 +390,7 @@ def generate_blocks(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
         )
         
         output_path = output_dir / f"prompt_block_{block_number}.txt"
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(filled)
+        context.put_text(output_path, filled)
         
         generated_files.append(str(output_path))
         logger.log_info(f"Generated block {block_number}")
@@ -228,6 +406,22 @@ def generate_blocks(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     }
 
 
+def _stage_prompts(context: RunContext, input_dir: str, pattern: str) -> Dict[str, str]:
+    """Prompt texts of a stage by file name, from the run context."""
+    return {name: context.get_text(f"{input_dir}/{name}") for name in context.names(input_dir, pattern)}
+
+
+def _keep_responses(context: RunContext, output_dir: str, results: Dict) -> None:
+    """
+    Keep a stage's LLM outputs in the run context for the next step.
+    The LLM layer has already written them, so they aren't written again.
+    """
+    for file_result in results.get("files", []):
+        response = file_result.pop("response", None)
+        if response is not None:
+            context.put_text(f"{output_dir}/{file_result['name']}", response, persist=False)
+
+
 def run_stage2(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     """
     Step 4: Expand block prompts via OpenAI API.
@@ -235,6 +429,7 @@ def run_stage2(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     logger.log_step_start("stage2_expand")
     start_time = time.time()
     
+    context = get_run_context(run_dir)
     input_dir = run_dir / "parsed_parts"
     output_dir = run_dir / "stage_2_generated_parts"
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -244,13 +439,19 @@ def run_stage2(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     results = process_prompt_batch(
         input_dir=str(input_dir),
         output_dir=str(output_dir),
-        system_prompt="You are an expert career counselor. Expand the given career plan section with detailed, actionable content in Czech.",
-        pattern="prompt_block_*.txt"
+        system_prompt=STAGE2_SYSTEM_PROMPT,
+        pattern="prompt_block_*.txt",
+        prompts=_stage_prompts(context, "parsed_parts", "prompt_block_*.txt"),
+        logger=logger,
+        step="stage2_expand",
+        validator=validate_block_text,
     )
+    _keep_responses(context, "stage_2_generated_parts", results)
     
     duration_ms = int((time.time() - start_time) * 1000)
     logger.log_step_complete("stage2_expand", duration_ms)
-    logger.log_info(f"Stage 2: {results['success']} succeeded, {results['failed']} failed")
+    logger.log_info(f"Stage 2: {results['success']} succeeded, {results['failed']} failed, "
+                    f"{results['regenerated']} regenerated")
     
     if results['failed'] > 0:
         raise RuntimeError(f"Stage 2 failed for {results['failed']} files")
@@ -269,16 +470,17 @@ def prep_html(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     logger.log_step_start("prep_html")
     start_time = time.time()
     
-    input_dir = run_dir / "stage_2_generated_parts"
+    context = get_run_context(run_dir)
     output_dir = run_dir / "stage_2_prepared_html"
     
     logger.log_info("Wrapping content with HTML template...")
     
-    count = wrap_directory(
-        input_dir=str(input_dir),
-        output_dir=str(output_dir),
-        template_path="prompts/html_transform.txt"
-    )
+    template = load_template("prompts/html_transform.txt")
+    names = context.names("stage_2_generated_parts", "*.txt")
+    for name in names:
+        content = context.get_text(f"stage_2_generated_parts/{name}")
+        context.put_text(f"stage_2_prepared_html/{name}", wrap_with_html_template(content, template))
+    count = len(names)
     
     duration_ms = int((time.time() - start_time) * 1000)
     logger.log_step_complete("prep_html", duration_ms)
@@ -290,6 +492,81 @@ def prep_html(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     }
 
 
+def prep_fused(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
+    """
+    Fused mode, replaces steps 4 and 5: combine each block's expand prompt
+    with the HTML transform template so one call produces the final HTML.
+    """
+    logger.log_step_start("prep_fused")
+    start_time = time.time()
+    
+    context = get_run_context(run_dir)
+    output_dir = run_dir / "stage_2_prepared_html"
+    
+    logger.log_info("Fusing block prompts with HTML template...")
+    
+    template = load_template("prompts/html_transform.txt")
+    names = context.names("parsed_parts", "prompt_block_*.txt")
+    for name in names:
+        content = context.get_text(f"parsed_parts/{name}")
+        context.put_text(f"stage_2_prepared_html/{name}", fuse_with_html_template(content, template))
+    count = len(names)
+    
+    duration_ms = int((time.time() - start_time) * 1000)
+    logger.log_step_complete("prep_fused", duration_ms)
+    logger.log_info(f"Fused {count} block prompts with HTML template")
+    
+    return {
+        "output_dir": str(output_dir),
+        "file_count": count,
+    }
+
+
+def run_fused_html(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
+    """
+    Fused mode, replaces step 6: generate each block's HTML in one call.
+    Writes to stage_3_generated_html like run_stage3.
+    """
+    logger.log_step_start("fused_html")
+    start_time = time.time()
+    
+    context = get_run_context(run_dir)
+    input_dir = run_dir / "stage_2_prepared_html"
+    output_dir = run_dir / "stage_3_generated_html"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    logger.log_info("Generating block HTML via OpenAI API...")
+    
+    results = process_prompt_batch(
+        input_dir=str(input_dir),
+        output_dir=str(output_dir),
+        system_prompt=FUSED_SYSTEM_PROMPT,
+        pattern="prompt_block_*.txt",
+        prompts=_stage_prompts(context, "stage_2_prepared_html", "prompt_block_*.txt"),
+        logger=logger,
+        step="fused_html",
+        validator=validate_block_html,
+    )
+    _keep_responses(context, "stage_3_generated_html", results)
+    
+    duration_ms = int((time.time() - start_time) * 1000)
+    logger.log_step_complete("fused_html", duration_ms)
+    logger.log_info(f"Fused HTML: {results['success']} succeeded, {results['failed']} failed, "
+                    f"{results['regenerated']} regenerated")
+    
+    if results['failed'] > 0:
+        raise RuntimeError(f"Fused HTML failed for {results['failed']} files")
+    
+    # Update status
+    mark_status(lead["id"], STATUS_HTML_READY, worker_id=lead.get("claimed_by"))
+    
+    return {
+        "input_dir": str(input_dir),
+        "output_dir": str(output_dir),
+        "results": results,
+    }
+
+
 def run_stage3(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     """
     Step 6: HTML generation via OpenAI API.
@@ -297,6 +574,7 @@ def run_stage3(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     logger.log_step_start("stage3_html")
     start_time = time.time()
     
+    context = get_run_context(run_dir)
     input_dir = run_dir / "stage_2_prepared_html"
     output_dir = run_dir / "stage_3_generated_html"
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -306,19 +584,25 @@ def run_stage3(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     results = process_prompt_batch(
         input_dir=str(input_dir),
         output_dir=str(output_dir),
-        system_prompt="You are a UI/HTML expert. Transform the input into semantic HTML with data-ui attributes. Output only valid HTML, no markdown, no explanations.",
-        pattern="*.txt"
+        system_prompt=STAGE3_SYSTEM_PROMPT,
+        pattern="*.txt",
+        prompts=_stage_prompts(context, "stage_2_prepared_html", "*.txt"),
+        logger=logger,
+        step="stage3_html",
+        validator=validate_block_html,
     )
+    _keep_responses(context, "stage_3_generated_html", results)
     
     duration_ms = int((time.time() - start_time) * 1000)
     logger.log_step_complete("stage3_html", duration_ms)
-    logger.log_info(f"Stage 3: {results['success']} succeeded, {results['failed']} failed")
+    logger.log_info(f"Stage 3: {results['success']} succeeded, {results['failed']} failed, "
+                    f"{results['regenerated']} regenerated")
     
     if results['failed'] > 0:
         raise RuntimeError(f"Stage 3 failed for {results['failed']} files")
     
     # Update status
-    mark_status(lead["id"], STATUS_HTML_READY)
+    mark_status(lead["id"], STATUS_HTML_READY, worker_id=lead.get("claimed_by"))
     
     return {
         "input_dir": str(input_dir),
@@ -334,15 +618,22 @@ def html_to_json_step(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict
     logger.log_step_start("html_to_json")
     start_time = time.time()
     
-    input_dir = run_dir / "stage_3_generated_html"
+    context = get_run_context(run_dir)
     output_dir = run_dir / "transformed"
     
     logger.log_info("Converting HTML to JSON...")
     
-    results = transform_html_directory(
-        input_dir=str(input_dir),
-        output_dir=str(output_dir)
-    )
+    names = context.names("stage_3_generated_html", "*.txt")
+    results = {"total": len(names), "success": 0, "failed": 0}
+    for name in names:
+        try:
+            data = transform_html_to_json(context.get_text(f"stage_3_generated_html/{name}"))
+        except Exception as e:
+            results["failed"] += 1
+            logger.log_info(f"❌ Could not transform {name}: {e}")
+            continue
+        context.put_json(f"transformed/{json_file_name(name)}", data)
+        results["success"] += 1
     
     duration_ms = int((time.time() - start_time) * 1000)
     logger.log_step_complete("html_to_json", duration_ms)
@@ -361,11 +652,16 @@ def clean_json(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     logger.log_step_start("clean_json")
     start_time = time.time()
     
+    context = get_run_context(run_dir)
     json_dir = run_dir / "transformed"
     
     logger.log_info("Cleaning markdown artifacts...")
     
-    results = clean_json_directory(str(json_dir))
+    names = context.names("transformed", "*.json")
+    for name in names:
+        cleaned = clean_markdown_artifacts(context.get_json(f"transformed/{name}"))
+        context.put_json(f"transformed/{name}", cleaned)
+    results = {"total": len(names), "success": len(names), "failed": 0}
     
     duration_ms = int((time.time() - start_time) * 1000)
     logger.log_step_complete("clean_json", duration_ms)
@@ -383,12 +679,13 @@ def upload_pages(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
     logger.log_step_start("upload_pages")
     start_time = time.time()
     
-    json_dir = run_dir / "transformed"
+    context = get_run_context(run_dir)
     client_id = lead["id"]
     
     logger.log_info(f"Uploading pages for client {client_id}...")
     
-    results = upload_from_directory(client_id, str(json_dir))
+    pages = {name: context.get_json(f"transformed/{name}") for name in context.names("transformed", "*.json")}
+    results = upload_named_pages(client_id, pages)
     
     duration_ms = int((time.time() - start_time) * 1000)
     logger.log_step_complete("upload_pages", duration_ms)
@@ -398,3 +695,92 @@ def upload_pages(lead: Dict, run_dir: Path, logger: PipelineLogger) -> Dict:
         "client_id": client_id,
         "results": results,
     }
+
+
+def run_blocks_dag(lead: Dict, run_dir: Path, logger: PipelineLogger,
+                   fused: bool = False) -> Dict:
+    """
+    DAG mode, replaces steps 4-9: move each block through expand, wrap,
+    HTML, JSON, clean and upload independently (see pipeline.scheduler).
+    Node names match the stage steps, so logs and summaries line up.
+    """
+    template = load_template("prompts/html_transform.txt")
+    context = get_run_context(run_dir)
+    
+    def llm_node(step: str, system_prompt: str, validator):
+        def run(inputs, outputs):
+            result = generate_file(inputs[0], outputs[0], system_prompt=system_prompt,
+                                   validator=validator, logger=logger, step=step,
+                                   prompt=context.get_text(inputs[0]))
+            if result["status"] == "failed":
+                raise RuntimeError(result["error"])
+            context.put_text(outputs[0], result["response"], persist=False)
+        return run
+    
+    def wrap(inputs, outputs):
+        content = context.get_text(inputs[0])
+        if fused:
+            wrapped = fuse_with_html_template(content, template)
+        else:
+            wrapped = wrap_with_html_template(content, template)
+        context.put_text(outputs[0], wrapped)
+    
+    def to_json(inputs, outputs):
+        context.put_json(outputs[0], transform_html_to_json(context.get_text(inputs[0])))
+    
+    def clean(inputs, outputs):
+        context.put_json(outputs[0], clean_markdown_artifacts(context.get_json(inputs[0])))
+    
+    def upload(inputs, outputs):
+        page_index = extract_page_index(inputs[0].name)
+        if page_index is None:
+            raise RuntimeError(f"No page index in {inputs[0].name}")
+        upload_single_page(lead["id"], page_index, context.get_json(inputs[0]))
+    
+    prompt = "parsed_parts/{block}"
+    prepared = "stage_2_prepared_html/{block}"
+    html = "stage_3_generated_html/{block}"
+    page = "transformed/page_{index}.json"
+    
+    if fused:
+        html_step = "fused_html"
+        nodes = [
+            Node("prep_fused", wrap, [prompt], [prepared]),
+            Node(html_step, llm_node(html_step, FUSED_SYSTEM_PROMPT, validate_block_html),
+                 [prepared], [html], llm=True),
+        ]
+    else:
+        html_step = "stage3_html"
+        expanded = "stage_2_generated_parts/{block}"
+        nodes = [
+            Node("stage2_expand", llm_node("stage2_expand", STAGE2_SYSTEM_PROMPT, validate_block_text),
+                 [prompt], [expanded], llm=True),
+            Node("prep_html", wrap, [expanded], [prepared]),
+            Node(html_step, llm_node(html_step, STAGE3_SYSTEM_PROMPT, validate_block_html),
+                 [prepared], [html], llm=True),
+        ]
+    nodes += [
+        Node("html_to_json", to_json, [html], [page]),
+        Node("clean_json", clean, [page], [page]),
+        Node("upload_pages", upload, [page], []),
+    ]
+    
+    def on_node_complete(name: str) -> None:
+        if name == html_step:
+            mark_status(lead["id"], STATUS_HTML_READY, worker_id=lead.get("claimed_by"))
+    
+    blocks = sorted(context.names("parsed_parts", "prompt_block_*.txt"), key=block_index)
+    if not blocks:
+        raise RuntimeError("No block prompts found")
+    
+    logger.log_info(f"Running {len(blocks)} blocks through the block DAG...")
+    results = BlockScheduler(nodes).run(blocks, run_dir, logger, on_node_complete)
+    logger.log_info(f"Block DAG: {results['succeeded']}/{results['blocks']} blocks "
+                    f"completed in {results['duration_ms'] / 1000:.1f}s")
+    
+    if results["failed"]:
+        first = next(iter(results["failed"].items()))
+        raise RuntimeError(f"Block DAG failed for {len(results['failed'])} blocks "
+                           f"(first: {first[0]} at {first[1]})")
+    
+    return results
@@ -0,0 +1,112 @@
+"""
+Output validators for LLM responses.
+
+Each validator takes the response text and returns None when the output
+is acceptable, or a short reason why it was rejected. Routed steps use
+them to decide when to escalate from the fast model to OPENAI_MODEL.
+"""
+
+import os
+from html.parser import HTMLParser
+from typing import List, Optional
+
+from bs4 import BeautifulSoup
+
+from processors.block_parser import parse_plan_blocks
+
+from .profile import parse_profile
+
+# Blocks the plan prompt asks for (<blok-1> ... <blok-15>)
+PLAN_BLOCK_COUNT = 15
+
+# Shortest expanded block (characters) accepted from stage 2
+BLOCK_MIN_CHARS = int(os.getenv("BLOCK_MIN_CHARS", "200"))
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "source", "track", "wbr",
+}
+# Elements whose closing tag HTML lets authors omit
+OPTIONAL_END_ELEMENTS = {"p", "li", "dt", "dd", "tr", "td", "th", "thead", "tbody", "tfoot", "option"}
+
+
+def validate_profile(text: str) -> Optional[str]:
+    """Reject an input transform response that is not a valid client profile."""
+    try:
+        parse_profile(text)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def validate_data_ui(text: str) -> Optional[str]:
+    """Reject HTML without any data-ui attributes."""
+    soup = BeautifulSoup(text, "html.parser")
+    if soup.find(attrs={"data-ui": True}) is None:
+        return "no data-ui attributes"
+    return None
+
+
+def validate_block_text(text: str, min_chars: int = BLOCK_MIN_CHARS) -> Optional[str]:
+    """Reject an expanded block that is empty, too short or cut off."""
+    stripped = text.strip()
+    if not stripped:
+        return "empty output"
+    if len(stripped) < min_chars:
+        return f"too short ({len(stripped)} chars)"
+    if stripped.count("```") % 2:
+        return "unterminated code block"
+    return None
+
+
+class _TagBalance(HTMLParser):
+    """Tracks open elements to find unclosed and stray closing tags."""
+
+    def __init__(self):
+        super().__init__()
+        self.open: List[str] = []
+        self.stray: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in VOID_ELEMENTS:
+            self.open.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        if tag in self.open:
+            # Implicitly close anything left open inside it (e.g. <li>, <p>)
+            while self.open.pop() != tag:
+                pass
+        else:
+            self.stray.append(tag)
+
+
+def validate_block_html(text: str) -> Optional[str]:
+    """
+    Reject block HTML that is empty, not well-formed (a truncated response
+    leaves its outer elements open) or has no data-ui attributes.
+    """
+    if not text.strip():
+        return "empty output"
+
+    balance = _TagBalance()
+    balance.feed(text)
+    balance.close()
+    unclosed = [tag for tag in balance.open if tag not in OPTIONAL_END_ELEMENTS]
+    if unclosed:
+        return f"unclosed <{unclosed[0]}>"
+    if balance.stray:
+        return f"stray </{balance.stray[0]}>"
+
+    return validate_data_ui(text)
+
+
+def validate_plan_blocks(text: str, expected: int = PLAN_BLOCK_COUNT) -> Optional[str]:
+    """Reject a plan that is missing any of the <blok-n> blocks."""
+    found = {number for number, content in parse_plan_blocks(text) if content}
+    missing = sorted(set(range(1, expected + 1)) - found)
+    if missing:
+        return f"missing blocks {', '.join(map(str, missing))}"
+    return None
@@ -5,25 +5,29 @@ Data processing components for the Orakulum pipeline.
 Each processor handles a specific transformation step.
 """
 
-from .block_parser import parse_plan_blocks, fill_expand_template
-from .html_wrapper import wrap_with_html_template
-from .html_to_json import transform_html_to_json, transform_html_directory
+from .block_parser import parse_plan_blocks, fill_expand_template, block_index
+from .html_wrapper import wrap_with_html_template, fuse_with_html_template
+from .html_to_json import transform_html_to_json, transform_html_directory, json_file_name
 from .json_cleaner import clean_markdown_artifacts, clean_json_directory
-from .uploader import upload_client_pages, upload_from_directory
+from .uploader import upload_client_pages, upload_from_directory, upload_named_pages
 
 __all__ = [
     # Block parsing
     "parse_plan_blocks",
     "fill_expand_template",
+    "block_index",
     # HTML wrapping
     "wrap_with_html_template",
+    "fuse_with_html_template",
     # HTML to JSON
     "transform_html_to_json",
     "transform_html_directory",
+    "json_file_name",
     # JSON cleaning
     "clean_markdown_artifacts",
     "clean_json_directory",
     # Uploading
     "upload_client_pages",
     "upload_from_directory",
+    "upload_named_pages",
 ]
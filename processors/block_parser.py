@@ -25,6 +25,20 @@ def parse_plan_blocks(plan_text: str) -> List[Tuple[int, str]]:
     return [(int(n), block.strip()) for n, block in matches]
 
 
+def block_index(name: Optional[str]) -> Optional[int]:
+    """
+    Block number from a block file or prompt name.
+    
+    Examples:
+        prompt_block_7.txt -> 7
+        prompt_block_7.json -> 7
+    """
+    if not name:
+        return None
+    match = re.search(r'(\d+)', name)
+    return int(match.group(1)) if match else None
+
+
 def load_expand_template(template_path: str = "prompts/expand.txt") -> str:
     """Load the expand template from file."""
     with open(template_path, 'r', encoding='utf-8') as f:
@@ -41,6 +55,11 @@ def fill_expand_template(
     """
     Fill the expand template with block content and client parameters.
     
+    The template keeps its static instructions first, then the client
+    parameters (shared by all blocks of a lead) and the block last, so
+    consecutive block prompts share a long identical prefix that the
+    provider's prompt cache can reuse.
+    
     Args:
         template: The expand template text
         block_content: The block content to insert
@@ -5,6 +5,7 @@ Transforms HTML with data-ui attributes into structured JSON.
 """
 
 import os
+import re
 import json
 from pathlib import Path
 from typing import List, Dict, Any, Union, Optional
@@ -79,6 +80,20 @@ def transform_html_to_json(html_content: str) -> List[Dict[str, Any]]:
     return result
 
 
+def json_file_name(html_name: str) -> str:
+    """
+    JSON page file name for an HTML file.
+    
+    Examples:
+        prompt_block_7.txt -> page_7.json
+        intro.txt -> intro.json
+    """
+    match = re.search(r'(\d+)', html_name)
+    if match:
+        return f"page_{match.group(1)}.json"
+    return Path(html_name).stem + ".json"
+
+
 def transform_file(input_path: str, output_path: str) -> bool:
     """
     Transform a single HTML file to JSON.
@@ -122,8 +137,6 @@ def transform_html_directory(
     Returns:
         Summary dict with counts
     """
-    import re
-    
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     
@@ -143,12 +156,7 @@ def transform_html_directory(
     results = {"total": len(html_files), "success": 0, "failed": 0}
     
     for html_file in html_files:
-        # Extract number from filename for output naming
-        match = re.search(r'(\d+)', html_file.name)
-        if match:
-            output_file = output_path / f"page_{match.group(1)}.json"
-        else:
-            output_file = output_path / (html_file.stem + ".json")
+        output_file = output_path / json_file_name(html_file.name)
         
         if transform_file(str(html_file), str(output_file)):
             results["success"] += 1
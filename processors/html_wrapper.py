@@ -12,6 +12,13 @@ from typing import List
 DEFAULT_TEMPLATE_PATH = "prompts/html_transform.txt"
 PLACEHOLDER = "[PASTETEXTHERE]"
 
+# Stands in for the input text when the model writes the text itself
+FUSED_INPUT_NOTE = (
+    "(No text is given. Write it yourself by completing the task below. "
+    "Where the task prescribes tags or formatting, the rules above take "
+    "precedence. Output only the resulting HTML.)"
+)
+
 
 def load_template(template_path: str = DEFAULT_TEMPLATE_PATH) -> str:
     """Load the HTML transform template."""
@@ -33,14 +40,40 @@ def wrap_with_html_template(content: str, template: str = None) -> str:
     if template is None:
         template = load_template()
     
+    # Content goes at the placeholder, which the template keeps at its end:
+    # every stage-3 prompt then starts with the same static instructions
+    # and can hit the provider's prompt-prefix cache.
     return template.replace(PLACEHOLDER, content)
 
 
+def fuse_with_html_template(expand_prompt: str, template: str = None) -> str:
+    """
+    Combine a filled expand prompt with the HTML transform template.
+    
+    The model writes the block content and outputs it as data-ui HTML in
+    one response, replacing the separate stage 2 and stage 3 calls. The
+    expand prompt takes the placeholder's place at the end, so the static
+    HTML rules stay a shared prefix.
+    
+    Args:
+        expand_prompt: Expand prompt filled for one block
+        template: Optional template string (loads default if not provided)
+        
+    Returns:
+        Single prompt producing the block's HTML
+    """
+    if template is None:
+        template = load_template()
+    
+    return template.replace(PLACEHOLDER, f"{FUSED_INPUT_NOTE}\n\n{expand_prompt}")
+
+
 def wrap_directory(
     input_dir: str,
     output_dir: str,
     template_path: str = DEFAULT_TEMPLATE_PATH,
-    pattern: str = "*.txt"
+    pattern: str = "*.txt",
+    fused: bool = False
 ) -> int:
     """
     Wrap all text files in a directory with HTML template.
@@ -50,6 +83,8 @@ def wrap_directory(
         output_dir: Output directory for wrapped files
         template_path: Path to HTML transform template
         pattern: Glob pattern for input files
+        fused: Inputs are expand prompts to fuse with the template
+            (see fuse_with_html_template) rather than expanded content
         
     Returns:
         Number of files processed
@@ -80,7 +115,10 @@ def wrap_directory(
         with open(txt_file, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        wrapped = wrap_with_html_template(content, template)
+        if fused:
+            wrapped = fuse_with_html_template(content, template)
+        else:
+            wrapped = wrap_with_html_template(content, template)
         
         output_file = output_path / txt_file.name
         with open(output_file, 'w', encoding='utf-8') as f:
@@ -6,6 +6,7 @@ Uploads processed JSON content to Supabase.
 
 import os
 import re
+import threading
 import json
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Union
@@ -22,13 +23,22 @@ SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 TABLE_NAME = "client_learning_pages"
 
 
+_client = None
+_client_lock = threading.Lock()
+
+
 def get_supabase_client() -> Client:
-    """Create Supabase client."""
-    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-        raise ValueError(
-            "Missing SUPABASE_URL or SUPABASE_SERVICE_KEY environment variables"
-        )
-    return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    """Get the process-wide Supabase client (created once and reused)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+                    raise ValueError(
+                        "Missing SUPABASE_URL or SUPABASE_SERVICE_KEY environment variables"
+                    )
+                _client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return _client
 
 
 def extract_page_index(filename: str) -> Optional[int]:
@@ -93,6 +103,45 @@ def upload_client_pages(client_id: str, pages: List[Union[Dict, List]]) -> List[
     return results
 
 
+def upload_named_pages(client_id: str, pages: Dict[str, Union[Dict, List]]) -> Dict[str, Any]:
+    """
+    Upload pages already in memory, keyed by their JSON file name.
+    Page index is extracted from the file name numbers, as for
+    upload_from_directory.
+    
+    Args:
+        client_id: Client UUID
+        pages: Page content by file name (e.g. {"page_1.json": [...]})
+        
+    Returns:
+        Summary dict with results
+    """
+    supabase = get_supabase_client()
+    results = {"total": len(pages), "success": 0, "failed": 0, "pages": []}
+    
+    for name in sorted(pages):
+        page_index = extract_page_index(name)
+        
+        if page_index is None:
+            print(f"   ⚠️ Skipping {name} - no number in filename")
+            continue
+        
+        try:
+            row = upload_single_page(client_id, page_index, pages[name], supabase)
+            results["success"] += 1
+            results["pages"].append({"file": name, "page_index": page_index})
+            
+            row_id = row.get("id", "?")
+            print(f"   ✅ {name} → page_index={page_index} (id: {row_id})")
+            
+        except Exception as e:
+            results["failed"] += 1
+            print(f"   ❌ {name} failed: {e}")
+    
+    print(f"\n✨ Uploaded {results['success']}/{results['total']} pages for client {client_id}")
+    return results
+
+
 def upload_from_directory(client_id: str, directory: str) -> Dict[str, Any]:
     """
     Upload all JSON files from a directory.
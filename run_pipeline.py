@@ -12,12 +12,27 @@ Usage:
     python3 run_pipeline.py --client CLIENT_ID # Process specific client
     python3 run_pipeline.py --dry-run          # Preview without processing
     python3 run_pipeline.py --resume CLIENT_ID # Resume failed processing
+    python3 run_pipeline.py --no-cache         # Bypass the LLM response cache
+    python3 run_pipeline.py --batch            # Process flagged leads via the Batch API
+    python3 run_pipeline.py --fused            # Expand blocks straight to HTML (one call per block)
+    python3 run_pipeline.py --dag              # Move each block through the steps independently
+    python3 run_pipeline.py --workers 4        # Process up to 4 flagged leads concurrently
+    python3 run_pipeline.py --daemon           # Keep running, polling for flagged leads
+    python3 run_pipeline.py --express CLIENT_ID # Process a client now, ahead of the queue
+    python3 run_pipeline.py --refresh-stale    # Re-run uploaded leads after a template/model change
 """
 
 import argparse
+import os
+import signal
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from datetime import datetime
+from typing import List, Optional, Tuple
 
 from pipeline.db import (
     fetch_flagged_leads,
@@ -25,8 +40,14 @@ from pipeline.db import (
     mark_status,
     mark_failure,
     unblock_lead,
+    get_leads_by_status,
+    enqueue_lead,
+    claim_lead,
+    claim_lead_for_run,
+    requeue_expired_leases,
+    LeaseHeartbeat,
+    LeaseLost,
     STATUS_FLAGGED,
-    STATUS_PROCESSING,
     STATUS_UPLOADED,
     STATUS_BLOCKED,
 )
@@ -37,29 +58,79 @@ from pipeline.steps import (
     run_stage2,
     prep_html,
     run_stage3,
+    prep_fused,
+    run_fused_html,
+    run_blocks_dag,
     html_to_json_step,
     clean_json,
     upload_pages,
+    step_io,
+    step_output_inputs,
 )
 from pipeline.logger import PipelineLogger, setup_run_directory
+from pipeline.manifest import StepRunner, RunManifest
+from pipeline.context import close_run_context
+from pipeline.llm import set_cache_enabled, warm_openai_client
+from pipeline.lead_queue import (
+    LeadQueue,
+    order_leads,
+    queue_wait_seconds,
+    is_express,
+    EXPRESS_PRIORITY,
+    EXPRESS_WORKERS,
+)
+from pipeline.batch import process_leads_batch
 from processors.uploader import delete_client_pages
 
 
 MAX_RETRIES = 3
 
+# Daemon mode: seconds between polls for flagged leads; doubles while idle
+# (or while the database is unreachable) up to the maximum
+DAEMON_POLL_INTERVAL = float(os.getenv("DAEMON_POLL_INTERVAL", "5"))
+DAEMON_MAX_POLL_INTERVAL = float(os.getenv("DAEMON_MAX_POLL_INTERVAL", "60"))
+
 
-def process_client(lead: dict, run_dir: Path = None) -> bool:
+def process_client(lead: dict, run_dir: Path = None, fused: bool = False,
+                   dag: bool = False, lease: Optional[LeaseHeartbeat] = None) -> bool:
     """
     Process a single client through all pipeline steps.
     
+    Completed steps are recorded in the run directory's manifest; when an
+    existing run directory is passed, steps whose inputs are unchanged and
+    whose outputs are present are skipped until the first one that isn't.
+    
     Args:
         lead: Lead dictionary with id, description, etc.
         run_dir: Optional existing run directory (for resume)
+        fused: Generate block HTML in one call instead of stage 2 + stage 3
+        dag: Run the per-block steps through the block DAG scheduler
+            instead of stage by stage
+        lease: Heartbeat of the lead's claim if it was claimed with
+            claim_lead (then it is already PROCESSING). Without one the
+            lead is claimed here with claim_lead_for_run, and refused if
+            another worker holds it. If the lease is lost, the run stops
+            before its next step and leaves the lead to the worker that
+            holds it now; status updates only apply while the claim is
+            this worker's.
     
     Returns:
-        True if successful, False if failed
+        True if successful, False if failed (or refused)
     """
     client_id = lead["id"]
+    if lease is None:
+        # Single-client runs claim the lead too, so no worker takes it meanwhile
+        claimed = claim_lead_for_run(client_id)
+        if claimed is None:
+            print(f"🔒 Client {client_id} is being processed by another worker")
+            return False
+        with LeaseHeartbeat([client_id]) as lease:
+            return process_client({**lead, **claimed}, run_dir, fused=fused, dag=dag, lease=lease)
+    
+    resume = run_dir is not None
+    # Status updates made by the steps are conditional on this claim
+    worker_id = lease.worker_id
+    lead = {**lead, "claimed_by": worker_id}
     
     # Setup run directory if not provided
     if run_dir is None:
@@ -68,45 +139,80 @@ def process_client(lead: dict, run_dir: Path = None) -> bool:
     logger = PipelineLogger(run_dir, client_id)
     
     try:
-        # Mark as processing
-        mark_status(client_id, STATUS_PROCESSING)
         logger.log_info(f"Starting pipeline for client {client_id}")
         logger.log_info(f"Run directory: {run_dir}")
+        if lead.get("queue_wait_seconds") is not None:
+            logger.log_queue_wait(lead["queue_wait_seconds"], lead.get("priority") or 0)
+        
+        steps = StepRunner(lead, run_dir, logger, step_io, resume=resume, lease=lease,
+                           output_inputs=step_output_inputs)
         
         # Step 2: Input transform
-        run_input_transform(lead, run_dir, logger)
+        steps.run("input_transform", run_input_transform)
         
         # Step 3: Plan synthesis
-        run_plan_prompt(lead, run_dir, logger)
+        steps.run("plan_prompt", run_plan_prompt)
         
         # Step 4: Generate block prompts
-        generate_blocks(lead, run_dir, logger)
-        
-        # Step 5: Stage 2 - ChatGPT processing
-        run_stage2(lead, run_dir, logger)
-        
-        # Step 6: Prepare HTML prompts
-        prep_html(lead, run_dir, logger)
-        
-        # Step 7: Stage 3 - ChatGPT HTML generation
-        run_stage3(lead, run_dir, logger)
+        steps.run("generate_blocks", generate_blocks)
         
-        # Step 8: HTML to JSON
-        html_to_json_step(lead, run_dir, logger)
+        if dag:
+            # Steps 5-9 per block, without stage barriers
+            steps.run("fused_blocks_dag" if fused else "blocks_dag",
+                      partial(run_blocks_dag, fused=fused))
+        else:
+            if fused:
+                # Steps 5-7: Fused expand + HTML generation
+                steps.run("prep_fused", prep_fused)
+                steps.run("fused_html", run_fused_html)
+            else:
+                # Step 5: Stage 2 - ChatGPT processing
+                steps.run("stage2_expand", run_stage2)
+                
+                # Step 6: Prepare HTML prompts
+                steps.run("prep_html", prep_html)
+                
+                # Step 7: Stage 3 - ChatGPT HTML generation
+                steps.run("stage3_html", run_stage3)
+            
+            # Step 8: HTML to JSON
+            steps.run("html_to_json", html_to_json_step)
+            
+            # Step 9: Clean and upload
+            steps.run("clean_json", clean_json)
+            steps.run("upload_pages", upload_pages)
         
-        # Step 9: Clean and upload
-        clean_json(lead, run_dir, logger)
-        upload_pages(lead, run_dir, logger)
+        # Write out the remaining artifacts
+        close_run_context(run_dir)
         
         # Mark as completed
-        mark_status(client_id, STATUS_UPLOADED)
+        lease.check(client_id)
+        lease.release(client_id)
+        mark_status(client_id, STATUS_UPLOADED, worker_id=worker_id)
         logger.finalize("completed")
         
         return True
         
     except Exception as exc:
         logger.log_step_error("pipeline", exc)
-        mark_failure(client_id, exc, block=True)
+        try:
+            close_run_context(run_dir)
+        except OSError:
+            # Already failing; keep the original error
+            pass
+        lease.release(client_id)
+        lost = isinstance(exc, LeaseLost)
+        if not lost:
+            try:
+                mark_failure(client_id, exc, block=True, worker_id=worker_id)
+            except LeaseLost as lost_exc:
+                exc, lost = lost_exc, True
+        if lost:
+            # The lead is another worker's now; leave its status alone
+            logger.finalize("lease_lost")
+            print(f"\n⚠️ Stopped processing client {client_id}: {exc}")
+            print(f"   Run directory: {run_dir}")
+            return False
         logger.finalize("failed")
         
         print(f"\n❌ Pipeline failed for client {client_id}")
@@ -117,14 +223,37 @@ def process_client(lead: dict, run_dir: Path = None) -> bool:
         return False
 
 
-def process_all_flagged() -> dict:
+def process_all_flagged(batch: bool = False, fused: bool = False, dag: bool = False,
+                        workers: int = 1, leads: Optional[List[dict]] = None,
+                        stop: Optional[threading.Event] = None) -> dict:
     """
     Process all leads with status='FLAGGED'.
     
+    Workers take leads from the queue in priority order (see
+    pipeline.lead_queue), claiming each one just before it starts so other
+    workers polling the same table skip it. Each worker looks at the queue
+    again when it frees up, so leads flagged meanwhile (express leads in
+    particular) don't wait for the whole backlog. With more than one
+    worker, EXPRESS_WORKERS of them take only express leads.
+    
+    Args:
+        batch: If True, run each LLM stage for all leads as one Batch API job
+        fused: Generate block HTML in one call instead of stage 2 + stage 3
+        dag: Run each lead's per-block steps through the block DAG scheduler
+        workers: Leads processed concurrently, each with its own logger and
+            run directory; LLM requests stay under OPENAI_MAX_IN_FLIGHT overall
+        leads: Flagged leads already fetched (default: fetch them); they
+            seed the queue, which refetches every LEAD_QUEUE_REFRESH_SECONDS
+        stop: Once set, no further leads are started (they stay FLAGGED);
+            leads in progress finish
+    
     Returns:
-        Summary dict with counts of processed, succeeded, failed
+        Summary dict with counts of processed, succeeded, failed, queue
+        wait and throughput
     """
-    leads = fetch_flagged_leads()
+    if leads is None:
+        requeue_expired()
+        leads = fetch_flagged_leads()
     
     if not leads:
         print("📭 No flagged leads to process")
@@ -133,32 +262,167 @@ def process_all_flagged() -> dict:
     print(f"\n🚀 Found {len(leads)} flagged lead(s) to process")
     print("=" * 60)
     
-    results = {"total": len(leads), "succeeded": 0, "failed": 0, "clients": []}
+    start_time = time.time()
     
-    for i, lead in enumerate(leads, 1):
-        print(f"\n[{i}/{len(leads)}] Processing: {lead['id']}")
-        print(f"    Name: {lead.get('name', 'N/A')}")
-        print(f"    Description: {lead.get('description', '')[:100]}...")
-        print("-" * 60)
-        
-        success = process_client(lead)
-        
-        if success:
-            results["succeeded"] += 1
-            results["clients"].append({"id": lead["id"], "status": "succeeded"})
-        else:
-            results["failed"] += 1
-            results["clients"].append({"id": lead["id"], "status": "failed"})
+    if batch:
+        leads = order_leads(leads)
+        waits = [queue_wait_seconds(lead) for lead in leads]
+        results = process_leads_batch(leads, fused=fused)
+        _add_queue_wait(results, waits)
+        _add_throughput(results, start_time)
+        _print_summary(results)
+        return results
+    
+    results = {"total": 0, "succeeded": 0, "failed": 0, "clients": []}
+    waits = []
+    results_lock = threading.Lock()
+    queue = LeadQueue(leads)
+    backlog_done = threading.Event()
+    
+    def work(express_only: bool) -> None:
+        while stop is None or not stop.is_set():
+            lead = queue.next_lead(express_only=express_only)
+            if lead is None:
+                if express_only and not backlog_done.is_set():
+                    # Keep the express lane open while the backlog is processed
+                    backlog_done.wait(DAEMON_POLL_INTERVAL)
+                    continue
+                return
+            
+            with results_lock:
+                results["total"] += 1
+                waits.append(lead["queue_wait_seconds"])
+                i = results["total"]
+            lane = "express" if is_express(lead) else f"priority {lead.get('priority') or 0}"
+            print(f"\n[{i}] Processing: {lead['id']} ({lane})")
+            print(f"    Name: {lead.get('name', 'N/A')}")
+            print(f"    Description: {lead.get('description', '')[:100]}...")
+            print("-" * 60)
+            
+            with LeaseHeartbeat([lead["id"]]) as lease:
+                success = process_client(lead, fused=fused, dag=dag, lease=lease)
+            
+            with results_lock:
+                results["succeeded" if success else "failed"] += 1
+                results["clients"].append({"id": lead["id"],
+                                           "status": "succeeded" if success else "failed"})
+    
+    if workers <= 1:
+        work(express_only=False)
+    else:
+        express_workers = min(EXPRESS_WORKERS, workers - 1)
+        print(f"⚡ Processing with {workers} workers ({express_workers} express)")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lead") as executor:
+            express = [executor.submit(work, True) for _ in range(express_workers)]
+            backlog = [executor.submit(work, False) for _ in range(workers - express_workers)]
+            for future in backlog:
+                future.result()
+            backlog_done.set()
+            for future in express:
+                future.result()
     
-    # Print summary
+    _add_queue_wait(results, waits)
+    _add_throughput(results, start_time)
+    _print_summary(results)
+    return results
+
+
+def requeue_expired() -> None:
+    """Put leads of crashed workers (expired lease) back to FLAGGED."""
+    requeued = requeue_expired_leases()
+    if requeued:
+        ids = ", ".join(lead["id"] for lead in requeued)
+        print(f"♻️  Requeued {len(requeued)} lead(s) with an expired lease: {ids}")
+
+
+def _add_queue_wait(results: dict, waits: List[Optional[float]]) -> None:
+    """Add average and longest queue wait to a multi-lead summary."""
+    waits = [wait for wait in waits if wait is not None]
+    if waits:
+        results["queue_wait"] = {
+            "avg_seconds": round(sum(waits) / len(waits), 1),
+            "max_seconds": round(max(waits), 1),
+        }
+
+
+def _add_throughput(results: dict, start_time: float) -> None:
+    """Add wall time and completed leads per hour to a multi-lead summary."""
+    duration = time.time() - start_time
+    results["duration_seconds"] = round(duration, 1)
+    results["leads_per_hour"] = round(results["succeeded"] * 3600 / duration, 1) if duration > 0 else 0.0
+
+
+def _print_summary(results: dict) -> None:
+    """Print the summary of a multi-lead run."""
     print("\n" + "=" * 60)
     print("📊 PIPELINE SUMMARY")
     print("=" * 60)
     print(f"   Total processed: {results['total']}")
     print(f"   ✅ Succeeded: {results['succeeded']}")
     print(f"   ❌ Failed: {results['failed']}")
+    if results.get("skipped"):
+        print(f"   ⏭️ Claimed by another worker: {results['skipped']}")
+    if "queue_wait" in results:
+        print(f"   ⏳ Queue wait: avg {results['queue_wait']['avg_seconds']:.1f}s, "
+              f"max {results['queue_wait']['max_seconds']:.1f}s")
+    if "leads_per_hour" in results:
+        print(f"   ⏱️ Duration: {results['duration_seconds']:.1f}s "
+              f"({results['leads_per_hour']:.1f} leads/hour)")
+
+
+def run_daemon(fused: bool = False, dag: bool = False, workers: int = 1) -> None:
+    """
+    Keep processing flagged leads until SIGTERM or Ctrl+C.
     
-    return results
+    Imports, .env loading and the database and OpenAI clients are set up
+    once and reused for every lead. After processing leads the daemon polls
+    again right away; while there is nothing to do the poll interval backs
+    off from DAEMON_POLL_INTERVAL to DAEMON_MAX_POLL_INTERVAL.
+    
+    On the first SIGTERM/SIGINT no new leads are started and the daemon
+    returns once the leads in progress are done; a second one interrupts
+    them.
+    
+    Args:
+        fused: Generate block HTML in one call instead of stage 2 + stage 3
+        dag: Run each lead's per-block steps through the block DAG scheduler
+        workers: Leads processed concurrently
+    """
+    stop = threading.Event()
+    
+    def request_stop(signum, frame):
+        if stop.is_set():
+            raise KeyboardInterrupt
+        print(f"\n🛑 Received {signal.Signals(signum).name}, finishing leads in progress...")
+        stop.set()
+    
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    
+    print(f"👀 Daemon mode: polling for flagged leads every {DAEMON_POLL_INTERVAL:g}s "
+          f"(up to {DAEMON_MAX_POLL_INTERVAL:g}s when idle)")
+    
+    interval = DAEMON_POLL_INTERVAL
+    while not stop.is_set():
+        try:
+            requeue_expired()
+            leads = fetch_flagged_leads()
+        except Exception as exc:
+            print(f"   ⚠️ Could not fetch flagged leads: {exc}")
+            leads = []
+        
+        if leads:
+            try:
+                process_all_flagged(fused=fused, dag=dag, workers=workers, leads=leads, stop=stop)
+                interval = DAEMON_POLL_INTERVAL
+                continue
+            except Exception as exc:
+                print(f"   ⚠️ Processing flagged leads failed: {exc}")
+        
+        stop.wait(interval)
+        interval = min(interval * 2, DAEMON_MAX_POLL_INTERVAL)
+    
+    print("👋 Daemon stopped")
 
 
 def dry_run() -> None:
@@ -169,20 +433,27 @@ def dry_run() -> None:
         print("📭 No flagged leads to process")
         return
     
-    print(f"\n📋 DRY RUN - Would process {len(leads)} lead(s):")
+    print(f"\n📋 DRY RUN - Would process {len(leads)} lead(s), in queue order:")
     print("=" * 60)
     
-    for i, lead in enumerate(leads, 1):
+    for i, lead in enumerate(order_leads(leads), 1):
+        wait = queue_wait_seconds(lead)
         print(f"\n{i}. {lead['id']}")
+        print(f"   Priority: {lead.get('priority') or 0}"
+              + (f", waiting {wait / 60:.0f} min" if wait is not None else ""))
         print(f"   Name: {lead.get('name', 'N/A')}")
         print(f"   Email: {lead.get('email', 'N/A')}")
         print(f"   Description: {lead.get('description', '')[:80]}...")
 
 
-def resume_client(client_id: str) -> bool:
+def express_client(client_id: str, fused: bool = False, dag: bool = False) -> bool:
     """
-    Resume processing for a specific client.
-    Finds the latest run directory and continues from where it left off.
+    Process a client right away through the express lane.
+    
+    For interactive single-client runs: the lead is flagged with
+    EXPRESS_PRIORITY and claimed by this process, so workers polling the
+    queue leave it alone. If a worker claims it first, it is processed
+    there, ahead of the backlog.
     """
     lead = fetch_lead_by_id(client_id)
     
@@ -190,18 +461,112 @@ def resume_client(client_id: str) -> bool:
         print(f"❌ Client not found: {client_id}")
         return False
     
-    # Find latest run directory
+    if enqueue_lead(client_id, priority=EXPRESS_PRIORITY) is None:
+        print(f"⏳ Client {client_id} is already being processed ({lead.get('status')})")
+        return False
+    
+    claimed = claim_lead(client_id)
+    if claimed is None:
+        print(f"🔒 Client {client_id} was picked up by another worker")
+        return True
+    
+    print(f"🚑 Express run for {client_id}")
+    with LeaseHeartbeat([client_id]) as lease:
+        return process_client({**lead, **claimed}, fused=fused, dag=dag, lease=lease)
+
+
+def latest_run_dir(client_id: str) -> Optional[Path]:
+    """The client's most recent run directory, or None."""
     runs_base = Path("runs") / client_id
     if runs_base.exists():
         run_dirs = sorted(runs_base.iterdir(), reverse=True)
         if run_dirs:
-            run_dir = run_dirs[0]
-            print(f"📂 Resuming from: {run_dir}")
-            return process_client(lead, run_dir)
+            return run_dirs[0]
+    return None
+
+
+def resume_client(client_id: str, fused: bool = False, dag: bool = False) -> bool:
+    """
+    Resume processing for a specific client.
+    Finds the latest run directory and continues from where it left off.
+    """
+    lead = fetch_lead_by_id(client_id)
+    
+    if not lead:
+        print(f"❌ Client not found: {client_id}")
+        return False
+    
+    run_dir = latest_run_dir(client_id)
+    if run_dir is not None:
+        print(f"📂 Resuming from: {run_dir}")
+        return process_client(lead, run_dir, fused=fused, dag=dag)
     
     # No existing run, start fresh
     print(f"📂 No existing run found, starting fresh")
-    return process_client(lead)
+    return process_client(lead, fused=fused, dag=dag)
+
+
+def run_mode(manifest: RunManifest) -> Tuple[bool, bool]:
+    """(fused, dag) mode a run was processed in, from its manifest."""
+    steps = manifest.data["steps"]
+    dag = "blocks_dag" in steps or "fused_blocks_dag" in steps
+    fused = "fused_blocks_dag" in steps or "prep_fused" in steps or "fused_html" in steps
+    return fused, dag
+
+
+def refresh_stale(client_id: Optional[str] = None, dry_run: bool = False) -> dict:
+    """
+    Re-run uploaded leads whose artifacts are out of date.
+    
+    A lead is stale when its latest run's manifest shows a completed step
+    whose inputs changed since it ran, typically an edited prompt template
+    (prompts/expand.txt, prompts/html_transform.txt) or a different model.
+    The run is resumed in the mode it was processed in: steps before the
+    first stale one are reused from the run directory, the rest run again
+    and the pages are uploaded again.
+    
+    Args:
+        client_id: Only check this client (default: every UPLOADED lead)
+        dry_run: Only list the stale leads
+        
+    Returns:
+        Summary dict with counts of checked, stale, succeeded, failed
+    """
+    if client_id:
+        lead = fetch_lead_by_id(client_id)
+        leads = [lead] if lead else []
+    else:
+        leads = get_leads_by_status(STATUS_UPLOADED)
+    
+    stale = []
+    for lead in leads:
+        run_dir = latest_run_dir(lead["id"])
+        manifest = RunManifest(run_dir) if run_dir is not None else None
+        if manifest is None or not manifest.data["steps"]:
+            # e.g. processed before run manifests were kept
+            print(f"   ⚠️ {lead['id']}: no run manifest, skipping")
+            continue
+        steps = manifest.stale_steps(lead, step_io)
+        if steps:
+            step, reason = steps[0]
+            print(f"   🔁 {lead['id']}: stale from {step} ({reason})")
+            stale.append((lead, run_dir, run_mode(manifest)))
+    
+    results = {"checked": len(leads), "stale": len(stale), "succeeded": 0, "failed": 0}
+    print(f"\n📋 {len(stale)} of {len(leads)} lead(s) out of date")
+    if dry_run:
+        return results
+    
+    for lead, run_dir, (fused, dag) in stale:
+        print(f"\n📂 Refreshing {lead['id']} from: {run_dir}")
+        if process_client(lead, run_dir, fused=fused, dag=dag):
+            results["succeeded"] += 1
+        else:
+            results["failed"] += 1
+    
+    if stale:
+        print(f"\n✨ Refreshed {results['succeeded']}/{len(stale)} lead(s)")
+    return results
 
 
 def delete_client(client_id: str, reset_status: bool = False) -> bool:
@@ -249,6 +614,10 @@ def main():
         action="store_true",
         help="Preview what would be processed without running"
     )
+    parser.add_argument(
+        "--express", "-e",
+        help="Process a specific client now through the express lane (ahead of the queue)"
+    )
     parser.add_argument(
         "--resume", "-r",
         help="Resume processing for a specific client"
@@ -262,9 +631,49 @@ def main():
         action="store_true",
         help="When used with --delete, also reset client status to FLAGGED"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the LLM response cache and always call the API"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Process all flagged leads with one OpenAI Batch API job per stage"
+    )
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="Expand each block directly into data-ui HTML in a single LLM call"
+    )
+    parser.add_argument(
+        "--dag",
+        action="store_true",
+        help="Move each block through the per-block steps as soon as its inputs are ready"
+    )
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=1,
+        help="Number of flagged leads to process concurrently (default: 1)"
+    )
+    parser.add_argument(
+        "--refresh-stale",
+        action="store_true",
+        help="Re-run the out-of-date steps of uploaded leads after a prompt template or "
+             "model change (limit with --client, list only with --dry-run)"
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and process flagged leads as they appear (stop with SIGTERM)"
+    )
     
     args = parser.parse_args()
     
+    if args.no_cache:
+        set_cache_enabled(False)
+    
     print("\n" + "=" * 60)
     print("🔮 ORAKULUM PIPELINE RUNNER")
     print(f"   Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -274,20 +683,36 @@ def main():
         if args.delete:
             success = delete_client(args.delete, reset_status=args.reset)
             sys.exit(0 if success else 1)
+        elif args.refresh_stale:
+            if not args.dry_run:
+                warm_openai_client()
+            results = refresh_stale(args.client, dry_run=args.dry_run)
+            sys.exit(0 if results["failed"] == 0 else 1)
         elif args.dry_run:
             dry_run()
+        elif args.express:
+            warm_openai_client()
+            success = express_client(args.express, fused=args.fused, dag=args.dag)
+            sys.exit(0 if success else 1)
         elif args.resume:
-            success = resume_client(args.resume)
+            warm_openai_client()
+            success = resume_client(args.resume, fused=args.fused, dag=args.dag)
             sys.exit(0 if success else 1)
+        elif args.daemon:
+            warm_openai_client()
+            run_daemon(fused=args.fused, dag=args.dag, workers=args.workers)
         elif args.client:
             lead = fetch_lead_by_id(args.client)
             if not lead:
                 print(f"❌ Client not found: {args.client}")
                 sys.exit(1)
-            success = process_client(lead)
+            warm_openai_client()
+            success = process_client(lead, fused=args.fused, dag=args.dag)
             sys.exit(0 if success else 1)
         else:
-            results = process_all_flagged()
+            warm_openai_client()
+            results = process_all_flagged(batch=args.batch, fused=args.fused, dag=args.dag,
+                                          workers=args.workers)
             sys.exit(0 if results["failed"] == 0 else 1)
             
     except KeyboardInterrupt: